@@ -5,7 +5,7 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.db.models import Count, Q
 from django.utils import timezone
-from datetime import timedelta
+from django.conf import settings
 
 from .models import Account as User, HealthWorkerProfile
 from .forms import (
@@ -194,85 +194,20 @@ def profile_view(request):
     lambda u: u.is_authenticated and u.is_health_worker, login_url="accounts:login"
 )
 def health_worker_dashboard(request):
-    from appointments.models import Appointment
-    from chat.models import ChatHistory
+    from appointments.stats import get_health_worker_stats
 
     user = request.user
     health_profile = HealthWorkerProfile.objects.filter(user=user).first()
 
-    # Get today's date
-    today = timezone.now().date()
-
-    # Appointment statistics
-    total_appointments = Appointment.objects.filter(healthworker=user).count()
-    pending_appointments = Appointment.objects.filter(
-        healthworker=user, status="pending"
-    ).count()
-    approved_appointments = Appointment.objects.filter(
-        healthworker=user, status="approved"
-    ).count()
-    completed_appointments = Appointment.objects.filter(
-        healthworker=user, status="completed"
-    ).count()
-    cancelled_appointments = Appointment.objects.filter(
-        healthworker=user, status="cancelled"
-    ).count()
-
-    # Today's appointments
-    todays_appointments = Appointment.objects.filter(
-        healthworker=user, date=today
-    ).order_by("time")
-
-    # Upcoming appointments (next 7 days)
-    upcoming_appointments = Appointment.objects.filter(
-        healthworker=user,
-        date__gte=today,
-        date__lte=today + timedelta(days=7),
-        status__in=["pending", "approved"],
-    ).order_by("date", "time")[:5]
-
-    # Recent appointments
-    recent_appointments = Appointment.objects.filter(healthworker=user).order_by(
-        "-date", "-time"
-    )[:5]
-
-    # Get total villagers who have appointments with this health worker
-    total_villagers = (
-        Appointment.objects.filter(healthworker=user)
-        .values("villager")
-        .distinct()
-        .count()
-    )
-
-    # Weekly appointment trend (last 7 days)
-    weekly_appointments = []
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        count = Appointment.objects.filter(healthworker=user, date=day).count()
-        weekly_appointments.append({"date": day.strftime("%a"), "count": count})
-
-    # Status distribution for chart
-    status_distribution = {
-        "pending": pending_appointments,
-        "approved": approved_appointments,
-        "completed": completed_appointments,
-        "cancelled": cancelled_appointments,
-    }
+    # Counters, lists and weekly trend: cached per worker, dropped on
+    # appointment writes (see appointments/stats.py)
+    stats = get_health_worker_stats(user.pk)
 
     context = {
         "user": user,
         "health_profile": health_profile,
-        "current_date": today,
-        "total_appointments": total_appointments,
-        "pending_appointments": pending_appointments,
-        "approved_appointments": approved_appointments,
-        "completed_appointments": completed_appointments,
-        "cancelled_appointments": cancelled_appointments,
-        "todays_appointments": todays_appointments,
-        "upcoming_appointments": upcoming_appointments,
-        "recent_appointments": recent_appointments,
-        "total_villagers": total_villagers,
-        "weekly_appointments": weekly_appointments,
-        "status_distribution": status_distribution,
+        "current_date": timezone.localdate(),
+        "triage_poll_ms": int(getattr(settings, "TRIAGE_POLL_SECONDS", 10) * 1000),
+        **stats,
     }
     return render(request, "accounts/health_worker_dashboard.html", context)
@@ -1,7 +1,7 @@
 # from django.contrib import admin
 from django.contrib import admin
 from django import forms
-from .models import Appointment
+from .models import Appointment, TriageCacheEntry
 from accounts.models import Account as User
 
 
@@ -60,4 +60,15 @@ class AppointmentAdmin(admin.ModelAdmin):
     
     def get_readonly_fields(self, request, obj=None):
         # Make token and created_at readonly in both add and change forms
-        return self.readonly_fields
\ No newline at end of file
+        return self.readonly_fields
+
+
+@admin.register(TriageCacheEntry)
+class TriageCacheEntryAdmin(admin.ModelAdmin):
+    # Editable so a wrong cached triage can be corrected by hand
+    list_display = ('normalized_reason', 'priority', 'hits', 'prompt_version', 'created_at')
+    list_filter = ('priority', 'prompt_version')
+    search_fields = ('normalized_reason',)
+    readonly_fields = ('reason_hash', 'normalized_reason', 'prompt_version', 'hits', 'created_at')
+    exclude = ('embedding',)
+    ordering = ('-hits',)
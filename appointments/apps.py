@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "appointments"
+
+    def ready(self):
+        from . import slots, stats, triage
+
+        # Per-health-worker dashboard cache invalidation
+        stats.connect_signals()
+        # Live triage queues
+        triage.connect_signals()
+        # Cached slot bitmaps for availability and form validation
+        slots.connect_signals()
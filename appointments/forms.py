@@ -2,10 +2,7 @@ from django import forms
 from django.utils import timezone
 from datetime import datetime, date, time, timedelta
 from .models import Appointment
-
-# Generate 30-minute time slots from 9:00 AM to 5:00 PM
-HEALTH_POST_OPEN = time(9, 0)
-HEALTH_POST_CLOSE = time(17, 0)
+from .slots import HEALTH_POST_CLOSE, HEALTH_POST_OPEN, held_by_other, is_slot_taken
 
 
 def get_time_slot_choices():
@@ -64,6 +61,7 @@ class AppointmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop("user", None)
         super().__init__(*args, **kwargs)
+        self.user = user
         self.fields["healthworker"].required = True
         self.fields["healthworker"].empty_label = "Select a doctor"
         if user:
@@ -109,25 +107,31 @@ class AppointmentForm(forms.ModelForm):
                     "Appointments must be booked at least 1 hour in advance."
                 )
 
-            # Check for conflicting appointments (same health worker, same date, same time)
-            if healthworker:
-                conflict = Appointment.objects.filter(
-                    healthworker=healthworker,
-                    date=appointment_date,
-                    time=appointment_time,
-                    status__in=["pending", "approved"],
+            # Check for conflicting appointments (same health worker, same slot),
+            # against the cached slot bitmap
+            if healthworker and is_slot_taken(
+                healthworker.pk, appointment_date, appointment_time, exclude=self.instance
+            ):
+                hw_name = f"Dr. {healthworker.first_name} {healthworker.last_name}"
+                time_str = appointment_time.strftime("%I:%M %p")
+                # On the field, so the model's unique constraint check skips it
+                self.add_error(
+                    "time",
+                    f"{hw_name} already has an appointment at {time_str} on "
+                    f"{appointment_date.strftime('%b %d, %Y')}. Please choose a different time slot.",
+                )
+            elif (
+                healthworker
+                and self.user
+                and held_by_other(
+                    self.user.pk, healthworker.pk, appointment_date, appointment_time
+                )
+            ):
+                self.add_error(
+                    "time",
+                    "Someone else is booking this time slot right now. "
+                    "Please choose a different time slot.",
                 )
-                # Exclude current instance if editing
-                if self.instance.pk:
-                    conflict = conflict.exclude(pk=self.instance.pk)
-
-                if conflict.exists():
-                    hw_name = f"Dr. {healthworker.first_name} {healthworker.last_name}"
-                    time_str = appointment_time.strftime("%I:%M %p")
-                    raise forms.ValidationError(
-                        f"{hw_name} already has an appointment at {time_str} on "
-                        f"{appointment_date.strftime('%b %d, %Y')}. Please choose a different time slot."
-                    )
 
         return cleaned_data
 
@@ -218,22 +222,16 @@ class AppointmentUpdateForm(forms.ModelForm):
                 )
 
             # Check for conflicting appointments
-            if healthworker:
-                conflict = Appointment.objects.filter(
-                    healthworker=healthworker,
-                    date=appointment_date,
-                    time=appointment_time,
-                    status__in=["pending", "approved"],
+            if healthworker and is_slot_taken(
+                healthworker.pk, appointment_date, appointment_time, exclude=self.instance
+            ):
+                hw_name = f"Dr. {healthworker.first_name} {healthworker.last_name}"
+                time_str = appointment_time.strftime("%I:%M %p")
+                # On the field, so the model's unique constraint check skips it
+                self.add_error(
+                    "time",
+                    f"{hw_name} already has an appointment at {time_str} on "
+                    f"{appointment_date.strftime('%b %d, %Y')}. Please choose a different time slot.",
                 )
-                if self.instance.pk:
-                    conflict = conflict.exclude(pk=self.instance.pk)
-
-                if conflict.exists():
-                    hw_name = f"Dr. {healthworker.first_name} {healthworker.last_name}"
-                    time_str = appointment_time.strftime("%I:%M %p")
-                    raise forms.ValidationError(
-                        f"{hw_name} already has an appointment at {time_str} on "
-                        f"{appointment_date.strftime('%b %d, %Y')}. Please choose a different time slot."
-                    )
 
         return cleaned_data
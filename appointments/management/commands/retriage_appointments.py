@@ -0,0 +1,103 @@
+"""
+Management command to re-run AI triage for open appointments in batches
+Usage: python manage.py retriage_appointments [--batch-size 25] [--dry-run]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.models import Appointment
+from appointments.utils import (
+    classify_priorities_batch,
+    lookup_cached_priority,
+    normalize_reason,
+    store_cached_priority,
+)
+
+
+class Command(BaseCommand):
+    help = 'Re-triage open appointments, packing many reasons into one LLM call'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=25,
+            help='Distinct reasons per LLM call (default: 25)',
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=['pending', 'approved'],
+            help='Statuses to re-triage (repeatable; default: pending)',
+        )
+        parser.add_argument(
+            '--ignore-cache',
+            action='store_true',
+            help='Ask the LLM even when a cached result exists',
+        )
+        parser.add_argument(
+            '--allow-downgrade',
+            action='store_true',
+            help='Allow lowering appointments currently marked critical',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would change without saving',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        appointments = (
+            Appointment.objects.filter(status__in=options['status'] or ['pending'])
+            .only('id', 'reason', 'priority', 'status', 'healthworker_id', 'date', 'time', 'created_at')
+            .order_by('id')
+        )
+
+        # Group by normalized reason so each distinct reason is classified once
+        groups = {}
+        for appointment in appointments.iterator(chunk_size=1000):
+            groups.setdefault(normalize_reason(appointment.reason), []).append(appointment)
+        self.stdout.write(f"   {sum(map(len, groups.values()))} appointments, {len(groups)} distinct reasons")
+
+        priorities, pending = {}, []
+        for normalized, group in groups.items():
+            cached = None if options['ignore_cache'] else lookup_cached_priority(normalized)
+            if cached:
+                priorities[normalized] = cached
+            else:
+                pending.append(normalized)
+
+        llm_calls = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            results = classify_priorities_batch([groups[n][0].reason for n in batch])
+            llm_calls += 1
+            for normalized, priority in zip(batch, results):
+                if priority:
+                    priorities[normalized] = priority
+                    if not options['dry_run']:
+                        store_cached_priority(normalized, priority)
+
+        changed = 0
+        for normalized, priority in priorities.items():
+            for appointment in groups[normalized]:
+                if appointment.priority == priority:
+                    continue
+                if appointment.priority == 'critical' and not options['allow_downgrade']:
+                    continue
+                changed += 1
+                self.stdout.write(f"   #{appointment.pk}: {appointment.priority} → {priority}")
+                if not options['dry_run']:
+                    appointment.priority = priority
+                    # Through save() so the triage queue and rollups follow
+                    appointment.save(update_fields=['priority'])
+
+        unresolved = len(groups) - len(priorities)
+        summary = f"{changed} appointment(s) re-prioritised, {llm_calls} LLM call(s), {unresolved} reason(s) unresolved"
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"[dry run] {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {summary}"))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                models.Case(
+                    models.When(priority="critical", then=models.Value(1)),
+                    models.When(priority="medium", then=models.Value(2)),
+                    default=models.Value(3),
+                    output_field=models.IntegerField(),
+                ),
+                models.F("date"),
+                models.F("time"),
+                name="appt_priority_order_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                models.F("healthworker"),
+                models.Case(
+                    models.When(priority="critical", then=models.Value(1)),
+                    models.When(priority="medium", then=models.Value(2)),
+                    default=models.Value(3),
+                    output_field=models.IntegerField(),
+                ),
+                models.F("date"),
+                models.F("time"),
+                name="appt_hw_priority_order_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0002_appointment_priority_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TriageCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("reason_hash", models.CharField(max_length=64)),
+                ("normalized_reason", models.TextField()),
+                (
+                    "priority",
+                    models.CharField(
+                        choices=[
+                            ("critical", "Critical"),
+                            ("medium", "Medium"),
+                            ("normal", "Normal"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("prompt_version", models.PositiveIntegerField()),
+                ("embedding", models.BinaryField(blank=True, null=True)),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("prompt_version", "reason_hash"),
+                        name="triage_cache_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0003_triagecacheentry"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["status", "date", "time"], name="appt_status_date_time_idx"
+            ),
+        ),
+    ]
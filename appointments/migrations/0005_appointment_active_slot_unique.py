@@ -0,0 +1,50 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_no_double_bookings(apps, schema_editor):
+    """Fail with a readable list instead of a bare IntegrityError."""
+    Appointment = apps.get_model("appointments", "Appointment")
+    duplicates = list(
+        Appointment.objects.filter(
+            status__in=["pending", "approved"], healthworker__isnull=False
+        )
+        .values("healthworker_id", "date", "time")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)[:20]
+    )
+    if duplicates:
+        slots = ", ".join(
+            f"worker {d['healthworker_id']} {d['date']} {d['time']}" for d in duplicates
+        )
+        raise RuntimeError(
+            "Cannot add appt_active_slot_unique: these slots have more than one "
+            f"pending/approved appointment; cancel or move the extras first: {slots}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0004_appointment_status_date_time_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["pending", "approved"])),
+                fields=("healthworker", "date", "time"),
+                name="appt_active_slot_unique",
+                violation_error_message=(
+                    "This health worker already has an appointment in this slot. "
+                    "Please choose a different time slot."
+                ),
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.13 on 2026-10-19 02:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_active_slot_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='needs_triage',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('needs_triage', True)), fields=['created_at'], name='appt_needs_triage_idx'),
+        ),
+    ]
@@ -3,6 +3,17 @@ from django.conf import settings
 import uuid
 
 
+# SQL equivalent of AppointmentPriorityQueue.PRIORITY_VALUES (lower = more
+# urgent). Shared by the list ordering and the indexes below; the planner
+# only uses an expression index when the ORDER BY expression is identical.
+PRIORITY_RANK = models.Case(
+    models.When(priority="critical", then=models.Value(1)),
+    models.When(priority="medium", then=models.Value(2)),
+    default=models.Value(3),
+    output_field=models.IntegerField(),
+)
+
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
@@ -42,11 +53,82 @@ class Appointment(models.Model):
         help_text="Optional: Upload your background health document (PDF, images, etc.)",
     )
     token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    # Booked with a provisional keyword priority that the LLM has not
+    # refined yet (appointments.tasks.refine_pending_priorities sweeps these)
+    needs_triage = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Appointment for {self.villager.username} on {self.date}"
 
     class Meta:
-        # Don't use default ordering - priority queue handles sorting
+        # No default ordering - lists order by PRIORITY_RANK, date, time
         ordering = []
+        indexes = [
+            models.Index(
+                PRIORITY_RANK,
+                models.F("date"),
+                models.F("time"),
+                name="appt_priority_order_idx",
+            ),
+            models.Index(
+                models.F("healthworker"),
+                PRIORITY_RANK,
+                models.F("date"),
+                models.F("time"),
+                name="appt_hw_priority_order_idx",
+            ),
+            # Auto-cancel scans open appointments by date/time
+            models.Index(
+                fields=["status", "date", "time"], name="appt_status_date_time_idx"
+            ),
+            # refine_pending_priorities; only a handful of rows ever match
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(needs_triage=True),
+                name="appt_needs_triage_idx",
+            ),
+        ]
+        constraints = [
+            # One active booking per health worker slot. Enforced by the
+            # database so concurrent bookings cannot both succeed; see
+            # appointments/slots.py for the optimistic insert and holds.
+            models.UniqueConstraint(
+                fields=["healthworker", "date", "time"],
+                condition=models.Q(status__in=["pending", "approved"]),
+                name="appt_active_slot_unique",
+                violation_error_message=(
+                    "This health worker already has an appointment in this slot. "
+                    "Please choose a different time slot."
+                ),
+            ),
+        ]
+
+
+class TriageCacheEntry(models.Model):
+    """
+    Cached LLM triage result for a normalized appointment reason.
+
+    Looked up by exact normalized text first, then by embedding similarity.
+    Entries from an older TRIAGE_PROMPT_VERSION are ignored, so changing
+    the prompt invalidates the cache without deleting rows.
+    """
+
+    reason_hash = models.CharField(max_length=64)
+    normalized_reason = models.TextField()
+    priority = models.CharField(max_length=20, choices=Appointment.PRIORITY_CHOICES)
+    prompt_version = models.PositiveIntegerField()
+    # float32 vector of the normalized reason; null if embeddings were unavailable
+    embedding = models.BinaryField(null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["prompt_version", "reason_hash"], name="triage_cache_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.normalized_reason[:50]} -> {self.priority}"
@@ -0,0 +1,108 @@
+# appointments/no_shows.py
+"""
+Set-based auto-cancel of no-show appointments.
+
+An open (pending/approved) appointment counts as a no-show once its date
+and time are NO_SHOW_GRACE in the past (local time). Each batch is a single
+UPDATE ... WHERE id IN (SELECT ... LIMIT n) ... RETURNING statement,
+served by the (status, date, time) index. The cancellation emails are
+written to the outbox in the same transaction, so a batch either commits
+with its notifications or not at all.
+
+update() bypasses the model signals, so the caches those signals keep
+(triage queues, slot bitmaps, dashboard stats and snapshot, daily rollups) are updated
+here from the returned rows.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rural_health_assistant import metrics, rollups
+from rural_health_assistant.jobs import track_job
+from rural_health_assistant.mailer import queue_emails
+
+from . import slots, stats, triage
+from .models import Appointment
+from .utils import appointment_email_messages
+
+NO_SHOW_GRACE = timedelta(minutes=30)
+OPEN_STATUSES = ("pending", "approved")
+BATCH_SIZE = 500
+
+
+def _cancel_sql():
+    table = Appointment._meta.db_table
+    qn = connection.ops.quote_name
+    id_, status, date, time = (
+        qn(Appointment._meta.get_field(name).column)
+        for name in ("id", "status", "date", "time")
+    )
+    overdue = (
+        f"{status} IN (%s, %s) AND ({date} < %s OR ({date} = %s AND {time} < %s))"
+    )
+    # The outer status check keeps a row that changed since the subquery
+    # read it (e.g. completed meanwhile) from being cancelled
+    return (
+        f"UPDATE {qn(table)} SET {status} = %s "
+        f"WHERE {status} IN (%s, %s) AND {id_} IN ("
+        f"SELECT {id_} FROM {qn(table)} WHERE {overdue} LIMIT %s"
+        f") RETURNING {id_}"
+    )
+
+
+def _cancel_batch(cutoff, batch_size):
+    """Cancel up to `batch_size` overdue appointments; returns their ids."""
+    day = connection.ops.adapt_datefield_value(cutoff.date())
+    moment = connection.ops.adapt_timefield_value(cutoff.time())
+    params = ["cancelled", *OPEN_STATUSES, *OPEN_STATUSES, day, day, moment, batch_size]
+    with connection.cursor() as cursor:
+        cursor.execute(_cancel_sql(), params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _after_cancel(appointments):
+    """Bring the signal-maintained caches in line with a cancelled batch."""
+    by_worker = {}
+    for appointment in appointments:
+        by_worker.setdefault(appointment.healthworker_id, []).append(appointment.pk)
+    for healthworker_id, ids in by_worker.items():
+        triage.remove_appointments(healthworker_id, ids)
+    stats.invalidate_health_worker_stats(*by_worker)
+    slots.invalidate(*{(a.healthworker_id, a.date) for a in appointments})
+    metrics.invalidate_dashboard_snapshot()
+
+
+def cancel_no_show_appointments(now=None, batch_size=BATCH_SIZE):
+    """Cancel every overdue open appointment; returns how many were cancelled."""
+    cutoff = timezone.localtime(now) - NO_SHOW_GRACE
+    total = 0
+
+    with track_job("auto_cancel_appointments") as run:
+        while True:
+            with transaction.atomic():
+                ids = _cancel_batch(cutoff, batch_size)
+                if not ids:
+                    break
+                appointments = list(
+                    Appointment.objects.select_related("villager", "healthworker")
+                    .filter(pk__in=ids)
+                    .order_by()
+                )
+                messages, dirty = [], set()
+                for appointment in appointments:
+                    messages.extend(appointment_email_messages(appointment))
+                    dirty.add(("appointments", timezone.localdate(appointment.created_at)))
+                    dirty.add(("appointments_scheduled", appointment.date))
+                run["emails_queued"] += queue_emails(messages)
+                for metric, day in dirty:
+                    rollups.mark_dirty(metric, day)
+                transaction.on_commit(lambda batch=appointments: _after_cancel(batch))
+
+            total += len(ids)
+            run["rows"] += len(ids)
+            run["batches"] += 1
+            if len(ids) < batch_size:
+                break
+
+    return total
@@ -0,0 +1,292 @@
+# appointments/slots.py
+"""
+Slot availability per health worker and day.
+
+The health post day is SLOTS_PER_DAY half-hour slots between
+HEALTH_POST_OPEN and HEALTH_POST_CLOSE. A worker's bookings for one day are
+kept as an integer bitmap (bit i set = slot i taken by a pending/approved
+appointment), cached under slots:<worker>:<date>. Any appointment write
+drops the bitmaps of the (worker, day) pairs it touched, before and after
+the change; a bulk read fetches every cached bitmap with one get_many and
+fills all the misses with one query.
+
+Bitmaps are a read-side cache for the booking UI and form validation;
+the database remains the final word on conflicts: the
+appt_active_slot_unique constraint allows one pending/approved booking per
+(worker, date, time), and save_reserving_slot() turns a lost race into
+SlotUnavailable instead of an error page.
+
+While a villager fills in the form, the chosen slot can be held for
+SLOT_HOLD_SECONDS (hold_slot). A hold is a cache.add() on the slot key, so
+it is atomic without touching the database. Holds are not part of the
+bitmaps, so the availability views still list a held slot; what a hold
+does is make the booking form (held_by_other) and other hold requests
+reject that slot for everyone else until it is released or expires. Holds
+need a shared cache (Redis) to be visible across processes.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from .models import Appointment
+
+HEALTH_POST_OPEN = time(9, 0)
+HEALTH_POST_CLOSE = time(17, 0)
+SLOT_MINUTES = 30
+BLOCKING_STATUSES = ("pending", "approved")
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute
+
+
+SLOTS_PER_DAY = (
+    _minutes(HEALTH_POST_CLOSE) - _minutes(HEALTH_POST_OPEN)
+) // SLOT_MINUTES
+SLOT_TIMES = [
+    (datetime.combine(date.min, HEALTH_POST_OPEN) + timedelta(minutes=SLOT_MINUTES * i)).time()
+    for i in range(SLOTS_PER_DAY)
+]
+SLOT_LABELS = [t.strftime("%H:%M") for t in SLOT_TIMES]
+
+
+def slot_index(t):
+    """Index of the slot containing time `t`, or None outside opening hours."""
+    offset = _minutes(t) - _minutes(HEALTH_POST_OPEN)
+    if offset < 0 or t >= HEALTH_POST_CLOSE:
+        return None
+    return offset // SLOT_MINUTES
+
+
+def _cache_key(healthworker_id, day):
+    return f"slots:{healthworker_id}:{day}"
+
+
+def _compute(healthworker_ids, start, end):
+    """{(worker, day): bitmap} for every pair in the range, from one query."""
+    bitmaps = {
+        (hw, start + timedelta(days=n)): 0
+        for hw in healthworker_ids
+        for n in range((end - start).days + 1)
+    }
+    rows = Appointment.objects.filter(
+        healthworker_id__in=healthworker_ids,
+        date__gte=start,
+        date__lte=end,
+        status__in=BLOCKING_STATUSES,
+    ).values_list("healthworker_id", "date", "time")
+    for hw, day, t in rows:
+        index = slot_index(t)
+        if index is not None and (hw, day) in bitmaps:
+            bitmaps[(hw, day)] |= 1 << index
+    return bitmaps
+
+
+def get_bitmaps(healthworker_ids, start, days=1):
+    """{(worker, day): bitmap} for `days` days from `start`, cached."""
+    healthworker_ids = list(healthworker_ids)
+    pairs = [
+        (hw, start + timedelta(days=n)) for hw in healthworker_ids for n in range(days)
+    ]
+    keys = {_cache_key(*pair): pair for pair in pairs}
+    cached = cache.get_many(keys)
+    bitmaps = {keys[key]: value for key, value in cached.items()}
+
+    missing = [pair for pair in pairs if pair not in bitmaps]
+    if missing:
+        computed = _compute(
+            sorted({hw for hw, _ in missing}),
+            min(day for _, day in missing),
+            max(day for _, day in missing),
+        )
+        fresh = {pair: computed[pair] for pair in missing}
+        cache.set_many(
+            {_cache_key(*pair): value for pair, value in fresh.items()},
+            getattr(settings, "SLOT_CACHE_TTL", 300),
+        )
+        bitmaps.update(fresh)
+    return bitmaps
+
+
+def get_bitmap(healthworker_id, day):
+    return get_bitmaps([healthworker_id], day)[(healthworker_id, day)]
+
+
+def past_slots_mask(day, now=None):
+    """
+    Bits of today's slots that have already started. They no longer block
+    (an appointment whose time is over frees the slot), matching the rules
+    of the available_slots endpoint.
+    """
+    now = timezone.localtime(now)
+    if day != now.date():
+        return 0
+    current = now.time().replace(second=0, microsecond=0)
+    mask = 0
+    for index, slot in enumerate(SLOT_TIMES):
+        if slot < current:
+            mask |= 1 << index
+    return mask
+
+
+def unavailable_labels(bitmap):
+    return [label for i, label in enumerate(SLOT_LABELS) if bitmap >> i & 1]
+
+
+def is_slot_taken(healthworker_id, day, t, exclude=None):
+    """
+    True if another open appointment holds the slot of `t`. `exclude` is
+    an appointment being edited: its own booking does not count.
+    """
+    index = slot_index(t)
+    if index is None:
+        return False
+    if not get_bitmap(healthworker_id, day) >> index & 1:
+        return False
+    if exclude is not None and exclude.pk:
+        own = getattr(exclude, "_slot_state", None)
+        if own == (healthworker_id, day, index, True):
+            # Our own booking sets the bit; confirm another one does too
+            return (
+                Appointment.objects.filter(
+                    healthworker_id=healthworker_id,
+                    date=day,
+                    time=t,
+                    status__in=BLOCKING_STATUSES,
+                )
+                .exclude(pk=exclude.pk)
+                .exists()
+            )
+    return True
+
+
+class SlotUnavailable(Exception):
+    """The slot was taken by a concurrent booking."""
+
+
+def save_reserving_slot(appointment, **save_kwargs):
+    """
+    Save `appointment` and claim its slot in one step (insert-and-catch).
+
+    No lock is taken: the unique constraint decides which of two
+    concurrent bookings wins, and the loser gets SlotUnavailable.
+    """
+    try:
+        # Savepoint, so a failed insert leaves an outer transaction usable
+        with transaction.atomic():
+            appointment.save(**save_kwargs)
+    except IntegrityError as e:
+        raise SlotUnavailable(str(e)) from e
+
+
+# ---------------------------------------------------------------------------
+# Slot holds
+# ---------------------------------------------------------------------------
+
+
+def _hold_key(healthworker_id, day, t):
+    return f"slot_hold:{healthworker_id}:{day}:{t.strftime('%H:%M')}"
+
+
+def _user_hold_key(user_id):
+    return f"slot_hold_user:{user_id}"
+
+
+def hold_seconds():
+    return getattr(settings, "SLOT_HOLD_SECONDS", 300)
+
+
+def hold_slot(user_id, healthworker_id, day, t):
+    """
+    Hold a slot for `user_id`. Returns False if someone else holds it.
+
+    While held, other users' hold requests and booking forms are refused
+    for that slot. A user holds at most one slot: taking a new one releases
+    the previous. Holding the same slot again extends the hold.
+    """
+    key = _hold_key(healthworker_id, day, t)
+    if not cache.add(key, user_id, hold_seconds()):
+        if cache.get(key) != user_id:
+            return False
+        cache.touch(key, hold_seconds())
+    previous = cache.get(_user_hold_key(user_id))
+    if previous and previous != key:
+        _release(previous, user_id)
+    cache.set(_user_hold_key(user_id), key, hold_seconds())
+    return True
+
+
+def _release(key, user_id):
+    if cache.get(key) == user_id:
+        cache.delete(key)
+
+
+def release_hold(user_id):
+    """Release whatever slot `user_id` is holding."""
+    key = cache.get(_user_hold_key(user_id))
+    if key:
+        _release(key, user_id)
+        cache.delete(_user_hold_key(user_id))
+
+
+def held_by_other(user_id, healthworker_id, day, t):
+    holder = cache.get(_hold_key(healthworker_id, day, t))
+    return holder is not None and holder != user_id
+
+
+def invalidate(*pairs):
+    cache.delete_many(
+        [_cache_key(hw, day) for hw, day in set(pairs) if hw is not None and day]
+    )
+
+
+# ---------------------------------------------------------------------------
+# Signals
+# ---------------------------------------------------------------------------
+
+
+def _state(instance):
+    # Read from __dict__ so deferred fields are never fetched
+    values = instance.__dict__
+    if not {"healthworker_id", "date", "time", "status"} <= values.keys():
+        return None
+    t = values["time"]
+    return (
+        values["healthworker_id"],
+        values["date"],
+        slot_index(t) if isinstance(t, time) else None,
+        values["status"] in BLOCKING_STATUSES,
+    )
+
+
+def remember_slot(sender, instance, **kwargs):
+    instance._slot_state = _state(instance)
+
+
+def invalidate_on_write(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_slot_state", None)
+    current = _state(instance)
+    instance._slot_state = current
+    if previous == current and not created and kwargs.get("signal") is post_save:
+        # e.g. a priority or note change
+        return
+    pairs = [state[:2] for state in (previous, current) if state]
+    if not pairs and instance.healthworker_id:
+        pairs = [(instance.healthworker_id, instance.date)]
+    transaction.on_commit(lambda: invalidate(*pairs))
+
+
+def connect_signals():
+    post_init.connect(remember_slot, sender=Appointment, dispatch_uid="slots_init")
+    post_save.connect(
+        invalidate_on_write, sender=Appointment, dispatch_uid="slots_save"
+    )
+    post_delete.connect(
+        invalidate_on_write, sender=Appointment, dispatch_uid="slots_delete"
+    )
@@ -0,0 +1,127 @@
+# appointments/stats.py
+"""
+Per-health-worker dashboard stats.
+
+All counters come from one conditional aggregate over the worker's
+appointments, today's and upcoming lists from one query over the next
+seven days, and the weekly trend from the daily rollups. The result is
+cached per worker (and per day, so "today" rolls over on its own) and
+dropped whenever one of the worker's appointments is written.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from .models import Appointment
+
+UPCOMING_DAYS = 7
+LIST_LIMIT = 5
+
+
+def _cache_key(healthworker_id, day):
+    return f"hw_stats:{healthworker_id}:{day.isoformat()}"
+
+
+def compute_health_worker_stats(healthworker_id):
+    from rural_health_assistant.rollups import get_trends
+
+    today = timezone.localdate()
+    appointments = Appointment.objects.filter(healthworker_id=healthworker_id)
+
+    counts = appointments.aggregate(
+        total=Count("id"),
+        pending=Count("id", filter=Q(status="pending")),
+        approved=Count("id", filter=Q(status="approved")),
+        completed=Count("id", filter=Q(status="completed")),
+        cancelled=Count("id", filter=Q(status="cancelled")),
+        villagers=Count("villager", distinct=True),
+    )
+
+    # Today's list and the upcoming list share one bounded query
+    this_week = list(
+        appointments.filter(
+            date__gte=today, date__lte=today + timedelta(days=UPCOMING_DAYS)
+        )
+        .select_related("villager")
+        .order_by("date", "time")
+    )
+    todays_appointments = [a for a in this_week if a.date == today]
+    upcoming_appointments = [
+        a for a in this_week if a.status in ("pending", "approved")
+    ][:LIST_LIMIT]
+
+    recent_appointments = list(
+        appointments.select_related("villager").order_by("-date", "-time")[
+            :LIST_LIMIT
+        ]
+    )
+
+    weekly_appointments = get_trends(
+        ["appointments_scheduled"], 7, "healthworker", healthworker_id, date_format="%a"
+    )["appointments_scheduled"]
+
+    return {
+        "total_appointments": counts["total"],
+        "pending_appointments": counts["pending"],
+        "approved_appointments": counts["approved"],
+        "completed_appointments": counts["completed"],
+        "cancelled_appointments": counts["cancelled"],
+        "todays_appointments": todays_appointments,
+        "upcoming_appointments": upcoming_appointments,
+        "recent_appointments": recent_appointments,
+        "total_villagers": counts["villagers"],
+        "weekly_appointments": weekly_appointments,
+        "status_distribution": {
+            "pending": counts["pending"],
+            "approved": counts["approved"],
+            "completed": counts["completed"],
+            "cancelled": counts["cancelled"],
+        },
+    }
+
+
+def get_health_worker_stats(healthworker_id):
+    """Return the cached stats for a health worker, computing them on a miss."""
+    key = _cache_key(healthworker_id, timezone.localdate())
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_health_worker_stats(healthworker_id)
+        cache.set(key, stats, getattr(settings, "DASHBOARD_CACHE_TTL", 60))
+    return stats
+
+
+def invalidate_health_worker_stats(*healthworker_ids):
+    today = timezone.localdate()
+    cache.delete_many(
+        [_cache_key(pk, today) for pk in set(healthworker_ids) if pk is not None]
+    )
+
+
+def remember_healthworker(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred field is never fetched
+    instance._stats_healthworker_id = instance.__dict__.get("healthworker_id")
+
+
+def invalidate_on_write(sender, instance, **kwargs):
+    # Covers reassignment: both the previous and the new worker are dropped
+    invalidate_health_worker_stats(
+        getattr(instance, "_stats_healthworker_id", None),
+        instance.healthworker_id,
+    )
+    instance._stats_healthworker_id = instance.healthworker_id
+
+
+def connect_signals():
+    post_init.connect(
+        remember_healthworker, sender=Appointment, dispatch_uid="hw_stats_init"
+    )
+    post_save.connect(
+        invalidate_on_write, sender=Appointment, dispatch_uid="hw_stats_save"
+    )
+    post_delete.connect(
+        invalidate_on_write, sender=Appointment, dispatch_uid="hw_stats_delete"
+    )
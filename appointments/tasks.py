@@ -1,7 +1,63 @@
+from datetime import timedelta
+
 from celery import shared_task
-from .views import auto_cancel_no_show_appointments
+from django.conf import settings
+from django.utils import timezone
+
+from .no_shows import cancel_no_show_appointments
+from .models import Appointment
+from .utils import classify_appointment_priority
 
 @shared_task
 def auto_cancel_appointments():
-    count = auto_cancel_no_show_appointments()
+    count = cancel_no_show_appointments()
     return f"Cancelled {count} appointments"
+
+
+@shared_task
+def refine_appointment_priority(appointment_id):
+    """
+    Replace the provisional keyword priority with the LLM classification.
+
+    Saved through the model so the triage queue and rollups follow. A
+    keyword "critical" is never downgraded: missing an emergency costs more
+    than an extra urgent slot.
+    """
+    appointment = Appointment.objects.filter(pk=appointment_id).first()
+    if appointment is None:
+        return "Skipped"
+    if appointment.status not in ("pending", "approved"):
+        Appointment.objects.filter(pk=appointment_id).update(needs_triage=False)
+        return "Skipped"
+
+    priority = classify_appointment_priority(
+        appointment.reason, default=appointment.priority
+    )
+    appointment.needs_triage = False
+    if appointment.priority == "critical" or priority == appointment.priority:
+        appointment.save(update_fields=["needs_triage"])
+        return f"Priority unchanged ({appointment.priority})"
+
+    appointment.priority = priority
+    appointment.save(update_fields=["priority", "needs_triage"])
+    return f"Priority set to {priority}"
+
+
+@shared_task
+def refine_pending_priorities(limit=100):
+    """
+    Refine bookings whose refine_appointment_priority task was never queued
+    (broker down at booking time). Waits TRIAGE_SWEEP_AFTER_SECONDS so it
+    does not race the queued tasks.
+    """
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, "TRIAGE_SWEEP_AFTER_SECONDS", 120)
+    )
+    pks = list(
+        Appointment.objects.filter(needs_triage=True, created_at__lt=cutoff)
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:limit]
+    )
+    for pk in pks:
+        refine_appointment_priority(pk)
+    return f"Refined {len(pks)} appointments"
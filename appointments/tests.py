@@ -1,3 +1,936 @@
-from django.test import TestCase
+import random
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account, HealthWorkerProfile
+from custom_admin.models import DailyMetric, JobRun, OutboundEmail
+
+from . import slots, tasks, triage
+from .forms import AppointmentUpdateForm
+from .models import Appointment, TriageCacheEntry
+from .no_shows import cancel_no_show_appointments
+from .stats import get_health_worker_stats
+from .utils import (
+    AppointmentPriorityQueue,
+    classify_appointment_priority,
+    keyword_triage,
+    lookup_cached_priority,
+    normalize_reason,
+    order_by_priority,
+)
+
+
+class HealthWorkerStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+        cls.other_worker = Account.objects.create_user(
+            "Hari", "KC", "hari", "hari@example.com", "pw", "3", role="health_worker"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _book(self, days=0, status="pending", healthworker=None, hour=10):
+        return Appointment.objects.create(
+            villager=self.villager,
+            healthworker=healthworker or self.worker,
+            date=timezone.localdate() + timedelta(days=days),
+            time=time(hour, 0),
+            reason="checkup",
+            status=status,
+        )
+
+    def test_stats_values(self):
+        self._book()
+        self._book(days=2, status="approved")
+        self._book(days=-1, status="completed")
+        self._book(days=3, status="cancelled")
+
+        stats = get_health_worker_stats(self.worker.pk)
+        self.assertEqual(stats["total_appointments"], 4)
+        self.assertEqual(stats["status_distribution"]["completed"], 1)
+        self.assertEqual(stats["total_villagers"], 1)
+        self.assertEqual(len(stats["todays_appointments"]), 1)
+        self.assertEqual(len(stats["upcoming_appointments"]), 2)
+        self.assertEqual(stats["recent_appointments"][0].status, "cancelled")
+        self.assertEqual(stats["weekly_appointments"][-1]["count"], 1)
+        self.assertEqual(stats["weekly_appointments"][-2]["count"], 1)
+
+    def test_cached_until_appointment_write(self):
+        appointment = self._book()
+        get_health_worker_stats(self.worker.pk)
+        with self.assertNumQueries(0):
+            get_health_worker_stats(self.worker.pk)
+
+        appointment.status = "approved"
+        appointment.save()
+        stats = get_health_worker_stats(self.worker.pk)
+        self.assertEqual(stats["approved_appointments"], 1)
+
+    def test_reassignment_invalidates_both_workers(self):
+        appointment = self._book()
+        get_health_worker_stats(self.worker.pk)
+        get_health_worker_stats(self.other_worker.pk)
+
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.healthworker = self.other_worker
+        appointment.save()
+
+        self.assertEqual(get_health_worker_stats(self.worker.pk)["total_appointments"], 0)
+        self.assertEqual(
+            get_health_worker_stats(self.other_worker.pk)["total_appointments"], 1
+        )
+
+    def test_dashboard_query_count_is_constant(self):
+        self.client.force_login(self.worker)
+        url = reverse("accounts:health_worker_dashboard")
+
+        self._book()
+        with self.assertNumQueries(7):  # session, user, profile + 4 stats queries
+            self.client.get(url)
+
+        for days in range(-20, 7):
+            self._book(days=days, hour=11)
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+        self.assertEqual(response.context["total_appointments"], 28)
+
+        with self.assertNumQueries(3):  # warm cache: session, user, profile
+            self.client.get(url)
+
+
+class AppointmentListOrderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+        today = timezone.localdate()
+        priorities = ["normal", "critical", "medium"]
+        statuses = ["pending", "approved", "completed", "cancelled"]
+        Appointment.objects.bulk_create(
+            Appointment(
+                villager=cls.villager,
+                healthworker=cls.worker,
+                date=today + timedelta(days=i % 9 - 4),
+                time=time(9 + i % 8, 0),
+                reason="checkup",
+                priority=priorities[i % 3],
+                status=statuses[i % 4],
+            )
+            for i in range(45)
+        )
+
+    def test_sql_order_matches_priority_queue(self):
+        expected = AppointmentPriorityQueue(Appointment.objects.all())
+        self.assertEqual(
+            [a.pk for a in order_by_priority(Appointment.objects.all())],
+            [a.pk for a in expected.get_sorted_appointments()],
+        )
+
+    def test_list_is_paginated_with_constant_queries(self):
+        self.client.force_login(self.worker)
+        url = reverse("appointments:list")
+
+        # session, user, counts aggregate, page rows
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        page = response.context["page_obj"]
+        self.assertEqual(len(page.object_list), 20)
+        self.assertEqual(page.paginator.count, 45)
+        self.assertEqual(response.context["critical_count"], 15)
+        self.assertEqual(response.context["cancelled_count"], 11)
+        self.assertEqual(page.object_list[0].priority, "critical")
+
+        response = self.client.get(url, {"page": 3, "priority": "normal"})
+        self.assertEqual(response.context["total_count"], 15)
+        self.assertEqual(response.context["page_obj"].number, 1)
+
+
+class IndexedHeapTests(TestCase):
+    def test_matches_sorted_reference_under_random_updates(self):
+        rng = random.Random(7)
+        heap, reference = triage.IndexedHeap(), {}
+        for _ in range(2000):
+            key = rng.randrange(200)
+            if rng.random() < 0.3:
+                heap.remove(key)
+                reference.pop(key, None)
+            else:
+                score = rng.randrange(1000)
+                heap.push(key, score)
+                reference[key] = score
+        expected = [k for _, k in sorted((v, k) for k, v in reference.items())]
+        self.assertEqual(len(heap), len(reference))
+        self.assertEqual(heap.top(10), expected[:10])
+        self.assertEqual(heap.top(len(reference) + 5), expected)
+        self.assertEqual(heap.peek(), expected[0])
+
+
+@override_settings(TRIAGE_REDIS_URL=None, TRIAGE_BACKEND="local")
+class TriageQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+        cls.other_worker = Account.objects.create_user(
+            "Hari", "KC", "hari", "hari@example.com", "pw", "3", role="health_worker"
+        )
+
+    def setUp(self):
+        cache.clear()
+        triage.reset_backend()
+
+    def _book(self, priority="normal", days=1, hour=10):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                villager=self.villager,
+                healthworker=self.worker,
+                date=timezone.localdate() + timedelta(days=days),
+                time=time(hour, 0),
+                reason="checkup",
+                priority=priority,
+            )
+
+    def _queue(self, healthworker=None):
+        worker = healthworker or self.worker
+        return [a.pk for a in triage.top_appointments(worker.pk, 10)]
+
+    def test_loads_from_db_then_tracks_writes(self):
+        later = self._book(days=2)
+        sooner = self._book(days=1)
+        self.assertEqual(self._queue(), [sooner.pk, later.pk])
+
+        critical = self._book(priority="critical", days=5)
+        self.assertEqual(self._queue(), [critical.pk, sooner.pk, later.pk])
+        self.assertEqual(triage.next_patient(self.worker.pk), critical)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            critical.status = "completed"
+            critical.save()
+        self.assertEqual(self._queue(), [sooner.pk, later.pk])
+
+    def test_reassignment_and_delete(self):
+        appointment = self._book()
+        self.assertEqual(self._queue(), [appointment.pk])
+        self.assertEqual(self._queue(self.other_worker), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.healthworker = self.other_worker
+            appointment.save()
+        self.assertEqual(self._queue(), [])
+        self.assertEqual(self._queue(self.other_worker), [appointment.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        self.assertEqual(self._queue(self.other_worker), [])
+
+    def test_reads_do_not_rescan_appointments(self):
+        for hour in range(8, 16):
+            self._book(hour=hour)
+        self._queue()  # first read loads the queue
+        with self.assertNumQueries(1):  # only the in_bulk fetch of the top-N
+            triage.top_appointments(self.worker.pk, 3)
+
+    def test_endpoints(self):
+        first = self._book(priority="medium")
+        self.client.force_login(self.worker)
+
+        data = self.client.get(reverse("appointments:triage_queue")).json()
+        self.assertEqual([a["id"] for a in data["appointments"]], [first.pk])
+        self.assertEqual(data["size"], 1)
+
+        critical = self._book(priority="critical", hour=11)
+        data = self.client.get(reverse("appointments:triage_next")).json()
+        self.assertEqual(data["next"]["id"], critical.pk)
+
+    def test_polling_skips_the_queue_while_the_version_is_unchanged(self):
+        first = self._book()
+        self.client.force_login(self.worker)
+        url = reverse("appointments:triage_queue")
+
+        data = self.client.get(url).json()
+        self.assertTrue(data["changed"])
+        with self.assertNumQueries(2):  # session and user only
+            unchanged = self.client.get(url, {"version": data["version"]}).json()
+        self.assertEqual(unchanged, {"version": data["version"], "changed": False})
+
+        critical = self._book(priority="critical", hour=11)
+        data = self.client.get(url, {"version": data["version"]}).json()
+        self.assertTrue(data["changed"])
+        self.assertEqual([a["id"] for a in data["appointments"]], [critical.pk, first.pk])
+
+    def test_booking_during_the_initial_load_is_kept(self):
+        first = self._book(days=2)
+        backend = triage.get_backend()
+        real_load, booked = backend.load, []
+
+        def load(*args, **kwargs):
+            booked.append(self._book(days=1))  # commits after the database read
+            real_load(*args, **kwargs)
+
+        with mock.patch.object(backend, "load", load):
+            triage.ensure_loaded(self.worker.pk)
+        self.assertEqual(self._queue(), [booked[0].pk, first.pk])
+
+    def test_appointment_closed_during_the_initial_load_is_dropped(self):
+        appointment = self._book()
+        backend = triage.get_backend()
+        real_load = backend.load
+
+        def load(*args, **kwargs):
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.status = "completed"
+                appointment.save()
+            real_load(*args, **kwargs)
+
+        with mock.patch.object(backend, "load", load):
+            triage.ensure_loaded(self.worker.pk)
+        self.assertEqual(triage.queue_size(self.worker.pk), 1)  # stale until read
+        self.assertEqual(self._queue(), [])
+        self.assertEqual(triage.queue_size(self.worker.pk), 0)
+
+
+@override_settings(TRIAGE_REDIS_URL=None, TRIAGE_BACKEND="")
+class DatabaseTriageBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+
+    def setUp(self):
+        cache.clear()
+        triage.reset_backend()
+        self.addCleanup(triage.reset_backend)
+
+    def test_default_without_redis_sees_writes_from_other_processes(self):
+        self.assertIsInstance(triage.get_backend(), triage.DatabaseTriageBackend)
+        self.assertFalse(triage.versions_shared())
+        # bulk_create sends no signals, like a booking made by another process
+        routine, critical = Appointment.objects.bulk_create(
+            [
+                Appointment(
+                    villager=self.villager,
+                    healthworker=self.worker,
+                    date=timezone.localdate() + timedelta(days=1),
+                    time=time(hour, 0),
+                    reason="checkup",
+                    priority=priority,
+                )
+                for hour, priority in ((9, "normal"), (10, "critical"))
+            ]
+        )
+        self.assertEqual(
+            [a.pk for a in triage.top_appointments(self.worker.pk)],
+            [critical.pk, routine.pk],
+        )
+        self.assertEqual(triage.queue_size(self.worker.pk), 2)
+
+        self.client.force_login(self.worker)
+        version = triage.get_version(self.worker.pk)
+        data = self.client.get(
+            reverse("appointments:triage_queue"), {"version": version}
+        ).json()
+        self.assertTrue(data["changed"])  # versions are per process here
+
+    @override_settings(TRIAGE_BACKEND="redis")
+    def test_redis_backend_needs_a_url(self):
+        with self.assertRaises(ImproperlyConfigured):
+            triage.get_backend()
+
+
+@override_settings(TRIAGE_REDIS_URL=None)
+class AsyncTriageBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+        HealthWorkerProfile.objects.create(user=cls.worker, specialization="GP")
+
+    def setUp(self):
+        cache.clear()
+        triage.reset_backend()
+
+    def test_keyword_triage(self):
+        self.assertEqual(keyword_triage("Sudden CHEST pain since morning"), "critical")
+        self.assertEqual(keyword_triage("fever for 3 days"), "medium")
+        self.assertEqual(keyword_triage("routine checkup"), "normal")
+
+    def test_keyword_triage_in_nepali(self):
+        self.assertEqual(keyword_triage("बिहानदेखि छाती दुखेको छ"), "critical")
+        self.assertEqual(keyword_triage("सास फेर्न गाह्रो भयो"), "critical")
+        self.assertEqual(keyword_triage("सर्पले टोकेको"), "critical")
+        self.assertEqual(keyword_triage("तीन दिनदेखि ज्वरो आएको"), "medium")
+        self.assertEqual(keyword_triage("बच्चालाई पखाला लागेको"), "medium")
+        self.assertEqual(keyword_triage("नियमित जाँच"), "normal")
+
+    def _book(self, reason="High fever and cough"):
+        return self.client.post(
+            reverse("appointments:create"),
+            {
+                "date": (timezone.localdate() + timedelta(days=2)).isoformat(),
+                "time": "10:00",
+                "reason": reason,
+                "healthworker": self.worker.pk,
+                "priority": "normal",
+            },
+        )
+
+    @mock.patch("rural_health_assistant.mailer.kick")
+    @mock.patch("appointments.utils.get_triage_llm")
+    def test_booking_defers_llm_and_queues_email(self, get_llm, kick):
+        self.client.force_login(self.villager)
+        with mock.patch.object(
+            tasks.refine_appointment_priority, "delay"
+        ) as refine, self.captureOnCommitCallbacks(execute=True):
+            response = self._book()
+
+        self.assertRedirects(response, reverse("appointments:list"))
+        appointment = Appointment.objects.get()
+        self.assertEqual(appointment.priority, "medium")
+        self.assertTrue(appointment.needs_triage)
+        get_llm.assert_not_called()
+        refine.assert_called_once_with(appointment.pk)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    @mock.patch("rural_health_assistant.mailer.kick")
+    def test_broker_outage_leaves_refinement_to_the_sweep(self, kick):
+        self.client.force_login(self.villager)
+        with mock.patch.object(
+            tasks.refine_appointment_priority, "delay", side_effect=ConnectionError
+        ), mock.patch.object(
+            tasks, "classify_appointment_priority"
+        ) as classify, mock.patch(
+            "appointments.views.logger"
+        ) as logger, self.captureOnCommitCallbacks(execute=True):
+            response = self._book()
+        self.assertRedirects(response, reverse("appointments:list"))
+        classify.assert_not_called()
+        logger.warning.assert_called_once()
+        appointment = Appointment.objects.get()
+        self.assertEqual((appointment.priority, appointment.needs_triage), ("medium", True))
+
+        with mock.patch.object(
+            tasks, "classify_appointment_priority", return_value="critical"
+        ) as classify:
+            tasks.refine_pending_priorities()  # too recent: the queued task may still run
+            classify.assert_not_called()
+            Appointment.objects.filter(pk=appointment.pk).update(
+                created_at=timezone.now() - timedelta(minutes=5)
+            )
+            self.assertEqual(tasks.refine_pending_priorities(), "Refined 1 appointments")
+            self.assertEqual(tasks.refine_pending_priorities(), "Refined 0 appointments")
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.priority, appointment.needs_triage), ("critical", False))
+
+    def test_refinement_updates_priority_and_queue(self):
+        appointment = Appointment.objects.create(
+            villager=self.villager,
+            healthworker=self.worker,
+            date=timezone.localdate() + timedelta(days=1),
+            time=time(10, 0),
+            reason="feeling unwell",
+        )
+        routine = Appointment.objects.create(
+            villager=self.villager,
+            healthworker=self.worker,
+            date=timezone.localdate(),
+            time=time(9, 0),
+            reason="routine checkup",
+        )
+        triage.top_appointments(self.worker.pk)  # load the queue
+
+        with mock.patch.object(
+            tasks, "classify_appointment_priority", return_value="critical"
+        ), self.captureOnCommitCallbacks(execute=True):
+            tasks.refine_appointment_priority(appointment.pk)
+
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.priority, "critical")
+        self.assertEqual(
+            [a.pk for a in triage.top_appointments(self.worker.pk)],
+            [appointment.pk, routine.pk],
+        )
+
+    def test_refinement_never_downgrades_keyword_critical(self):
+        appointment = Appointment.objects.create(
+            villager=self.villager,
+            healthworker=self.worker,
+            date=timezone.localdate() + timedelta(days=1),
+            time=time(10, 0),
+            reason="snake bite on leg",
+            priority="critical",
+        )
+        with mock.patch.object(
+            tasks, "classify_appointment_priority", return_value="normal"
+        ):
+            tasks.refine_appointment_priority(appointment.pk)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.priority, "critical")
+
+
+class _FakeLLM:
+    """Stands in for the Gemini client; records every prompt it receives."""
+
+    def __init__(self, answer="medium"):
+        self.answer = answer
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if isinstance(prompt, str) and "Appointment Reasons:" in prompt:
+            from .utils import _TriageBatch, _TriageResult
+
+            count = prompt.split("**Appointment Reasons:**")[1].count("\n") - 3
+            return _TriageBatch(
+                results=[_TriageResult(id=i, priority=self.answer) for i in range(1, count + 1)]
+            )
+        return mock.Mock(content=self.answer)
+
+    def with_structured_output(self, schema):
+        return self
+
+
+@override_settings(TRIAGE_REDIS_URL=None, TRIAGE_CACHE_SIMILARITY=0)
+class TriageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+
+    def setUp(self):
+        triage.reset_backend()
+
+    def test_normalize_reason(self):
+        self.assertEqual(normalize_reason("  Fever, 3 days!! "), "fever 3 days")
+
+    def test_repeated_reasons_hit_the_cache(self):
+        llm = _FakeLLM("medium")
+        with mock.patch("appointments.utils.get_triage_llm", return_value=llm):
+            self.assertEqual(classify_appointment_priority("Fever 3 days"), "medium")
+            self.assertEqual(classify_appointment_priority("fever, 3 days."), "medium")
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertEqual(TriageCacheEntry.objects.get().hits, 1)
+
+    def test_similar_critical_reasons_hit_the_cache(self):
+        vectors = {"severe chest pain": [1.0, 0.0], "severe chest pains": [0.99, 0.05]}
+        embeddings = mock.Mock(embed_query=lambda text: vectors.get(text, [0.0, 1.0]))
+        llm = _FakeLLM("critical")
+        with override_settings(TRIAGE_CACHE_SIMILARITY=0.95), mock.patch(
+            "rag_components.vector_store_update.get_embeddings", return_value=embeddings
+        ), mock.patch("appointments.utils.get_triage_llm", return_value=llm):
+            classify_appointment_priority("Severe chest pain")
+            self.assertEqual(classify_appointment_priority("Severe chest-pains"), "critical")
+            classify_appointment_priority("broken arm")
+        self.assertEqual(len(llm.prompts), 2)
+
+    def test_similar_hits_never_lower_the_priority(self):
+        vectors = {"no chest pain": [1.0, 0.0], "chest pain": [0.98, 0.1]}
+        embeddings = mock.Mock(embed_query=lambda text: vectors.get(text, [0.0, 1.0]))
+        with override_settings(TRIAGE_CACHE_SIMILARITY=0.95), mock.patch(
+            "rag_components.vector_store_update.get_embeddings", return_value=embeddings
+        ):
+            with mock.patch(
+                "appointments.utils.get_triage_llm", return_value=_FakeLLM("normal")
+            ):
+                self.assertEqual(classify_appointment_priority("No chest pain"), "normal")
+            llm = _FakeLLM("critical")
+            with mock.patch("appointments.utils.get_triage_llm", return_value=llm):
+                self.assertEqual(classify_appointment_priority("Chest pain"), "critical")
+        self.assertEqual(len(llm.prompts), 1)
+
+    def test_exact_matches_only_skip_the_embeddings(self):
+        with mock.patch("rag_components.vector_store_update.get_embeddings") as get_embeddings:
+            self.assertIsNone(lookup_cached_priority("chest pain"))
+        get_embeddings.assert_not_called()
+
+    def test_retriage_command_batches_distinct_reasons(self):
+        reasons = ["cough"] * 5 + [f"symptom {i}" for i in range(7)]
+        for reason in reasons:
+            Appointment.objects.create(
+                villager=self.villager,
+                date=timezone.localdate(),
+                time=time(10, 0),
+                reason=reason,
+            )
+        llm = _FakeLLM("medium")
+        with mock.patch("appointments.utils.get_triage_llm", return_value=llm):
+            call_command("retriage_appointments", batch_size=5, stdout=StringIO())
+
+        # 8 distinct reasons, 5 per prompt
+        self.assertEqual(len(llm.prompts), 2)
+        self.assertFalse(Appointment.objects.exclude(priority="medium").exists())
+        self.assertEqual(TriageCacheEntry.objects.count(), 8)
+
+        # Second run is served entirely from the cache
+        with mock.patch("appointments.utils.get_triage_llm", return_value=llm):
+            call_command("retriage_appointments", stdout=StringIO())
+        self.assertEqual(len(llm.prompts), 2)
+
+
+@override_settings(TRIAGE_REDIS_URL=None)
+@mock.patch("rural_health_assistant.mailer.kick")
+class NoShowCancelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+
+    def setUp(self):
+        cache.clear()
+        triage.reset_backend()
+        self.today = timezone.localdate()
+
+    def _book(self, days, hour, minute=0, status="pending"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                villager=self.villager,
+                healthworker=self.worker,
+                date=self.today + timedelta(days=days),
+                time=time(hour, minute),
+                reason="checkup",
+                status=status,
+            )
+
+    def _at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.today, time(hour, minute)))
+
+    def test_cancels_only_overdue_open_appointments(self, kick):
+        overdue = [
+            self._book(-1, 18),
+            self._book(-3, 9, status="approved"),
+            self._book(0, 11, 29),
+        ]
+        kept = [
+            self._book(0, 11, 45),
+            self._book(1, 9),
+            self._book(-1, 9, status="completed"),
+        ]
+        self.assertEqual(triage.queue_size(self.worker.pk), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            count = cancel_no_show_appointments(now=self._at(12), batch_size=2)
+
+        self.assertEqual(count, 3)
+        statuses = dict(Appointment.objects.values_list("pk", "status"))
+        self.assertEqual({statuses[a.pk] for a in overdue}, {"cancelled"})
+        self.assertEqual([statuses[a.pk] for a in kept], ["pending", "pending", "completed"])
+
+        # Notifications go to the outbox, not SMTP
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.count(), 6)
+
+        # Caches kept by the (bypassed) signals follow the update
+        self.assertEqual(triage.queue_size(self.worker.pk), 2)
+        self.assertEqual(get_health_worker_stats(self.worker.pk)["cancelled_appointments"], 3)
+        self.assertEqual(
+            DailyMetric.objects.get(
+                metric="appointments", date=self.today, dimension="status", value="cancelled"
+            ).count,
+            3,
+        )
+
+        run = JobRun.objects.get(job="auto_cancel_appointments")
+        self.assertEqual(run.rows, 3)
+        self.assertEqual(run.details, {"batches": 2, "emails_queued": 6})
+
+    def test_grace_period_does_not_wrap_past_midnight(self, kick):
+        morning = self._book(0, 9)
+        cancel_no_show_appointments(now=self._at(0, 10))
+        morning.refresh_from_db()
+        self.assertEqual(morning.status, "pending")
+
+    def test_each_run_is_recorded(self, kick):
+        self.assertEqual(cancel_no_show_appointments(now=self._at(12)), 0)
+        run = JobRun.objects.get()
+        self.assertEqual((run.rows, run.succeeded), (0, True))
+
+
+class SlotAvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.workers = []
+        for i in range(3):
+            worker = Account.objects.create_user(
+                "Doc", str(i), f"doc{i}", f"doc{i}@example.com", "pw", f"2{i}",
+                role="health_worker",
+            )
+            HealthWorkerProfile.objects.create(user=worker, specialization="GP")
+            cls.workers.append(worker)
+        cls.admin = Account.objects.create_user(
+            "Admin", "User", "admin", "admin@example.com", "pw", "9", role="admin"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def _book(self, worker, hour, minute=0, status="pending"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                villager=self.villager,
+                healthworker=worker,
+                date=self.tomorrow,
+                time=time(hour, minute),
+                reason="checkup",
+                status=status,
+            )
+
+    def test_bitmap_layout(self):
+        self.assertEqual(slots.SLOTS_PER_DAY, 16)
+        self.assertEqual(slots.SLOT_LABELS[0], "09:00")
+        self.assertEqual(slots.SLOT_LABELS[-1], "16:30")
+        self.assertEqual(slots.slot_index(time(10, 15)), 2)
+        self.assertIsNone(slots.slot_index(time(17, 0)))
+
+    def test_bitmap_follows_appointment_writes(self):
+        worker = self.workers[0]
+        self.assertEqual(slots.get_bitmap(worker.pk, self.tomorrow), 0)
+
+        appointment = self._book(worker, 9, 30)
+        self._book(worker, 10, status="cancelled")
+        self.assertEqual(slots.get_bitmap(worker.pk, self.tomorrow), 0b10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.time = time(16, 30)
+            appointment.save()
+        self.assertEqual(slots.get_bitmap(worker.pk, self.tomorrow), 1 << 15)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = "cancelled"
+            appointment.save()
+        self.assertEqual(slots.get_bitmap(worker.pk, self.tomorrow), 0)
+
+    def test_bulk_availability_is_one_cheap_request(self):
+        self._book(self.workers[0], 9)
+        self._book(self.workers[2], 11)
+        self.client.force_login(self.villager)
+        url = reverse("appointments:availability")
+
+        self.client.get(url, {"days": 30})
+        # Warm: session, user, health worker list; no appointment queries
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"days": 30})
+
+        data = response.json()
+        self.assertEqual(data["days"], 30)
+        self.assertEqual(len(data["slots"]), 16)
+        by_id = {hw["id"]: hw["unavailable"] for hw in data["healthworkers"]}
+        self.assertEqual(len(by_id), 3)
+        self.assertEqual(by_id[self.workers[0].pk][1], 0b1)
+        self.assertEqual(by_id[self.workers[2].pk][1], 0b10000)
+        self.assertEqual(by_id[self.workers[1].pk], [0] * 30)
+
+        legacy = self.client.get(
+            reverse("appointments:available_slots"),
+            {"healthworker": self.workers[2].pk, "date": self.tomorrow.isoformat()},
+        )
+        self.assertEqual(legacy.json(), {"unavailable_slots": ["11:00"]})
+
+    def test_update_form_conflicts_use_the_bitmap(self):
+        worker = self.workers[0]
+        taken = self._book(worker, 9)
+        mine = self._book(worker, 10)
+
+        def form(appointment, hour):
+            return AppointmentUpdateForm(
+                {
+                    "date": self.tomorrow.isoformat(),
+                    "time": f"{hour:02d}:00",
+                    "healthworker": worker.pk,
+                    "priority": "normal",
+                    "status": "pending",
+                    "note": "",
+                },
+                instance=Appointment.objects.get(pk=appointment.pk),
+                user=self.admin,
+            )
+
+        # Keeping its own slot is not a conflict
+        self.assertTrue(form(mine, 10).is_valid())
+        moved = form(mine, 9)
+        self.assertFalse(moved.is_valid())
+        self.assertIn("already has an appointment", moved.errors["time"][0])
+        self.assertTrue(form(taken, 11).is_valid())
+
+
+class SlotReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villagers = [
+            Account.objects.create_user(
+                "Villager", str(i), f"villager{i}", f"v{i}@example.com", "pw", f"1{i}"
+            )
+            for i in range(2)
+        ]
+        cls.worker = Account.objects.create_user(
+            "Doc", "Sharma", "doc", "doc@example.com", "pw", "2", role="health_worker"
+        )
+        HealthWorkerProfile.objects.create(user=cls.worker, specialization="GP")
+
+    def setUp(self):
+        cache.clear()
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def _appointment(self, villager, hour, status="pending"):
+        return Appointment(
+            villager=villager,
+            healthworker=self.worker,
+            date=self.tomorrow,
+            time=time(hour, 0),
+            reason="checkup",
+            status=status,
+        )
+
+    def test_constraint_allows_one_active_booking_per_slot(self):
+        slots.save_reserving_slot(self._appointment(self.villagers[0], 9))
+        with self.assertRaises(slots.SlotUnavailable):
+            slots.save_reserving_slot(self._appointment(self.villagers[1], 9))
+
+        # Cancelled and completed bookings do not hold the slot
+        Appointment.objects.update(status="cancelled")
+        slots.save_reserving_slot(self._appointment(self.villagers[1], 9))
+        slots.save_reserving_slot(self._appointment(self.villagers[0], 10, "completed"))
+        slots.save_reserving_slot(self._appointment(self.villagers[1], 10))
+        self.assertEqual(
+            Appointment.objects.filter(status__in=["pending", "approved"]).count(), 2
+        )
+
+    def test_hold_blocks_other_users_until_released(self):
+        first, second = (v.pk for v in self.villagers)
+        nine, ten = time(9, 0), time(10, 0)
+
+        self.assertTrue(slots.hold_slot(first, self.worker.pk, self.tomorrow, nine))
+        self.assertTrue(slots.hold_slot(first, self.worker.pk, self.tomorrow, nine))
+        self.assertFalse(slots.hold_slot(second, self.worker.pk, self.tomorrow, nine))
+        self.assertTrue(slots.held_by_other(second, self.worker.pk, self.tomorrow, nine))
+        self.assertFalse(slots.held_by_other(first, self.worker.pk, self.tomorrow, nine))
+
+        # Moving to another slot releases the first one
+        self.assertTrue(slots.hold_slot(first, self.worker.pk, self.tomorrow, ten))
+        self.assertTrue(slots.hold_slot(second, self.worker.pk, self.tomorrow, nine))
+
+        slots.release_hold(first)
+        self.assertFalse(slots.held_by_other(second, self.worker.pk, self.tomorrow, ten))
+
+    def test_hold_endpoint(self):
+        url = reverse("appointments:hold_slot")
+        slot = {
+            "healthworker": self.worker.pk,
+            "date": self.tomorrow.isoformat(),
+            "time": "09:00",
+        }
+
+        self.client.force_login(self.villagers[0])
+        response = self.client.post(url, slot)
+        self.assertEqual(response.json(), {"held": True, "expires_in": 300})
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        self.client.force_login(self.villagers[1])
+        self.assertEqual(self.client.post(url, slot).status_code, 409)
+        self.assertEqual(self.client.post(url, {**slot, "time": "18:00"}).status_code, 409)
+        self.assertEqual(self.client.post(url, {**slot, "date": "x"}).status_code, 400)
+
+        response = self.client.post(
+            reverse("appointments:create"),
+            {**slot, "reason": "fever", "priority": "normal"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("time", response.context["form"].errors)
+        self.assertFalse(Appointment.objects.exists())
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Stress test: many villagers submit the same slot at once."""
+
+    def test_exactly_one_booking_wins(self):
+        worker = Account.objects.create_user(
+            "Doc", "Sharma", "doc", "doc@example.com", "pw", "2", role="health_worker"
+        )
+        villagers = [
+            Account.objects.create_user(
+                "Villager", str(i), f"villager{i}", f"v{i}@example.com", "pw", f"1{i}"
+            )
+            for i in range(8)
+        ]
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        barrier = threading.Barrier(len(villagers))
+        outcomes = []
+
+        def book(villager):
+            appointment = Appointment(
+                villager=villager,
+                healthworker=worker,
+                date=tomorrow,
+                time=time(9, 0),
+                reason="checkup",
+            )
+            barrier.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        slots.save_reserving_slot(appointment)
+                    except OperationalError:
+                        # SQLite allows one writer at a time; real databases
+                        # queue the inserts instead
+                        time_module.sleep(0.01 * (attempt + 1))
+                        continue
+                    outcomes.append("booked")
+                    break
+            except slots.SlotUnavailable:
+                outcomes.append("taken")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(v,)) for v in villagers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ["booked"] + ["taken"] * (len(villagers) - 1))
+        self.assertEqual(
+            Appointment.objects.filter(date=tomorrow, status="pending").count(), 1
+        )
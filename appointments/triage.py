@@ -0,0 +1,451 @@
+# appointments/triage.py
+"""
+Live per-health-worker triage queue.
+
+Open (pending/approved) appointments are kept in a priority structure per
+health worker and updated incrementally from the Appointment signals, so
+"next patient" and "top N" are answered without loading or re-sorting the
+worker's appointments:
+
+  * RedisTriageBackend - one sorted set per worker (ZADD/ZREM/ZRANGE),
+    shared by every web and Celery process. Used when TRIAGE_REDIS_URL is
+    set (defaults to REDIS_CACHE_URL).
+  * DatabaseTriageBackend - no queue of its own; every read is an indexed
+    ORDER BY ... LIMIT on Appointment. The default without Redis, so every
+    process sees every booking.
+  * LocalTriageBackend - an IndexedHeap per worker inside the current
+    process. Only with TRIAGE_BACKEND = "local" (single-process
+    development and tests): other processes' bookings never reach it.
+
+Ordering matches AppointmentPriorityQueue: priority, then date/time, then id.
+A queue is merged from the database the first time it is read (and again
+every TRIAGE_RELOAD_SECONDS on Redis); signals add to it even before that,
+so a booking committed while the queue is loading is not lost. Reads drop
+ids that are no longer open, which repairs an appointment closed during a
+load. Each change bumps a per-worker version in the cache; the dashboard
+polls /triage/?version= and only gets the queue back when it changed.
+"""
+import heapq
+import threading
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+
+from .models import Appointment
+from .utils import AppointmentPriorityQueue, order_by_priority
+
+QUEUE_STATUSES = ("pending", "approved")
+MINUTES_PER_DAY = 24 * 60
+# Priority band width; larger than any date/time offset (ordinal * 1440)
+PRIORITY_BAND = 10**10
+
+
+def triage_score(priority, date, time):
+    """Sortable number: priority band, then minutes since 0001-01-01."""
+    rank = AppointmentPriorityQueue.PRIORITY_VALUES.get(priority, 3)
+    minutes = date.toordinal() * MINUTES_PER_DAY + time.hour * 60 + time.minute
+    return rank * PRIORITY_BAND + minutes
+
+
+class IndexedHeap:
+    """
+    Binary min-heap of (score, key) with a key -> position index, so an
+    entry can be re-prioritised (decrease/increase-key) or removed in
+    O(log n) instead of rebuilding the heap.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._pos = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._pos
+
+    def push(self, key, score):
+        """Insert `key`, or move it if it is already queued."""
+        if key in self._pos:
+            index = self._pos[key]
+            old_score = self._heap[index][0]
+            self._heap[index] = (score, key)
+            if (score, key) < (old_score, key):
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+            return
+        self._heap.append((score, key))
+        self._pos[key] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def remove(self, key):
+        index = self._pos.pop(key, None)
+        if index is None:
+            return False
+        last = self._heap.pop()
+        if index < len(self._heap):
+            self._heap[index] = last
+            self._pos[last[1]] = index
+            self._sift_up(index)
+            self._sift_down(self._pos[last[1]])
+        return True
+
+    def peek(self):
+        return self._heap[0][1] if self._heap else None
+
+    def top(self, n):
+        """The n smallest keys in order, in O(n log n) regardless of heap size."""
+        result = []
+        frontier = [(self._heap[0], 0)] if self._heap else []
+        while frontier and len(result) < n:
+            (_, key), index = heapq.heappop(frontier)
+            result.append(key)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self._heap):
+                    heapq.heappush(frontier, (self._heap[child], child))
+        return result
+
+    def _swap(self, i, j):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._pos[self._heap[i][1]] = i
+        self._pos[self._heap[j][1]] = j
+
+    def _sift_up(self, index):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self._heap[index] < self._heap[parent]:
+                self._swap(index, parent)
+                index = parent
+            else:
+                break
+
+    def _sift_down(self, index):
+        size = len(self._heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and self._heap[child] < self._heap[smallest]:
+                    smallest = child
+            if smallest == index:
+                break
+            self._swap(index, smallest)
+            index = smallest
+
+
+class LocalTriageBackend:
+    """Process-local queues; only suitable for a single process."""
+
+    def __init__(self):
+        self._queues = {}
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+    def is_loaded(self, healthworker_id):
+        return healthworker_id in self._loaded
+
+    def members(self, healthworker_id):
+        with self._lock:
+            return set(self._queues.get(healthworker_id, IndexedHeap())._pos)
+
+    def load(self, healthworker_id, entries, stale=()):
+        with self._lock:
+            heap = self._queues.setdefault(healthworker_id, IndexedHeap())
+            for appointment_id in stale:
+                heap.remove(appointment_id)
+            for appointment_id, score in entries:
+                heap.push(appointment_id, score)
+            self._loaded.add(healthworker_id)
+
+    def add(self, healthworker_id, appointment_id, score):
+        with self._lock:
+            self._queues.setdefault(healthworker_id, IndexedHeap()).push(
+                appointment_id, score
+            )
+
+    def remove(self, healthworker_id, *appointment_ids):
+        with self._lock:
+            heap = self._queues.get(healthworker_id)
+            if heap is not None:
+                for appointment_id in appointment_ids:
+                    heap.remove(appointment_id)
+
+    def top(self, healthworker_id, n):
+        with self._lock:
+            heap = self._queues.get(healthworker_id)
+            return heap.top(n) if heap is not None else []
+
+    def size(self, healthworker_id):
+        with self._lock:
+            return len(self._queues.get(healthworker_id, ()))
+
+
+class RedisTriageBackend:
+    """One sorted set per health worker; members are zero-padded ids so
+    equal scores fall back to id order."""
+
+    def __init__(self, url):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _key(healthworker_id):
+        return f"triage:queue:{healthworker_id}"
+
+    @staticmethod
+    def _member(appointment_id):
+        return f"{appointment_id:012d}"
+
+    def is_loaded(self, healthworker_id):
+        return bool(self._redis.exists(f"{self._key(healthworker_id)}:loaded"))
+
+    def members(self, healthworker_id):
+        return {int(m) for m in self._redis.zrange(self._key(healthworker_id), 0, -1)}
+
+    def load(self, healthworker_id, entries, stale=()):
+        # Merge rather than replace: adds that raced the database read stay.
+        # The marker expires so the queue is re-merged now and then,
+        # repairing updates lost while Redis was unreachable.
+        key = self._key(healthworker_id)
+        pipe = self._redis.pipeline()
+        if stale:
+            pipe.zrem(key, *map(self._member, stale))
+        if entries:
+            pipe.zadd(key, {self._member(pk): score for pk, score in entries})
+        pipe.set(
+            f"{key}:loaded", 1, ex=getattr(settings, "TRIAGE_RELOAD_SECONDS", 3600)
+        )
+        pipe.execute()
+
+    def add(self, healthworker_id, appointment_id, score):
+        # ZADD inserts or re-scores, loaded or not
+        self._redis.zadd(
+            self._key(healthworker_id), {self._member(appointment_id): score}
+        )
+
+    def remove(self, healthworker_id, *appointment_ids):
+        self._redis.zrem(
+            self._key(healthworker_id), *map(self._member, appointment_ids)
+        )
+
+    def top(self, healthworker_id, n):
+        members = self._redis.zrange(self._key(healthworker_id), 0, n - 1)
+        return [int(member) for member in members]
+
+    def size(self, healthworker_id):
+        return self._redis.zcard(self._key(healthworker_id))
+
+
+def _open_appointments(healthworker_id):
+    return Appointment.objects.filter(
+        healthworker_id=healthworker_id, status__in=QUEUE_STATUSES
+    )
+
+
+class DatabaseTriageBackend:
+    """Reads the database every time; writes are no-ops."""
+
+    def is_loaded(self, healthworker_id):
+        return True
+
+    def members(self, healthworker_id):
+        return set()
+
+    def load(self, healthworker_id, entries, stale=()):
+        pass
+
+    def add(self, healthworker_id, appointment_id, score):
+        pass
+
+    def remove(self, healthworker_id, *appointment_ids):
+        pass
+
+    def top(self, healthworker_id, n):
+        return list(
+            order_by_priority(_open_appointments(healthworker_id)).values_list(
+                "id", flat=True
+            )[:n]
+        )
+
+    def size(self, healthworker_id):
+        return _open_appointments(healthworker_id).count()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                url = getattr(settings, "TRIAGE_REDIS_URL", None)
+                name = getattr(settings, "TRIAGE_BACKEND", "") or (
+                    "redis" if url else "database"
+                )
+                if name == "redis":
+                    if not url:
+                        raise ImproperlyConfigured(
+                            'TRIAGE_BACKEND = "redis" needs TRIAGE_REDIS_URL'
+                        )
+                    _backend = RedisTriageBackend(url)
+                elif name == "database":
+                    _backend = DatabaseTriageBackend()
+                elif name == "local":
+                    _backend = LocalTriageBackend()
+                else:
+                    raise ImproperlyConfigured(f"Unknown TRIAGE_BACKEND {name!r}")
+    return _backend
+
+
+def reset_backend():
+    """Drop the configured backend (tests, settings changes)."""
+    global _backend
+    _backend = None
+
+
+# ---------------------------------------------------------------------------
+# Queue operations
+# ---------------------------------------------------------------------------
+
+
+def _version_key(healthworker_id):
+    return f"triage:version:{healthworker_id}"
+
+
+def get_version(healthworker_id):
+    return cache.get(_version_key(healthworker_id), 0)
+
+
+def _bump_version(healthworker_id):
+    key = _version_key(healthworker_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def ensure_loaded(healthworker_id):
+    backend = get_backend()
+    if not backend.is_loaded(healthworker_id):
+        # Members from before the database read that it no longer lists are
+        # stale; anything added after that read is kept
+        before = backend.members(healthworker_id)
+        rows = _open_appointments(healthworker_id).values_list(
+            "id", "priority", "date", "time"
+        )
+        entries = [(pk, triage_score(priority, d, t)) for pk, priority, d, t in rows]
+        backend.load(
+            healthworker_id, entries, stale=before - {pk for pk, _ in entries}
+        )
+    return backend
+
+
+def top_appointments(healthworker_id, n=5):
+    """The worker's n most urgent open appointments, in triage order."""
+    backend = ensure_loaded(healthworker_id)
+    ids = backend.top(healthworker_id, n)
+    by_id = (
+        _open_appointments(healthworker_id).select_related("villager").in_bulk(ids)
+    )
+    stale = [pk for pk in ids if pk not in by_id]
+    if stale:
+        # Closed, reassigned or deleted while the queue was loading
+        backend.remove(healthworker_id, *stale)
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+def versions_shared():
+    """
+    Whether a client holding the current get_version() has the current
+    queue, so the read can be skipped. Versions live in the Django cache,
+    which is per process with LocMemCache.
+    """
+    backend = get_backend()
+    if isinstance(backend, LocalTriageBackend):
+        return True  # one process by definition
+    return isinstance(backend, RedisTriageBackend) and not isinstance(
+        caches["default"], LocMemCache
+    )
+
+
+def next_patient(healthworker_id):
+    top = top_appointments(healthworker_id, 1)
+    return top[0] if top else None
+
+
+def queue_size(healthworker_id):
+    return ensure_loaded(healthworker_id).size(healthworker_id)
+
+
+def sync_appointment(appointment, previous_healthworker_id=None):
+    """Push, re-score or remove `appointment` to match its current state."""
+    backend = get_backend()
+    touched = set()
+    if previous_healthworker_id and previous_healthworker_id != appointment.healthworker_id:
+        backend.remove(previous_healthworker_id, appointment.pk)
+        touched.add(previous_healthworker_id)
+    if appointment.healthworker_id:
+        if appointment.status in QUEUE_STATUSES:
+            backend.add(
+                appointment.healthworker_id,
+                appointment.pk,
+                triage_score(appointment.priority, appointment.date, appointment.time),
+            )
+        else:
+            backend.remove(appointment.healthworker_id, appointment.pk)
+        touched.add(appointment.healthworker_id)
+    for healthworker_id in touched:
+        _bump_version(healthworker_id)
+
+
+def remove_appointment(healthworker_id, appointment_id):
+    remove_appointments(healthworker_id, [appointment_id])
+
+
+def remove_appointments(healthworker_id, appointment_ids):
+    """Drop several appointments from one worker's queue with a single version bump."""
+    if healthworker_id and appointment_ids:
+        get_backend().remove(healthworker_id, *appointment_ids)
+        _bump_version(healthworker_id)
+
+
+# ---------------------------------------------------------------------------
+# Signals
+# ---------------------------------------------------------------------------
+
+
+def remember_healthworker(sender, instance, **kwargs):
+    instance._triage_healthworker_id = instance.__dict__.get("healthworker_id")
+
+
+def sync_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_triage_healthworker_id", None)
+    instance._triage_healthworker_id = instance.healthworker_id
+    # Only publish committed state
+    transaction.on_commit(lambda: sync_appointment(instance, previous))
+
+
+def remove_on_delete(sender, instance, **kwargs):
+    healthworker_id, pk = instance.healthworker_id, instance.pk
+    transaction.on_commit(lambda: remove_appointment(healthworker_id, pk))
+
+
+def connect_signals():
+    post_init.connect(
+        remember_healthworker, sender=Appointment, dispatch_uid="triage_init"
+    )
+    post_save.connect(sync_on_save, sender=Appointment, dispatch_uid="triage_save")
+    post_delete.connect(
+        remove_on_delete, sender=Appointment, dispatch_uid="triage_delete"
+    )
@@ -7,6 +7,10 @@ urlpatterns = [
     path("", views.appointment_list, name="list"),
     path("create/", views.appointment_create, name="create"),
     path("available-slots/", views.available_slots, name="available_slots"),
+    path("availability/", views.availability, name="availability"),
+    path("hold-slot/", views.hold_slot, name="hold_slot"),
+    path("triage/", views.triage_queue, name="triage_queue"),
+    path("triage/next/", views.triage_next, name="triage_next"),
     path("<int:pk>/", views.appointment_detail, name="detail"),
     path("<int:pk>/update/", views.appointment_update, name="update"),
     path("<int:pk>/delete/", views.appointment_delete, name="delete"),
@@ -1,10 +1,20 @@
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.db.models import Count, F, Q
 from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel
 from datetime import datetime
+from functools import lru_cache
+from typing import List, Literal
+import hashlib
 import heapq
 import logging
+import re
+import unicodedata
+
+from rural_health_assistant.mailer import queue_emails
+
+from .models import PRIORITY_RANK, TriageCacheEntry
 
 logger = logging.getLogger(__name__)
 
@@ -114,33 +124,279 @@ def get_prioritized_appointments(appointments):
     return pq.get_sorted_appointments()
 
 
-def classify_appointment_priority(reason: str) -> str:
+def order_by_priority(queryset):
+    """
+    Database-side equivalent of get_prioritized_appointments(): orders by
+    priority rank, then date and time, so the result can be paginated
+    without loading every row.
+    """
+    return queryset.alias(priority_rank=PRIORITY_RANK).order_by(
+        "priority_rank", "date", "time", "id"
+    )
+
+
+def appointment_counts(queryset, today):
+    """Status/priority/upcoming counts for `queryset` in one aggregate query."""
+    return queryset.aggregate(
+        total_count=Count("id"),
+        pending_count=Count("id", filter=Q(status="pending")),
+        approved_count=Count("id", filter=Q(status="approved")),
+        completed_count=Count("id", filter=Q(status="completed")),
+        cancelled_count=Count("id", filter=Q(status="cancelled")),
+        upcoming_count=Count(
+            "id", filter=Q(date__gte=today, status__in=["pending", "approved"])
+        ),
+        critical_count=Count("id", filter=Q(priority="critical")),
+        medium_count=Count("id", filter=Q(priority="medium")),
+        normal_count=Count("id", filter=Q(priority="normal")),
+    )
+
+
+# Fast local triage: phrases that mark a reason as critical / medium.
+# Deliberately conservative; the LLM refines the result in the background.
+CRITICAL_KEYWORDS = (
+    "chest pain",
+    "heart attack",
+    "can't breathe",
+    "cannot breathe",
+    "difficulty breathing",
+    "shortness of breath",
+    "not breathing",
+    "unconscious",
+    "fainted",
+    "seizure",
+    "convulsion",
+    "stroke",
+    "paralysis",
+    "severe bleeding",
+    "heavy bleeding",
+    "bleeding heavily",
+    "vomiting blood",
+    "coughing blood",
+    "snake bite",
+    "snakebite",
+    "poison",
+    "overdose",
+    "severe burn",
+    "head injury",
+    "fracture",
+    "labour pain",
+    "labor pain",
+    "suicid",
+    # Nepali (Devanagari)
+    "छाती दुख",  # chest pain
+    "हृदयाघात",  # heart attack
+    "सास फेर्न",  # (difficulty) breathing
+    "सास रोकि",  # breathing stopped
+    "बेहोस",  # unconscious
+    "मुर्छा",  # fainted
+    "छारे रोग",  # seizure
+    "पक्षाघात",  # paralysis / stroke
+    "धेरै रगत",  # heavy bleeding
+    "रगत बान्ता",  # vomiting blood
+    "खोकीमा रगत",  # coughing blood
+    "सर्पले टोक",  # snake bite
+    "विष खा",  # ate poison
+    "प्रसव पीडा",  # labour pain
+    "व्यथा लाग",  # labour started
+    "आत्महत्या",  # suicide
+    "हड्डी भाँचि",  # fracture
+    "टाउकोमा चोट",  # head injury
+)
+MEDIUM_KEYWORDS = (
+    "fever",
+    "infection",
+    "vomiting",
+    "diarrhea",
+    "diarrhoea",
+    "persistent",
+    "severe",
+    "pain",
+    "injury",
+    "wound",
+    "swelling",
+    "rash",
+    "pregnan",
+    "asthma",
+    "diabetes",
+    "blood pressure",
+    "dizziness",
+    "infant",
+    "baby",
+    # Nepali (Devanagari)
+    "ज्वरो",  # fever
+    "संक्रमण",  # infection
+    "बान्ता",  # vomiting
+    "पखाला",  # diarrhoea
+    "दुख",  # pain (दुखेको, दुख्ने)
+    "पीडा",  # pain
+    "चोट",  # injury
+    "घाउ",  # wound
+    "जलेको",  # burn
+    "सुन्नि",  # swelling
+    "गर्भवती",  # pregnant
+    "मधुमेह",  # diabetes
+    "चिनी रोग",  # diabetes
+    "रक्तचाप",  # blood pressure
+    "प्रेसर",  # blood pressure
+    "रिंगटा",  # dizziness
+    "शिशु",  # infant
+    "नवजात",  # newborn
+)
+
+
+def keyword_triage(reason: str) -> str:
+    """
+    Provisional priority from English and Nepali keyword matching; no
+    network calls, so it is safe to run inside the booking request.
+    """
+    # NFC so decomposed Devanagari input matches the keywords
+    text = " ".join(unicodedata.normalize("NFC", reason or "").lower().split())
+    if any(keyword in text for keyword in CRITICAL_KEYWORDS):
+        return "critical"
+    if any(keyword in text for keyword in MEDIUM_KEYWORDS):
+        return "medium"
+    return "normal"
+
+
+@lru_cache(maxsize=1)
+def get_triage_llm():
+    """Shared Gemini client for triage (built once per process), or None."""
+    api_key = getattr(settings, "GOOGLE_GENAI_API_KEY", None)
+    if not api_key:
+        return None
+    return ChatGoogleGenerativeAI(
+        model=getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash"),
+        temperature=0.1,
+        api_key=api_key,
+    )
+
+
+# Bump when the triage prompts change: cached results from older prompts
+# are ignored and `manage.py retriage_appointments` can re-run them.
+TRIAGE_PROMPT_VERSION = 1
+PRIORITY_LEVELS = ("critical", "medium", "normal")
+
+TRIAGE_GUIDELINES = """**Priority Levels:**
+- CRITICAL: Life-threatening conditions, severe symptoms requiring immediate attention (e.g., chest pain, severe bleeding, difficulty breathing, stroke symptoms, severe injuries, high fever in infants, suspected heart attack)
+- MEDIUM: Concerning symptoms that need prompt medical attention but not immediately life-threatening (e.g., persistent pain, moderate fever, infections, chronic condition flare-ups, injuries requiring evaluation)
+- NORMAL: Routine health concerns, preventive care, follow-ups, minor ailments (e.g., common cold, routine check-ups, vaccination, minor skin issues, general health questions)"""
+
+
+def normalize_reason(reason: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", (reason or "").lower()).split())
+
+
+def _reason_hash(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _embed_reason(normalized: str):
+    """Unit-length float32 embedding, or None if embeddings are unavailable."""
+    if not getattr(settings, "TRIAGE_CACHE_SIMILARITY", 0):
+        return None
+    try:
+        import numpy as np
+        from rag_components.vector_store_update import get_embeddings
+
+        vector = np.asarray(get_embeddings().embed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+    except Exception as e:
+        logger.warning(f"Triage cache embedding unavailable: {e}")
+        return None
+
+
+def lookup_cached_priority(reason: str):
+    """
+    Cached priority for `reason`: exact normalized match first, then the
+    most similar cached reason above TRIAGE_CACHE_SIMILARITY. None on a miss.
+
+    A similar (non-exact) hit is only reused when it is critical, since a
+    negation or a small edit can change the urgency without moving the
+    embedding much; anything milder goes to the LLM instead.
+    """
+    normalized = normalize_reason(reason)
+    if not normalized:
+        return None
+    entries = TriageCacheEntry.objects.filter(prompt_version=TRIAGE_PROMPT_VERSION)
+
+    entry = entries.filter(reason_hash=_reason_hash(normalized)).only("priority").first()
+    if entry is None:
+        vector = _embed_reason(normalized)
+        if vector is None:
+            return None
+        import numpy as np
+
+        candidates = list(
+            entries.exclude(embedding=None)
+            .order_by("-hits")
+            .values_list("id", "embedding", "priority")[
+                : getattr(settings, "TRIAGE_CACHE_SCAN_LIMIT", 5000)
+            ]
+        )
+        if not candidates:
+            return None
+        matrix = np.vstack(
+            [np.frombuffer(bytes(blob), dtype=np.float32) for _, blob, _ in candidates]
+        )
+        scores = matrix @ vector
+        best = int(scores.argmax())
+        if scores[best] < settings.TRIAGE_CACHE_SIMILARITY:
+            return None
+        if candidates[best][2] != "critical":
+            return None
+        entry = TriageCacheEntry(pk=candidates[best][0], priority=candidates[best][2])
+
+    TriageCacheEntry.objects.filter(pk=entry.pk).update(hits=F("hits") + 1)
+    return entry.priority
+
+
+def store_cached_priority(reason: str, priority: str):
+    normalized = normalize_reason(reason)
+    if not normalized or priority not in PRIORITY_LEVELS:
+        return
+    vector = _embed_reason(normalized)
+    TriageCacheEntry.objects.update_or_create(
+        prompt_version=TRIAGE_PROMPT_VERSION,
+        reason_hash=_reason_hash(normalized),
+        defaults={
+            "normalized_reason": normalized,
+            "priority": priority,
+            "embedding": vector.tobytes() if vector is not None else None,
+        },
+    )
+
+
+def classify_appointment_priority(
+    reason: str, default: str = "normal", use_cache: bool = True
+) -> str:
     """
     Uses AI (LLM) to classify appointment reason into priority levels.
 
     Args:
         reason: The patient's appointment reason/description
+        default: Returned when the LLM is unavailable or gives no usable answer
+        use_cache: Consult/populate the triage cache (TriageCacheEntry)
 
     Returns:
         'critical', 'medium', or 'normal'
     """
-    try:
-        # Initialize LLM
-        api_key = getattr(settings, "GOOGLE_GENAI_API_KEY", None)
-        if not api_key:
-            return "normal"  # Default fallback
+    if use_cache:
+        cached = lookup_cached_priority(reason)
+        if cached:
+            return cached
 
-        llm = ChatGoogleGenerativeAI(
-            model=getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash"), temperature=0.1, api_key=api_key
-        )
+    try:
+        llm = get_triage_llm()
+        if llm is None:
+            return default
 
         # Classification prompt
         prompt = f"""You are a medical triage AI assistant. Classify the following appointment reason into one of three priority levels based on medical urgency:
 
-**Priority Levels:**
-- CRITICAL: Life-threatening conditions, severe symptoms requiring immediate attention (e.g., chest pain, severe bleeding, difficulty breathing, stroke symptoms, severe injuries, high fever in infants, suspected heart attack)
-- MEDIUM: Concerning symptoms that need prompt medical attention but not immediately life-threatening (e.g., persistent pain, moderate fever, infections, chronic condition flare-ups, injuries requiring evaluation)
-- NORMAL: Routine health concerns, preventive care, follow-ups, minor ailments (e.g., common cold, routine check-ups, vaccination, minor skin issues, general health questions)
+{TRIAGE_GUIDELINES}
 
 **Appointment Reason:**
 {reason}
@@ -155,30 +411,78 @@ Analyze the medical urgency and respond with ONLY ONE WORD - either "critical",
         classification = response.content.strip().lower()
 
         # Validate response
-        if classification in ["critical", "medium", "normal"]:
+        if classification in PRIORITY_LEVELS:
+            if use_cache:
+                store_cached_priority(reason, classification)
             return classification
         else:
-            # If unclear, default to normal
-            return "normal"
+            # If unclear, keep the fallback
+            return default
 
     except Exception as e:
         print(f"Priority classification error: {e}")
-        return "normal"  # Safe fallback
+        return default  # Safe fallback
+
+
+class _TriageResult(BaseModel):
+    id: int
+    priority: Literal["critical", "medium", "normal"]
+
+
+class _TriageBatch(BaseModel):
+    results: List[_TriageResult]
+
+
+def classify_priorities_batch(reasons):
+    """
+    Classify many reasons with a single structured-output LLM call.
+
+    Returns a list aligned with `reasons`; entries the model skipped or the
+    call failed for are None.
+    """
+    llm = get_triage_llm()
+    if llm is None or not reasons:
+        return [None] * len(reasons)
+
+    numbered = "\n".join(
+        f"{i}. {' '.join(reason.split())}" for i, reason in enumerate(reasons, 1)
+    )
+    prompt = f"""You are a medical triage AI assistant. Classify each of the following appointment reasons into one of three priority levels based on medical urgency:
+
+{TRIAGE_GUIDELINES}
+
+**Appointment Reasons:**
+{numbered}
+
+**Instructions:**
+Return one result per reason, using its number as the id."""
+
+    try:
+        batch = llm.with_structured_output(_TriageBatch).invoke(prompt)
+    except Exception as e:
+        logger.error(f"Batch triage failed: {e}")
+        return [None] * len(reasons)
+
+    by_id = {item.id: item.priority for item in batch.results}
+    return [by_id.get(i) for i in range(1, len(reasons) + 1)]
 
 
 def send_appointment_email(appointment, created=False):
-    """Send role-specific appointment emails to villager and health worker."""
+    """Queue role-specific appointment emails to villager and health worker."""
     try:
-        _send_appointment_email_impl(appointment, created)
+        queue_emails(appointment_email_messages(appointment, created))
     except Exception as e:
         logger.error(
-            f"Failed to send appointment email for appointment #{appointment.pk}: {e}",
+            f"Failed to queue appointment email for appointment #{appointment.pk}: {e}",
             exc_info=True,
         )
 
 
-def _send_appointment_email_impl(appointment, created=False):
-    """Internal implementation for sending appointment emails."""
+def appointment_email_messages(appointment, created=False):
+    """
+    Render the villager and health worker emails for an appointment, as
+    keyword arguments for rural_health_assistant.mailer.queue_email().
+    """
     date_str = appointment.date.strftime("%b %d, %Y")
     time_str = appointment.time.strftime("%I:%M %p")
 
@@ -194,33 +498,29 @@ def _send_appointment_email_impl(appointment, created=False):
     else:
         subject = f"Appointment Updated — {date_str} at {time_str}"
 
-    # Send to villager
+    messages = []
+
+    # Villager email
     if appointment.villager and appointment.villager.email:
         context = {
             "appointment": appointment,
             "created": created,
             "recipient_role": "villager",
         }
-        text_content = render_to_string("appointments/email.txt", context)
-        html_content = render_to_string("appointments/email.html", context)
-
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            [appointment.villager.email],
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
-        logger.info(
-            f"Email sent to villager {appointment.villager.email} for appointment #{appointment.pk}"
+        messages.append(
+            {
+                "subject": subject,
+                "body": render_to_string("appointments/email.txt", context),
+                "html_body": render_to_string("appointments/email.html", context),
+                "to": appointment.villager.email,
+            }
         )
     else:
         logger.warning(
             f"No villager email for appointment #{appointment.pk}, skipping villager notification"
         )
 
-    # Send to health worker (if assigned)
+    # Health worker email (if assigned)
     if appointment.healthworker and appointment.healthworker.email:
         patient_name = (
             f"{appointment.villager.first_name} {appointment.villager.last_name}"
@@ -235,21 +535,17 @@ def _send_appointment_email_impl(appointment, created=False):
             "created": created,
             "recipient_role": "health_worker",
         }
-        text_content = render_to_string("appointments/email.txt", context)
-        html_content = render_to_string("appointments/email.html", context)
-
-        email = EmailMultiAlternatives(
-            hw_subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            [appointment.healthworker.email],
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
-        logger.info(
-            f"Email sent to health worker {appointment.healthworker.email} for appointment #{appointment.pk}"
+        messages.append(
+            {
+                "subject": hw_subject,
+                "body": render_to_string("appointments/email.txt", context),
+                "html_body": render_to_string("appointments/email.html", context),
+                "to": appointment.healthworker.email,
+            }
         )
     else:
         logger.info(
             f"No health worker assigned for appointment #{appointment.pk}, skipping HW notification"
         )
+
+    return messages
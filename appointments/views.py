@@ -1,17 +1,38 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import HttpResponseForbidden
 from django.http import JsonResponse
+from django.core.paginator import Paginator
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q
+from django.views.decorators.http import require_POST
 from datetime import datetime, date, timedelta
+import logging
+from accounts.models import Account
 from .models import Appointment
 from .forms import AppointmentForm, AppointmentUpdateForm
 from .utils import (
     send_appointment_email,
-    classify_appointment_priority,
-    get_prioritized_appointments,
+    keyword_triage,
+    order_by_priority,
+    appointment_counts,
 )
+from . import slots, triage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *args):
+    """
+    Queue a Celery task. Never runs it inline when the broker is down: the
+    caller leaves a marker that a periodic sweep picks up instead.
+    """
+    try:
+        task.delay(*args)
+    except Exception:
+        logger.warning("Could not queue %s; leaving it for the sweep", task.name)
 
 
 # User role checks
@@ -48,21 +69,155 @@ def available_slots(request):
     except ValueError:
         return JsonResponse({"error": "Invalid date format."}, status=400)
 
-    conflicts = Appointment.objects.filter(
-        healthworker_id=healthworker_id,
-        date=selected_date,
-        status__in=["pending", "approved"],
-    )
+    try:
+        healthworker_id = int(healthworker_id)
+    except ValueError:
+        return JsonResponse({"error": "Invalid health worker."}, status=400)
 
     # Once today's appointment time is over, that slot should be reusable.
-    if selected_date == timezone.localdate():
-        now_time = timezone.localtime().time().replace(second=0, microsecond=0)
-        conflicts = conflicts.filter(time__gte=now_time)
+    bitmap = slots.get_bitmap(healthworker_id, selected_date)
+    bitmap &= ~slots.past_slots_mask(selected_date)
 
-    unavailable_slots = [a.time.strftime("%H:%M") for a in conflicts.only("time")]
+    unavailable_slots = slots.unavailable_labels(bitmap)
     return JsonResponse({"unavailable_slots": unavailable_slots})
 
 
+SLOT_TAKEN_MESSAGE = (
+    "This time slot was just booked by someone else. Please choose a different time slot."
+)
+
+
+@login_required
+@user_passes_test(is_villager)
+@require_POST
+def hold_slot(request):
+    """Hold a slot for the current villager while they finish the form.
+
+    409 if the slot is booked or held by someone else.
+    """
+    try:
+        healthworker_id = int(request.POST.get("healthworker", ""))
+        selected_date = datetime.strptime(request.POST.get("date", ""), "%Y-%m-%d").date()
+        selected_time = datetime.strptime(request.POST.get("time", ""), "%H:%M").time()
+    except ValueError:
+        return JsonResponse({"error": "Invalid slot."}, status=400)
+
+    if (
+        selected_date < timezone.localdate()
+        or slots.slot_index(selected_time) is None
+        or slots.is_slot_taken(healthworker_id, selected_date, selected_time)
+        or not slots.hold_slot(request.user.pk, healthworker_id, selected_date, selected_time)
+    ):
+        return JsonResponse({"held": False}, status=409)
+    return JsonResponse({"held": True, "expires_in": slots.hold_seconds()})
+
+
+AVAILABILITY_DAYS = 14
+AVAILABILITY_MAX_DAYS = 60
+
+
+@login_required
+@user_passes_test(is_villager)
+def availability(request):
+    """Slot availability for the next N days for every available health worker.
+
+    One request for the whole booking form: `unavailable` holds one bitmap
+    per day, where bit i set means slots[i] is taken.
+    """
+    try:
+        days = int(request.GET.get("days", AVAILABILITY_DAYS))
+        days = max(1, min(days, AVAILABILITY_MAX_DAYS))
+    except ValueError:
+        days = AVAILABILITY_DAYS
+    start = timezone.localdate()
+
+    healthworkers = list(
+        Account.objects.filter(role="health_worker", health_profile__availability=True)
+        .order_by("first_name", "last_name")
+        .values_list("id", "first_name", "last_name")
+    )
+    bitmaps = slots.get_bitmaps([pk for pk, _, _ in healthworkers], start, days)
+    past = slots.past_slots_mask(start)
+
+    def unavailable(pk):
+        masks = [bitmaps[(pk, start + timedelta(days=n))] for n in range(days)]
+        masks[0] &= ~past
+        return masks
+
+    return JsonResponse(
+        {
+            "start": start.isoformat(),
+            "days": days,
+            "slots": slots.SLOT_LABELS,
+            "healthworkers": [
+                {
+                    "id": pk,
+                    "name": f"Dr. {first_name} {last_name}",
+                    "unavailable": unavailable(pk),
+                }
+                for pk, first_name, last_name in healthworkers
+            ],
+        }
+    )
+
+
+def _triage_payload(healthworker_id, n, version):
+    appointments = triage.top_appointments(healthworker_id, n)
+    return {
+        "version": version,
+        "changed": True,
+        "size": triage.queue_size(healthworker_id),
+        "appointments": [
+            {
+                "id": a.pk,
+                "patient": a.villager.get_full_name(),
+                "priority": a.priority,
+                "status": a.status,
+                "date": a.date.isoformat(),
+                "time": a.time.strftime("%H:%M"),
+                "reason": a.reason[:120],
+                "url": reverse("appointments:detail", args=[a.pk]),
+            }
+            for a in appointments
+        ],
+    }
+
+
+def _triage_limit(request, default=5):
+    try:
+        return max(1, min(int(request.GET.get("n", default)), 50))
+    except ValueError:
+        return default
+
+
+@login_required
+@user_passes_test(is_health_worker)
+def triage_queue(request):
+    """
+    Top-N open appointments from the live triage queue. The dashboard polls
+    this with ?version= from its last response; while the queue is
+    unchanged the answer is just {"version", "changed": false}.
+    """
+    healthworker_id = request.user.pk
+    # Read before the queue, so a change during the read shows up next poll
+    version = triage.get_version(healthworker_id)
+    if request.GET.get("version") == str(version) and triage.versions_shared():
+        return JsonResponse({"version": version, "changed": False})
+    return JsonResponse(
+        _triage_payload(healthworker_id, _triage_limit(request), version)
+    )
+
+
+@login_required
+@user_passes_test(is_health_worker)
+def triage_next(request):
+    """The single most urgent open appointment, or null."""
+    healthworker_id = request.user.pk
+    payload = _triage_payload(healthworker_id, 1, triage.get_version(healthworker_id))
+    appointments = payload["appointments"]
+    return JsonResponse({"next": appointments[0] if appointments else None})
+
+
 def can_access_appointment(user, appointment):
     return (
         user.role == "admin"
@@ -119,65 +274,26 @@ def appointment_list(request):
         except ValueError:
             pass
 
-    # Sort by priority using the priority queue
-    appointments = get_prioritized_appointments(appointments)
+    # Counts over the whole filtered set, in one query
+    counts = appointment_counts(appointments, timezone.localdate())
+
+    # Sort by priority in the database and paginate
+    appointments = order_by_priority(
+        appointments.select_related("villager", "healthworker__health_profile")
+    )
+    paginator = Paginator(appointments, 20)
+    paginator.count = counts["total_count"]  # already known; skip the COUNT(*)
+    page_obj = paginator.get_page(request.GET.get("page"))
 
     # Add can_cancel for villagers
     if is_villager(request.user):
-        for appt in appointments:
+        for appt in page_obj:
             appt.can_cancel = can_villager_cancel(appt)
 
-    # Calculate statistics
-    today = timezone.now().date()
-
-    # Convert to list if it's already a list from priority queue
-    if isinstance(appointments, list):
-        total_count = len(appointments)
-        pending_count = len([a for a in appointments if a.status == "pending"])
-        approved_count = len([a for a in appointments if a.status == "approved"])
-        completed_count = len([a for a in appointments if a.status == "completed"])
-        cancelled_count = len([a for a in appointments if a.status == "cancelled"])
-        upcoming_count = len(
-            [
-                a
-                for a in appointments
-                if a.date >= today and a.status in ["pending", "approved"]
-            ]
-        )
-
-        # Count by priority
-        critical_count = len([a for a in appointments if a.priority == "critical"])
-        medium_count = len([a for a in appointments if a.priority == "medium"])
-        normal_count = len([a for a in appointments if a.priority == "normal"])
-    else:
-        # QuerySet
-        total_count = appointments.count()
-        pending_count = appointments.filter(status="pending").count()
-        approved_count = appointments.filter(status="approved").count()
-        completed_count = appointments.filter(status="completed").count()
-        cancelled_count = appointments.filter(status="cancelled").count()
-
-        # Upcoming appointments (future dates with pending or approved status)
-        upcoming_count = appointments.filter(
-            date__gte=today, status__in=["pending", "approved"]
-        ).count()
-
-        # Count by priority
-        critical_count = appointments.filter(priority="critical").count()
-        medium_count = appointments.filter(priority="medium").count()
-        normal_count = appointments.filter(priority="normal").count()
-
     context = {
-        "appointments": appointments,
-        "total_count": total_count,
-        "pending_count": pending_count,
-        "approved_count": approved_count,
-        "completed_count": completed_count,
-        "cancelled_count": cancelled_count,
-        "upcoming_count": upcoming_count,
-        "critical_count": critical_count,
-        "medium_count": medium_count,
-        "normal_count": normal_count,
+        "appointments": page_obj,
+        "page_obj": page_obj,
+        **counts,
         "search_query": search_query,
         "status_filter": status_filter,
         "priority_filter": priority_filter,
@@ -214,19 +330,34 @@ def appointment_detail(request, pk):
 @login_required
 @user_passes_test(is_villager)
 def appointment_create(request):
+    from . import tasks
+
     if request.method == "POST":
         form = AppointmentForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.villager = request.user
 
-            # Classify appointment priority using AI
+            # Provisional priority from local keyword triage; the LLM
+            # refinement runs in the background (or in the sweep, if the
+            # broker is down)
             reason = form.cleaned_data.get("reason", "")
-            appointment.priority = classify_appointment_priority(reason)
-
-            appointment.save()
-            send_appointment_email(appointment, created=True)
-            return redirect("appointments:list")
+            appointment.priority = keyword_triage(reason)
+            appointment.needs_triage = True
+
+            try:
+                slots.save_reserving_slot(appointment)
+            except slots.SlotUnavailable:
+                form.add_error("time", SLOT_TAKEN_MESSAGE)
+            else:
+                slots.release_hold(request.user.pk)
+                # Outbox rows only; a worker or beat does the SMTP
+                send_appointment_email(appointment, created=True)
+                pk = appointment.pk
+                transaction.on_commit(
+                    lambda: enqueue(tasks.refine_appointment_priority, pk)
+                )
+                return redirect("appointments:list")
     else:
         form = AppointmentForm(user=request.user)
 
@@ -249,9 +380,13 @@ def appointment_update(request, pk):
             request.POST, instance=appointment, user=request.user
         )
         if form.is_valid():
-            form.save()
-            send_appointment_email(appointment, created=False)
-            return redirect("appointments:list")
+            try:
+                slots.save_reserving_slot(form.save(commit=False))
+            except slots.SlotUnavailable:
+                form.add_error("time" if "time" in form.fields else None, SLOT_TAKEN_MESSAGE)
+            else:
+                send_appointment_email(appointment, created=False)
+                return redirect("appointments:list")
     else:
         form = AppointmentUpdateForm(instance=appointment, user=request.user)
 
@@ -316,29 +451,3 @@ def can_villager_cancel(appointment):
     appointment_datetime = datetime.combine(appointment.date, appointment.time)
     appointment_datetime = timezone.make_aware(appointment_datetime)
     return (appointment_datetime - timezone.now()) >= timedelta(hours=24)
-
-
-# Auto-cancel no-show appointments
-def auto_cancel_no_show_appointments():
-    now = timezone.now()
-    overdue_appointments = Appointment.objects.filter(
-        status__in=["pending", "approved"], date__lte=now.date()
-    )
-    overdue_appointments_today = overdue_appointments.filter(
-        date=now.date(), time__lt=(now - timedelta(minutes=30)).time()
-    )
-    overdue_appointments_previous = overdue_appointments.filter(date__lt=now.date())
-
-    all_overdue = overdue_appointments_today | overdue_appointments_previous
-
-    # Capture the list BEFORE bulk update, otherwise the queryset
-    # re-evaluates after update and returns 0 results (status is no longer pending/approved)
-    overdue_list = list(all_overdue.select_related("villager", "healthworker"))
-    count = all_overdue.update(status="cancelled")
-
-    # Send cancellation emails using the pre-fetched list
-    for appt in overdue_list:
-        appt.status = "cancelled"  # Reflect the updated status on the object
-        send_appointment_email(appt, created=False)
-
-    return count
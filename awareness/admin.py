@@ -1,11 +1,10 @@
 # from django.contrib import admin
 from django.contrib import admin
-from django.core.mail import EmailMultiAlternatives
-from django.contrib.auth import get_user_model
-from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib import messages
-from .models import Awareness
+from django.utils import timezone
+from .models import Awareness, AwarenessBroadcast
+from .utils import queue_broadcast, start_broadcast
 
 @admin.register(Awareness)
 class AwarenessAdmin(admin.ModelAdmin):
@@ -36,50 +35,38 @@ class AwarenessAdmin(admin.ModelAdmin):
         # Save the model first
         super().save_model(request, obj, form, change)
 
-        # Only send email on creation (not updates)
+        # Only broadcast on creation (not updates)
         if not change:
             try:
-                self.send_awareness_email(obj)
-                messages.success(request, f'Awareness item "{obj.title}" created and notification emails sent.')
+                site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
+                start_broadcast(obj, site_url)
+                messages.success(request, f'Awareness item "{obj.title}" created and notification emails queued.')
             except Exception as e:
                 messages.error(request, f'Awareness item saved but email notification failed: {str(e)}')
-    
-    def send_awareness_email(self, awareness):
-        User = get_user_model()
-        subject = f'New Awareness Program: {awareness.title}'
-
-        # Only send to users who have email addresses and are active
-        users = User.objects.filter(email__isnull=False, is_active=True).exclude(email='')
-        recipient_list = [user.email for user in users]
-
-        if recipient_list:
-            # Get site URL from settings with fallback
-            site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
 
-            # Render both HTML and plain text content
-            html_content = render_to_string('awareness/awareness_email.html', {
-                'awareness': awareness,
-                'subject': subject,
-                'site_url': site_url,
-            })
 
-            # Create plain text version
-            plain_text_content = f"""
-New Awareness Program: {awareness.title}
-
-{awareness.description}
+@admin.register(AwarenessBroadcast)
+class AwarenessBroadcastAdmin(admin.ModelAdmin):
+    list_display = ('awareness', 'status', 'get_progress', 'sent_count', 'failed_count', 'recipients_total', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = (
+        'awareness', 'site_url', 'status', 'last_user_id', 'recipients_total',
+        'sent_count', 'failed_count', 'last_error', 'created_at', 'updated_at', 'finished_at',
+    )
+    actions = ['resume']
 
-{'Event Date: ' + str(awareness.event_date) if awareness.event_date else ''}
+    def get_progress(self, obj):
+        return f'{obj.progress}%'
+    get_progress.short_description = 'Progress'
 
-Visit our portal for more details: {site_url}
-            """.strip()
+    def has_add_permission(self, request):
+        return False
 
-            # Create the email with both HTML and plain text
-            email = EmailMultiAlternatives(
-                subject,
-                plain_text_content,  # Plain text content
-                settings.DEFAULT_FROM_EMAIL,
-                recipient_list,
-            )
-            email.attach_alternative(html_content, "text/html")
-            email.send()
\ No newline at end of file
+    @admin.action(description='Resume selected broadcasts')
+    def resume(self, request, queryset):
+        # Running broadcasts resume on their own once their heartbeat goes stale
+        ids = list(queryset.filter(status__in=['pending', 'failed']).values_list('pk', flat=True))
+        AwarenessBroadcast.objects.filter(pk__in=ids).update(status='pending', updated_at=timezone.now())
+        for broadcast_id in ids:
+            queue_broadcast(broadcast_id)
+        self.message_user(request, f'{len(ids)} broadcast(s) re-queued.')
@@ -10,4 +10,46 @@ class Awareness(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+class AwarenessBroadcast(models.Model):
+    """
+    Progress of one awareness email broadcast.
+
+    Recipients are walked in primary-key order; last_user_id is the cursor
+    saved after every batch, so a crashed or restarted run resumes where it
+    stopped. updated_at doubles as the heartbeat used to detect stalled runs.
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    awareness = models.ForeignKey(Awareness, on_delete=models.CASCADE, related_name='broadcasts')
+    site_url = models.CharField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    last_user_id = models.BigIntegerField(default=0)
+    recipients_total = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.awareness} ({self.status})"
+
+    @property
+    def progress(self):
+        if not self.recipients_total:
+            return 100 if self.status == 'completed' else 0
+        done = self.sent_count + self.failed_count
+        return min(100, round(100 * done / self.recipients_total))
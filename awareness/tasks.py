@@ -0,0 +1,24 @@
+from celery import shared_task
+
+from .models import AwarenessBroadcast
+from .utils import queue_broadcast, resumable_broadcasts, run_broadcast
+
+
+@shared_task(bind=True, max_retries=5, ignore_result=True)
+def send_awareness_broadcast(self, broadcast_id):
+    """Work a broadcast to completion, retrying connection failures with backoff."""
+    try:
+        run_broadcast(broadcast_id)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            AwarenessBroadcast.objects.filter(pk=broadcast_id).update(status="failed")
+            raise
+        raise self.retry(exc=exc, countdown=60 * 2**self.request.retries)
+
+
+@shared_task
+def resume_awareness_broadcasts():
+    ids = list(resumable_broadcasts())
+    for broadcast_id in ids:
+        queue_broadcast(broadcast_id)
+    return f"Requeued {len(ids)} broadcasts"
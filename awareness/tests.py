@@ -1,3 +1,114 @@
-from django.test import TestCase
+import smtplib
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from accounts.models import Account
+
+from . import utils
+from .models import Awareness, AwarenessBroadcast
+from .utils import run_broadcast, start_broadcast
+
+
+@override_settings(AWARENESS_BROADCAST_BATCH_SIZE=4, AWARENESS_BROADCAST_RATE=None)
+class AwarenessBroadcastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(10):
+            Account.objects.create_user(
+                "User", str(i), f"user{i}", f"user{i}@example.com", "pw", str(i)
+            )
+        inactive = Account.objects.create_user(
+            "Gone", "User", "gone", "gone@example.com", "pw", "99"
+        )
+        inactive.is_active = False
+        inactive.save()
+        cls.awareness = Awareness.objects.create(
+            title="Dengue prevention", description="Clear standing water.", photo="x.jpg"
+        )
+
+    def start(self):
+        with mock.patch.object(utils, "queue_broadcast") as queue_broadcast:
+            with self.captureOnCommitCallbacks(execute=True):
+                broadcast = start_broadcast(self.awareness, "http://example.com")
+        queue_broadcast.assert_called_once_with(broadcast.pk)
+        return broadcast
+
+    def test_start_only_queues(self):
+        broadcast = self.start()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual((broadcast.status, broadcast.recipients_total), ("pending", 10))
+
+    def test_individual_messages_rendered_once_per_broadcast(self):
+        broadcast = self.start()
+        with mock.patch.object(
+            utils, "render_to_string", wraps=utils.render_to_string
+        ) as render, mock.patch.object(
+            utils, "get_connection", wraps=utils.get_connection
+        ) as get_connection:
+            self.assertTrue(run_broadcast(broadcast.pk))
+
+        render.assert_called_once()
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+        self.assertNotIn("gone@example.com", [m.to[0] for m in mail.outbox])
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ("completed", 10))
+        self.assertEqual(broadcast.progress, 100)
+        # Finished broadcasts are not picked up again
+        self.assertFalse(run_broadcast(broadcast.pk))
+
+    def test_resumes_after_a_crash_without_resending(self):
+        broadcast = self.start()
+        real_send_messages = mail.backends.locmem.EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            # Drop the connection partway through the second page
+            if messages[0].to == ["user6@example.com"]:
+                raise smtplib.SMTPServerDisconnected("connection lost")
+            return real_send_messages(backend, messages)
+
+        with mock.patch.object(
+            mail.backends.locmem.EmailBackend, "send_messages", send_messages
+        ):
+            with self.assertRaises(smtplib.SMTPServerDisconnected):
+                run_broadcast(broadcast.pk)
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ("pending", 6))
+        self.assertEqual(broadcast.last_user_id, Account.objects.get(username="user5").pk)
+        self.assertIn("connection lost", broadcast.last_error)
+
+        run_broadcast(broadcast.pk)
+        recipients = [m.to[0] for m in mail.outbox]
+        self.assertEqual(len(recipients), 10)
+        self.assertEqual(len(set(recipients)), 10)
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ("completed", 10))
+
+    def test_rejected_recipients_are_counted_and_skipped(self):
+        broadcast = self.start()
+        real_send_messages = mail.backends.locmem.EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].to == ["user3@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({"user3@example.com": (550, b"no")})
+            return real_send_messages(backend, messages)
+
+        with mock.patch.object(
+            mail.backends.locmem.EmailBackend, "send_messages", send_messages
+        ):
+            run_broadcast(broadcast.pk)
+
+        broadcast = AwarenessBroadcast.objects.get(pk=broadcast.pk)
+        self.assertEqual((broadcast.sent_count, broadcast.failed_count), (9, 1))
+        self.assertEqual(broadcast.status, "completed")
+
+    def test_running_broadcast_is_not_claimed_twice(self):
+        broadcast = self.start()
+        AwarenessBroadcast.objects.filter(pk=broadcast.pk).update(status="running")
+        self.assertFalse(run_broadcast(broadcast.pk))
+        self.assertEqual(len(mail.outbox), 0)
@@ -1,37 +1,54 @@
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+"""
+Awareness email broadcasts.
+
+A broadcast is an AwarenessBroadcast row worked by the
+send_awareness_broadcast Celery task. The email is rendered once, then
+recipients are read a page at a time in primary-key order and each gets an
+individual message. A page is sent over one SMTP connection, and the rate
+is held to AWARENESS_BROADCAST_RATE messages per second. The cursor and
+counters are saved after every page, and at the last recipient handled when
+the connection drops mid-page, so a retry resumes without resending
+(resume_awareness_broadcasts requeues stalled runs).
+"""
+import logging
+import smtplib
+import time
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-import threading
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
 
+from .models import AwarenessBroadcast
 
-def send_awareness_email_async(awareness, site_url):
-    """
-    Sends an email to all active users about a new awareness post.
-    Run asynchronously to avoid blocking the request.
-    """
-    User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def render_awareness_email(awareness, site_url):
+    """Return (subject, plain text, html) for an awareness post."""
     subject = f"New Awareness Program: {awareness.title}"
+    context = {
+        "awareness": awareness,
+        "subject": subject,
+        "site_url": site_url,
+    }
+
+    try:
+        html_content = render_to_string("awareness/awareness_email.html", context)
+    except Exception:
+        # Fallback if html template is missing
+        html_content = ""
 
-    # Only send to users who have email addresses and are active
-    users = User.objects.filter(email__isnull=False, is_active=True).exclude(email="")
-    recipient_list = [user.email for user in users]
-
-    if recipient_list:
-        context = {
-            "awareness": awareness,
-            "subject": subject,
-            "site_url": site_url,
-        }
-
-        try:
-            html_content = render_to_string("awareness/awareness_email.html", context)
-        except Exception:
-            # Fallback if html template is missing
-            html_content = ""
-
-        # Create plain text version
-        plain_text_content = f"""
+    # Create plain text version
+    plain_text_content = f"""
 New Awareness Program: {awareness.title}
 
 {awareness.description}
@@ -39,28 +56,153 @@ New Awareness Program: {awareness.title}
 {'Event Date: ' + str(awareness.event_date) if awareness.event_date else ''}
 
 Visit our portal for more details: {site_url}
-        """.strip()
-
-        # Create the email with both HTML and plain text
-        email = EmailMultiAlternatives(
-            subject,
-            plain_text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipient_list,
-        )
-        if html_content:
-            email.attach_alternative(html_content, "text/html")
+    """.strip()
+
+    return subject, plain_text_content, html_content
+
+
+def recipients(after_id=0):
+    """(pk, email) of active users with an address, in pk order after `after_id`."""
+    User = get_user_model()
+    return (
+        User.objects.filter(is_active=True, pk__gt=after_id)
+        .exclude(email__isnull=True)
+        .exclude(email="")
+        .order_by("pk")
+        .values_list("pk", "email")
+    )
 
-        try:
-            email.send(fail_silently=True)
-        except Exception as e:
-            # Let it fail silently in the thread
-            pass
+
+def start_broadcast(awareness, site_url):
+    """Create a broadcast and queue it once the transaction commits."""
+    broadcast = AwarenessBroadcast.objects.create(
+        awareness=awareness,
+        site_url=site_url,
+        recipients_total=recipients().count(),
+    )
+    transaction.on_commit(lambda: queue_broadcast(broadcast.pk))
+    return broadcast
+
+
+def queue_broadcast(broadcast_id):
+    from .tasks import send_awareness_broadcast
+
+    try:
+        send_awareness_broadcast.delay(broadcast_id)
+    except Exception:
+        # Never send inline from a request; the resume job will pick it up
+        logger.warning(f"Could not queue broadcast #{broadcast_id}; leaving it for resume")
 
 
 def trigger_awareness_email(awareness, request):
     site_url = getattr(settings, "SITE_URL", request.build_absolute_uri("/")[:-1])
-    email_thread = threading.Thread(
-        target=send_awareness_email_async, args=(awareness, site_url)
+    return start_broadcast(awareness, site_url)
+
+
+def _stall_cutoff():
+    return timezone.now() - timedelta(
+        seconds=_setting("AWARENESS_BROADCAST_STALL_SECONDS", 600)
+    )
+
+
+def _claim(broadcast_id):
+    """Mark the broadcast running unless another live worker already is."""
+    return (
+        AwarenessBroadcast.objects.filter(pk=broadcast_id)
+        .filter(Q(status="pending") | Q(status="running", updated_at__lt=_stall_cutoff()))
+        .update(status="running", updated_at=timezone.now())
+    )
+
+
+def _send_page(connection, page, subject, text, html):
+    """
+    Send one message per recipient over `connection`, yielding (pk, sent)
+    as each one is handed to the server or rejected.
+    """
+    connection.open()
+    try:
+        for pk, email in page:
+            message = EmailMultiAlternatives(
+                subject, text, settings.DEFAULT_FROM_EMAIL, [email], connection=connection
+            )
+            if html:
+                message.attach_alternative(html, "text/html")
+            try:
+                connection.send_messages([message])
+            except smtplib.SMTPServerDisconnected:
+                raise
+            except smtplib.SMTPException as e:
+                # Rejected address or message; the rest of the page goes on
+                logger.warning(f"Awareness email to {email} failed: {e}")
+                yield pk, False
+            else:
+                yield pk, True
+    finally:
+        connection.close()
+
+
+def _save_progress(broadcast_id, cursor, sent, failed, **fields):
+    AwarenessBroadcast.objects.filter(pk=broadcast_id).update(
+        last_user_id=cursor,
+        sent_count=F("sent_count") + sent,
+        failed_count=F("failed_count") + failed,
+        updated_at=timezone.now(),
+        **fields,
     )
-    email_thread.start()
+
+
+def run_broadcast(broadcast_id):
+    """
+    Send a broadcast from its saved cursor to the end.
+
+    Returns False if another worker owns the broadcast or it is finished.
+    Connection-level errors put the broadcast back to pending, with the
+    cursor at the last recipient handled, and are re-raised for the caller
+    to retry.
+    """
+    if not _claim(broadcast_id):
+        return False
+
+    broadcast = AwarenessBroadcast.objects.select_related("awareness").get(pk=broadcast_id)
+    subject, text, html = render_awareness_email(broadcast.awareness, broadcast.site_url)
+    page_size = _setting("AWARENESS_BROADCAST_BATCH_SIZE", 100)
+    rate = _setting("AWARENESS_BROADCAST_RATE", 10)
+    connection = get_connection()
+    cursor = broadcast.last_user_id
+    sent = failed = 0
+
+    try:
+        while True:
+            page = list(recipients(cursor)[:page_size])
+            if not page:
+                break
+            started = time.monotonic()
+            for cursor, ok in _send_page(connection, page, subject, text, html):
+                if ok:
+                    sent += 1
+                else:
+                    failed += 1
+            _save_progress(broadcast_id, cursor, sent, failed)
+            sent = failed = 0
+            if rate:
+                time.sleep(max(0.0, len(page) / rate - (time.monotonic() - started)))
+    except Exception as e:
+        # Keep whatever part of the page went out, so a resume doesn't resend it
+        _save_progress(
+            broadcast_id, cursor, sent, failed, status="pending", last_error=str(e)[:1000]
+        )
+        raise
+
+    AwarenessBroadcast.objects.filter(pk=broadcast_id).update(
+        status="completed", finished_at=timezone.now(), updated_at=timezone.now()
+    )
+    return True
+
+
+def resumable_broadcasts():
+    """Pending broadcasts nobody picked up, and running ones that stopped beating."""
+    cutoff = timezone.now() - timedelta(minutes=1)
+    return AwarenessBroadcast.objects.filter(
+        Q(status="pending", updated_at__lt=cutoff)
+        | Q(status="running", updated_at__lt=_stall_cutoff())
+    ).values_list("pk", flat=True)
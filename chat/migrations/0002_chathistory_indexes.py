@@ -0,0 +1,96 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+SQLITE_FTS_TABLE = "chat_chathistory_fts"
+POSTGRES_GIN_INDEX = "chat_search_gin_idx"
+
+
+def create_search_index(apps, schema_editor):
+    """GIN tsvector index on Postgres, FTS5 shadow table on SQLite."""
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        # Must stay identical to chat.utils.chat_search_vector() for the
+        # planner to use the index.
+        ChatHistory = apps.get_model("chat", "ChatHistory")
+        schema_editor.add_index(
+            ChatHistory,
+            GinIndex(
+                SearchVector("question", "answer", config="simple"),
+                name=POSTGRES_GIN_INDEX,
+            ),
+        )
+    elif vendor == "sqlite":
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5("
+                "question, answer, content='chat_chathistory', content_rowid='id')"
+            )
+        except Exception:
+            # SQLite built without FTS5: chat search falls back to icontains.
+            return
+        schema_editor.execute(
+            f"""
+            CREATE TRIGGER chat_chathistory_fts_ai AFTER INSERT ON chat_chathistory BEGIN
+                INSERT INTO {SQLITE_FTS_TABLE}(rowid, question, answer)
+                VALUES (new.id, new.question, new.answer);
+            END
+            """
+        )
+        schema_editor.execute(
+            f"""
+            CREATE TRIGGER chat_chathistory_fts_ad AFTER DELETE ON chat_chathistory BEGIN
+                INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, question, answer)
+                VALUES ('delete', old.id, old.question, old.answer);
+            END
+            """
+        )
+        schema_editor.execute(
+            f"""
+            CREATE TRIGGER chat_chathistory_fts_au AFTER UPDATE ON chat_chathistory BEGIN
+                INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, question, answer)
+                VALUES ('delete', old.id, old.question, old.answer);
+                INSERT INTO {SQLITE_FTS_TABLE}(rowid, question, answer)
+                VALUES (new.id, new.question, new.answer);
+            END
+            """
+        )
+        schema_editor.execute(
+            f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {POSTGRES_GIN_INDEX}")
+    elif vendor == "sqlite":
+        for trigger in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS chat_chathistory_fts_{trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chathistory",
+            index=models.Index(
+                fields=["user", "-timestamp", "-id"], name="chat_user_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chathistory",
+            index=models.Index(fields=["-timestamp", "-id"], name="chat_ts_idx"),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
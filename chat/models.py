@@ -9,6 +9,14 @@ class ChatHistory(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Per-user history browsing and keyset pagination
+            models.Index(fields=['user', '-timestamp', '-id'], name='chat_user_ts_idx'),
+            # Cross-user listings (admin, health worker villager history)
+            models.Index(fields=['-timestamp', '-id'], name='chat_ts_idx'),
+        ]
+        # Full-text search indexes are vendor-specific and live in
+        # migrations/0002_chathistory_indexes.py (GIN on Postgres, FTS5 on SQLite).
     
     def __str__(self):
         return f"{self.user.username} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
@@ -1,3 +1,223 @@
+import base64
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+
+from . import utils
+from .models import ChatHistory
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+
+    def _chat(self, question, minutes_ago=0):
+        chat = ChatHistory.objects.create(user=self.user, question=question, answer="ok")
+        # timestamp is auto_now_add, so set it afterwards
+        ChatHistory.objects.filter(pk=chat.pk).update(
+            timestamp=self.now - timedelta(minutes=minutes_ago)
+        )
+        chat.refresh_from_db()
+        return chat
+
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+
+    def _walk(self, queryset, per_page):
+        pages, cursor = [], None
+        while True:
+            page = utils.paginate_chats(queryset, after=cursor, per_page=per_page)
+            pages.append([chat.pk for chat in page])
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_after_and_before_cursors(self):
+        chats = [self._chat(f"q{i}", minutes_ago=i) for i in range(5)]
+        newest_first = [chat.pk for chat in chats]
+        queryset = ChatHistory.objects.filter(user=self.user)
+
+        first = utils.paginate_chats(queryset, per_page=2)
+        self.assertEqual([c.pk for c in first], newest_first[:2])
+        self.assertFalse(first.has_previous)
+
+        second = utils.paginate_chats(queryset, after=first.next_cursor, per_page=2)
+        self.assertEqual([c.pk for c in second], newest_first[2:4])
+        self.assertTrue(second.has_previous)
+
+        back = utils.paginate_chats(queryset, before=second.previous_cursor, per_page=2)
+        self.assertEqual([c.pk for c in back], newest_first[:2])
+        self.assertFalse(back.has_previous)
+        self.assertEqual(back.next_cursor, first.next_cursor)
+
+        last = utils.paginate_chats(queryset, after=second.next_cursor, per_page=2)
+        self.assertEqual([c.pk for c in last], newest_first[4:])
+        self.assertFalse(last.has_next)
+
+    def test_rows_with_the_same_timestamp_are_neither_skipped_nor_repeated(self):
+        chats = [self._chat(f"q{i}") for i in range(5)]
+        pages = self._walk(ChatHistory.objects.all(), per_page=2)
+        self.assertEqual(len(pages), 3)
+        walked = [pk for page in pages for pk in page]
+        self.assertEqual(walked, sorted((chat.pk for chat in chats), reverse=True))
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        chats = [self._chat(f"q{i}", minutes_ago=i) for i in range(3)]
+        bad = [
+            "not-base64!",
+            base64.urlsafe_b64encode(b"foo").decode(),  # no separator
+            base64.urlsafe_b64encode(b"2026-01-01T00:00:00|abc").decode(),
+            base64.urlsafe_b64encode(b"yesterday|1").decode(),
+            base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+        ]
+        for cursor in bad:
+            self.assertIsNone(utils.decode_cursor(cursor), cursor)
+            page = utils.paginate_chats(ChatHistory.objects.all(), after=cursor, per_page=2)
+            self.assertEqual([c.pk for c in page], [chats[0].pk, chats[1].pk])
+
+    def test_cursor_round_trip(self):
+        chat = self._chat("q")
+        self.assertEqual(
+            utils.decode_cursor(utils.encode_cursor(chat)), (chat.timestamp, chat.pk)
+        )
+
+
+class ChatSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+
+    def _search(self, text):
+        return set(
+            ChatHistory.objects.filter(utils.chat_search_q(text)).values_list("question", flat=True)
+        )
+
+    def test_uses_the_fts5_table_on_sqlite(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        self.assertTrue(utils._sqlite_fts_available())
+        ChatHistory.objects.create(user=self.user, question="malaria fever", answer="Use nets")
+        ChatHistory.objects.create(user=self.user, question="cough", answer="Drink water")
+
+        self.assertEqual(self._search("malaria"), {"malaria fever"})
+        self.assertEqual(self._search("nets"), {"malaria fever"})
+        # FTS5 syntax in user input is quoted, not interpreted
+        self.assertEqual(self._search('malaria" OR cough'), set())
+        self.assertEqual(self._search("***"), set())
+
+    def test_triggers_keep_the_search_index_in_sync(self):
+        chat = ChatHistory.objects.create(user=self.user, question="malaria", answer="nets")
+        self.assertEqual(self._search("malaria"), {"malaria"})
+
+        chat.question = "dengue"
+        chat.save()
+        self.assertEqual(self._search("malaria"), set())
+        self.assertEqual(self._search("dengue"), {"dengue"})
+
+        chat.delete()
+        self.assertEqual(self._search("dengue"), set())
+
+
+class VillagerHistoryViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "2", role="health_worker"
+        )
+
+    def test_renders_a_page_with_an_older_link(self):
+        for i in range(21):
+            ChatHistory.objects.create(user=self.villager, question=f"q{i}", answer="a")
+        self.client.force_login(self.worker)
+
+        response = self.client.get(
+            reverse("chat:villager_history"), {"villager": self.villager.pk}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "chat/villager_history.html")
+        self.assertEqual(len(response.context["chats"]), 20)
+        self.assertContains(response, f"after={response.context['page'].next_cursor}")
+
+    def test_villagers_are_redirected(self):
+        self.client.force_login(self.villager)
+        response = self.client.get(reverse("chat:villager_history"))
+        self.assertRedirects(response, reverse("chat:index"), fetch_redirect_response=False)
+
+
+class StreamChatExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "1"
+        )
+        cls.first = ChatHistory.objects.create(
+            user=cls.user, question="Fever, cough?", answer='Rest and "fluids"'
+        )
+        cls.second = ChatHistory.objects.create(
+            user=cls.user, question="ज्वरो", answer="पानी पिउनुहोस्"
+        )
+
+    def _export(self, **kwargs):
+        response = utils.stream_chat_export(ChatHistory.objects.all(), "history", **kwargs)
+        # Streaming responses are lazy: the queries run while consuming
+        with self.assertNumQueries(1):
+            body = b"".join(response.streaming_content)
+        return response, body
+
+    def test_txt(self):
+        response, body = self._export()
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertIn('filename="history.txt"', response["Content-Disposition"])
+        text = body.decode()
+        self.assertLess(text.index("You: Fever, cough?"), text.index("You: ज्वरो"))
+        self.assertNotIn("User: ram", text)
+
+        _, body = self._export(include_user=True)
+        self.assertIn("User: ram\n", body.decode())
+        self.assertIn("Question: Fever, cough?", body.decode())
+
+    def test_csv(self):
+        response, body = self._export(fmt="csv", include_user=True)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], ["User", "Date", "Question", "Answer"])
+        self.assertEqual(
+            [row[2:] for row in rows[1:]],
+            [["Fever, cough?", 'Rest and "fluids"'], ["ज्वरो", "पानी पिउनुहोस्"]],
+        )
+
+    def test_jsonl(self):
+        response, body = self._export(fmt="jsonl")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([r["question"] for r in records], ["Fever, cough?", "ज्वरो"])
+        self.assertNotIn("user", records[0])
+        self.assertEqual(records[0]["timestamp"], self.first.timestamp.isoformat())
+
+    def test_gzip(self):
+        response, body = self._export(fmt="jsonl", compress=True)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="history.jsonl.gz"', response["Content-Disposition"])
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(json.loads(lines[1])["answer"], "पानी पिउनुहोस्")
 
-# Create your tests here.
+    def test_unknown_format_falls_back_to_txt(self):
+        response, _ = self._export(fmt="xml")
+        self.assertIn('filename="history.txt"', response["Content-Disposition"])
@@ -0,0 +1,265 @@
+import base64
+import binascii
+import csv
+import json
+import re
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
+
+from rural_health_assistant.exports import Echo
+
+from .models import ChatHistory
+
+# Name of the SQLite FTS5 shadow table created by chat/migrations/0002.
+SQLITE_FTS_TABLE = "chat_chathistory_fts"
+
+# Postgres text-search config shared by the GIN index and the query side.
+# "simple" avoids English stemming so Nepali/Devanagari text is indexed as-is.
+SEARCH_CONFIG = "simple"
+
+
+def chat_search_vector():
+    """Expression indexed by the GIN index; queries must use the same one."""
+    return SearchVector("question", "answer", config=SEARCH_CONFIG)
+
+
+@lru_cache(maxsize=1)
+def _sqlite_fts_available():
+    with connection.cursor() as cursor:
+        return SQLITE_FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def _fts5_query(search_query):
+    """Quote every term so user input can't inject FTS5 query syntax."""
+    terms = re.findall(r"\w+", search_query)
+    return " ".join('"%s"' % term for term in terms)
+
+
+def chat_search_q(search_query):
+    """
+    Build a Q object matching chats whose question or answer contains
+    `search_query`.
+
+    Uses the Postgres GIN-indexed tsvector or the SQLite FTS5 table when
+    available so the search does not scan every row; other backends fall
+    back to icontains.
+    """
+    if connection.vendor == "postgresql":
+        matching_ids = (
+            ChatHistory.objects.annotate(search=chat_search_vector())
+            .filter(search=SearchQuery(search_query, config=SEARCH_CONFIG))
+            .values("id")
+        )
+        return Q(id__in=matching_ids)
+
+    if connection.vendor == "sqlite" and _sqlite_fts_available():
+        fts_query = _fts5_query(search_query)
+        if fts_query:
+            return Q(
+                id__in=RawSQL(
+                    f"SELECT rowid FROM {SQLITE_FTS_TABLE} "
+                    f"WHERE {SQLITE_FTS_TABLE} MATCH %s",
+                    [fts_query],
+                )
+            )
+
+    return Q(question__icontains=search_query) | Q(answer__icontains=search_query)
+
+
+####################
+# Keyset pagination
+####################
+class KeysetPage:
+    """
+    One page of a (-timestamp, -id) ordered ChatHistory queryset.
+
+    Unlike Paginator this never runs COUNT(*) or OFFSET, so the cost of a
+    page load does not depend on how many chats are in the table.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def encode_cursor(chat):
+    raw = f"{chat.timestamp.isoformat()}|{chat.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) for a cursor, or None if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, pk = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def paginate_chats(queryset, after=None, before=None, per_page=20):
+    """
+    Keyset-paginate `queryset` newest first.
+
+    `after` fetches the page older than the cursor, `before` the page newer
+    than it. Backed by the (user, -timestamp, -id) and (-timestamp, -id)
+    indexes on ChatHistory.
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+
+    if before_key:
+        timestamp, pk = before_key
+        rows = list(
+            queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            ).order_by("timestamp", "id")[: per_page + 1]
+        )
+        has_more_newer = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        next_cursor = encode_cursor(rows[-1]) if rows else None
+        previous_cursor = encode_cursor(rows[0]) if rows and has_more_newer else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    page_qs = queryset
+    if after_key:
+        timestamp, pk = after_key
+        page_qs = page_qs.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+        )
+
+    rows = list(page_qs.order_by("-timestamp", "-id")[: per_page + 1])
+    has_more_older = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(rows[-1]) if rows and has_more_older else None
+    previous_cursor = encode_cursor(rows[0]) if rows and after_key else None
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+####################
+# Streaming export
+####################
+EXPORT_FORMATS = {
+    "txt": ("text/plain", "txt"),
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def _export_rows(chats):
+    """Yield (timestamp, username, question, answer) in one joined query."""
+    return (
+        chats.order_by("timestamp", "id")
+        .values_list("timestamp", "user__username", "question", "answer")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def _render_txt(rows, include_user):
+    for timestamp, username, question, answer in rows:
+        parts = [f"\n{'=' * 50}\n"]
+        if include_user:
+            parts.append(f"User: {username}\n")
+        parts.append(f"Date: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        if include_user:
+            parts.append(f"Question: {question}\n")
+            parts.append(f"Answer: {answer}\n")
+        else:
+            parts.append(f"You: {question}\n")
+            parts.append(f"Bot: {answer}\n")
+        yield "".join(parts)
+
+
+def _render_csv(rows, include_user):
+    writer = csv.writer(Echo())
+    header = ["Date", "Question", "Answer"]
+    if include_user:
+        header.insert(0, "User")
+    yield writer.writerow(header)
+    for timestamp, username, question, answer in rows:
+        row = [timestamp.strftime("%Y-%m-%d %H:%M:%S"), question, answer]
+        if include_user:
+            row.insert(0, username)
+        yield writer.writerow(row)
+
+
+def _render_jsonl(rows, include_user):
+    for timestamp, username, question, answer in rows:
+        record = {
+            "timestamp": timestamp.isoformat(),
+            "question": question,
+            "answer": answer,
+        }
+        if include_user:
+            record["user"] = username
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+_RENDERERS = {"txt": _render_txt, "csv": _render_csv, "jsonl": _render_jsonl}
+
+
+def _gzip_stream(chunks):
+    # wbits=31 -> gzip container, so the output is a valid .gz file
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_chat_export(chats, filename, fmt="txt", compress=False, include_user=False):
+    """
+    Return a StreamingHttpResponse exporting `chats` as txt, csv or jsonl.
+
+    Rows are read with a server-side iterator and rendered one at a time,
+    so memory use stays flat no matter how large the export is.
+    """
+    if fmt not in EXPORT_FORMATS:
+        fmt = "txt"
+    content_type, extension = EXPORT_FORMATS[fmt]
+
+    chunks = _RENDERERS[fmt](_export_rows(chats), include_user)
+    filename = f"{filename}.{extension}"
+    if compress:
+        chunks = _gzip_stream(chunks)
+        filename += ".gz"
+        content_type = "application/gzip"
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -5,18 +5,35 @@ from datetime import datetime, timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Q
+from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 
 from .models import ChatHistory
 from .forms import ChatForm
+from .utils import chat_search_q, paginate_chats, stream_chat_export
 # from rag_components.rag_chain import get_rag_response
 from rag_components.llm_and_rag import get_rag_response
 from accounts.models import Account as User
 
 
+def _filter_chats(chats, request):
+    """Apply the ?date= and ?search= filters shared by the history/export views."""
+    date_filter = request.GET.get('date', '')
+    if date_filter:
+        try:
+            filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
+            next_day = filter_date + timedelta(days=1)
+            chats = chats.filter(timestamp__gte=filter_date, timestamp__lt=next_day)
+        except ValueError:
+            pass
+
+    search_query = request.GET.get('search', '')
+    if search_query:
+        chats = chats.filter(chat_search_q(search_query))
+    return chats
+
+
 @login_required
 def index(request):
     # if hasattr(request.user, "is_health_worker") and request.user.is_health_worker:
@@ -63,7 +80,8 @@ def send_message(request):
             response = get_rag_response(
                 question=question,
                 chat_history=chat_history_text,
-                user_name=user_name
+                user_name=user_name,
+                audience="health_worker" if request.user.role == "health_worker" else "villager",
             )
 
             chat_history = ChatHistory.objects.create(
@@ -95,23 +113,17 @@ def chat_history(request):
     # if hasattr(request.user, "is_health_worker") and request.user.is_health_worker:
     #     return redirect('documents:dashboard')
 
-    chats = ChatHistory.objects.filter(user=request.user).order_by('-timestamp')
-
     search_query = request.GET.get('search', '')
-    if search_query:
-        chats = chats.filter(Q(question__icontains=search_query) | Q(answer__icontains=search_query))
-
     date_filter = request.GET.get('date', '')
-    if date_filter:
-        try:
-            filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-            next_day = filter_date + timedelta(days=1)
-            chats = chats.filter(timestamp__gte=filter_date, timestamp__lt=next_day)
-        except ValueError:
-            pass
+    chats = _filter_chats(ChatHistory.objects.filter(user=request.user), request)
+
+    page = paginate_chats(
+        chats, after=request.GET.get('after'), before=request.GET.get('before')
+    )
 
     context = {
-        'chats': chats,
+        'chats': page,
+        'page': page,
         'search_query': search_query,
         'date_filter': date_filter,
     }
@@ -143,17 +155,15 @@ def export_chat_history(request):
     # if hasattr(request.user, "is_health_worker") and request.user.is_health_worker:
     #     return redirect('documents:dashboard')
 
-    chats = ChatHistory.objects.filter(user=request.user).order_by('timestamp')
-    response = HttpResponse(content_type='text/plain')
-    response['Content-Disposition'] = f'attachment; filename="chat_history_{request.user.username}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.txt"'
+    chats = _filter_chats(ChatHistory.objects.filter(user=request.user), request)
 
-    for chat in chats:
-        response.write(f"\n{'='*50}\n")
-        response.write(f"Date: {chat.timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        response.write(f"You: {chat.question}\n")
-        response.write(f"Bot: {chat.answer}\n")
-
-    return response
+    filename = f"chat_history_{request.user.username}_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
+    return stream_chat_export(
+        chats,
+        filename,
+        fmt=request.GET.get('format', 'txt'),
+        compress=request.GET.get('gzip') == '1',
+    )
 
 
 @login_required
@@ -162,7 +172,7 @@ def villager_history(request):
         return redirect('chat:index')
 
     villagers = User.objects.filter(role='villager')
-    chats = ChatHistory.objects.all().order_by('-timestamp')
+    chats = ChatHistory.objects.select_related('user')
 
     villager_id = request.GET.get('villager', '')
     date_filter = request.GET.get('date', '')
@@ -170,21 +180,16 @@ def villager_history(request):
 
     if villager_id:
         chats = chats.filter(user_id=villager_id)
+    chats = _filter_chats(chats, request)
 
-    if date_filter:
-        try:
-            filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-            next_day = filter_date + timedelta(days=1)
-            chats = chats.filter(timestamp__gte=filter_date, timestamp__lt=next_day)
-        except ValueError:
-            pass
-
-    if search_query:
-        chats = chats.filter(Q(question__icontains=search_query) | Q(answer__icontains=search_query))
+    page = paginate_chats(
+        chats, after=request.GET.get('after'), before=request.GET.get('before')
+    )
 
     context = {
         'villagers': villagers,
-        'chats': chats,
+        'chats': page,
+        'page': page,
         'villager_id': villager_id,
         'date_filter': date_filter,
         'search_query': search_query,
@@ -198,40 +203,24 @@ def export_villager_history(request):
         return redirect('chat:index')
 
     villager_id = request.GET.get('villager', '')
-    date_filter = request.GET.get('date', '')
-    search_query = request.GET.get('search', '')
-
-    chats = ChatHistory.objects.all().order_by('timestamp')
 
+    chats = ChatHistory.objects.all()
     if villager_id:
         chats = chats.filter(user_id=villager_id)
+    chats = _filter_chats(chats, request)
 
-    if date_filter:
-        try:
-            filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-            next_day = filter_date + timedelta(days=1)
-            chats = chats.filter(timestamp__gte=filter_date, timestamp__lt=next_day)
-        except ValueError:
-            pass
-
-    if search_query:
-        chats = chats.filter(Q(question__icontains=search_query) | Q(answer__icontains=search_query))
-
-    response = HttpResponse(content_type='text/plain')
     filename = f"villager_chat_history_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
     if villager_id:
         try:
             villager = User.objects.get(id=villager_id)
             filename = f"{villager.username}_chat_history_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
-        except User.DoesNotExist:
+        except (User.DoesNotExist, ValueError):
             pass
-    response['Content-Disposition'] = f'attachment; filename="{filename}.txt"'
-
-    for chat in chats:
-        response.write(f"\n{'='*50}\n")
-        response.write(f"User: {chat.user.username}\n")
-        response.write(f"Date: {chat.timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        response.write(f"Question: {chat.question}\n")
-        response.write(f"Answer: {chat.answer}\n")
 
-    return response
+    return stream_chat_export(
+        chats,
+        filename,
+        fmt=request.GET.get('format', 'txt'),
+        compress=request.GET.get('gzip') == '1',
+        include_user=True,
+    )
@@ -1,8 +1,11 @@
-from django.core.mail import send_mail, EmailMessage
+from textwrap import dedent
+
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
+from rural_health_assistant.mailer import queue_email
+
 
 def send_enquiry_notification_to_admin(enquiry):
     """Send email notification to all admin users when a new enquiry is submitted"""
@@ -67,17 +70,10 @@ def send_enquiry_notification_to_admin(enquiry):
     """
     
     try:
-        email = EmailMessage(
-            subject=subject,
-            body=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=admin_emails,
-        )
-        email.content_subtype = 'html'
-        email.send(fail_silently=False)
+        queue_email(subject, dedent(plain_message).strip(), admin_emails, html_body=html_message)
         return True
     except Exception as e:
-        print(f"Error sending admin notification: {e}")
+        print(f"Error queueing admin notification: {e}")
         return False
 
 
@@ -160,17 +156,10 @@ def send_response_to_user(enquiry):
     """
     
     try:
-        email = EmailMessage(
-            subject=subject,
-            body=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[enquiry.email],
-        )
-        email.content_subtype = 'html'
-        email.send(fail_silently=False)
+        queue_email(subject, dedent(plain_message).strip(), [enquiry.email], html_body=html_message)
         return True
     except Exception as e:
-        print(f"Error sending user response: {e}")
+        print(f"Error queueing user response: {e}")
         return False
 
 
@@ -245,15 +234,8 @@ def send_confirmation_to_user(enquiry):
     """
     
     try:
-        email = EmailMessage(
-            subject=subject,
-            body=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[enquiry.email],
-        )
-        email.content_subtype = 'html'
-        email.send(fail_silently=False)
+        queue_email(subject, dedent(plain_message).strip(), [enquiry.email], html_body=html_message)
         return True
     except Exception as e:
-        print(f"Error sending confirmation: {e}")
+        print(f"Error queueing confirmation: {e}")
         return False
@@ -0,0 +1,31 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import JobRun, OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'priority', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'priority')
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status='sent').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{count} email(s) re-queued.')
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job', 'started_at', 'duration_ms', 'rows', 'succeeded')
+    list_filter = ('job', 'succeeded')
+    readonly_fields = ('job', 'started_at', 'duration_ms', 'rows', 'details', 'succeeded', 'error')
+    ordering = ('-started_at',)
+
+    def has_add_permission(self, request):
+        return False
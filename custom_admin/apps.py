@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CustomAdminConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "custom_admin"
+
+    def ready(self):
+        # Dashboard snapshot cache invalidation (see rural_health_assistant/metrics.py)
+        from rural_health_assistant import metrics, rollups
+
+        metrics.connect_signals()
+        # Incremental maintenance of the DailyMetric trend rollups
+        rollups.connect_signals()
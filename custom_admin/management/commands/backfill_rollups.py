@@ -0,0 +1,62 @@
+"""
+Management command to (re)build the daily trend rollups
+Usage: python manage.py backfill_rollups [--metric appointments] [--days 365]
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rural_health_assistant.rollups import ROLLUPS, date_bounds, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyMetric rollups from the raw tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--metric',
+            action='append',
+            choices=sorted(ROLLUPS),
+            help='Metric to rebuild (repeatable; default: all)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Only rebuild the last N days (default: full history)',
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=90,
+            help='Days rebuilt per transaction (default: 90)',
+        )
+
+    def handle(self, *args, **options):
+        metrics = options['metric'] or list(ROLLUPS)
+        chunk = options['chunk_days']
+        if chunk < 1:
+            raise CommandError('--chunk-days must be at least 1')
+
+        today = timezone.localdate()
+        for metric in metrics:
+            first, last = date_bounds(metric)
+            if first is None:
+                self.stdout.write(f"   {metric}: no data, skipped")
+                continue
+            if options['days']:
+                start = today - timedelta(days=options['days'] - 1)
+            else:
+                start = first
+            # Scheduled appointments can lie in the future
+            end = max(today, last)
+
+            rows = 0
+            chunk_start = start
+            while chunk_start <= end:
+                chunk_end = min(chunk_start + timedelta(days=chunk - 1), end)
+                rows += rebuild_rollups(metric, chunk_start, chunk_end)
+                chunk_start = chunk_end + timedelta(days=1)
+            self.stdout.write(f"   {metric}: {start} → {end}, {rows} rows")
+
+        self.stdout.write(self.style.SUCCESS('✅ Rollups rebuilt'))
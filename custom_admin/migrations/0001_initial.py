@@ -0,0 +1,40 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyMetric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("metric", models.CharField(max_length=50)),
+                ("dimension", models.CharField(blank=True, default="", max_length=50)),
+                ("value", models.CharField(blank=True, default="", max_length=50)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("metric", "dimension", "value", "date"),
+                        name="daily_metric_unique",
+                    )
+                ],
+            },
+        ),
+    ]
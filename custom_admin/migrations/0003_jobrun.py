@@ -0,0 +1,41 @@
+# Generated by Django 5.2.13 on 2026-10-19 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("custom_admin", "0002_outboundemail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job", models.CharField(max_length=100)),
+                ("started_at", models.DateTimeField()),
+                ("duration_ms", models.PositiveIntegerField(default=0)),
+                ("rows", models.PositiveIntegerField(default=0)),
+                ("details", models.JSONField(blank=True, default=dict)),
+                ("succeeded", models.BooleanField(default=True)),
+                ("error", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["job", "-started_at"], name="jobrun_job_started_idx"
+                    )
+                ],
+            },
+        ),
+    ]
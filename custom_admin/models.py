@@ -0,0 +1,97 @@
+from django.db import models
+from django.utils import timezone
+
+
+class DailyMetric(models.Model):
+    """
+    Pre-aggregated daily counts for the dashboard trend charts.
+
+    One row per (date, metric, dimension, value). The overall total for a
+    metric is stored with an empty dimension and value; breakdowns use e.g.
+    dimension="status", value="pending" or dimension="healthworker",
+    value="<user id>". Maintained by rural_health_assistant/rollups.py.
+    """
+
+    date = models.DateField()
+    metric = models.CharField(max_length=50)
+    dimension = models.CharField(max_length=50, blank=True, default="")
+    value = models.CharField(max_length=50, blank=True, default="")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "dimension", "value", "date"],
+                name="daily_metric_unique",
+            ),
+        ]
+
+    def __str__(self):
+        label = f"{self.metric}[{self.dimension}={self.value}]" if self.dimension else self.metric
+        return f"{label} {self.date}: {self.count}"
+
+
+class OutboundEmail(models.Model):
+    """
+    A queued email. Views and tasks enqueue rows with
+    rural_health_assistant.mailer.queue_email(); the drain_email_outbox task
+    sends due rows in batches over one SMTP connection and reschedules
+    failures with exponential backoff.
+    """
+
+    PRIORITY_URGENT = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_BULK = 9
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default="")
+    from_email = models.CharField(max_length=254, blank=True, default="")
+    to = models.JSONField(default=list)
+    priority = models.PositiveSmallIntegerField(default=PRIORITY_NORMAL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "priority", "next_attempt_at"],
+                name="outbox_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.status})"
+
+
+class JobRun(models.Model):
+    """
+    One run of a periodic job: when it started, how long it took and the
+    row counts it reported. Written by rural_health_assistant.jobs.track_job.
+    """
+
+    job = models.CharField(max_length=100)
+    started_at = models.DateTimeField()
+    duration_ms = models.PositiveIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+    details = models.JSONField(default=dict, blank=True)
+    succeeded = models.BooleanField(default=True)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["job", "-started_at"], name="jobrun_job_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.job} @ {self.started_at:%Y-%m-%d %H:%M}: {self.rows} rows in {self.duration_ms} ms"
@@ -0,0 +1,155 @@
+"""
+Compare chunking configurations on the document corpus.
+
+Usage:
+    python manage.py benchmark_chunking
+    python manage.py benchmark_chunking --config 128:window --config 200:window \
+        --config 256:40 --questions eval.jsonl --k 3
+
+A config is CHUNK_TOKENS:CHUNK_OVERLAP (overlap "window" or a token count).
+Each one is ingested into a throwaway in-memory collection with the
+configured embedding model and reported with its index size (chunks,
+tokens, stored text, vector bytes), chunking and embedding time, and
+recall@k: the share of questions whose expected text appears in one of the
+top k chunks (with their sentence window).
+
+--questions is a JSONL file of {"question": ..., "expected": ...}. Without
+it, --probes sentences sampled from the corpus are used as their own
+queries, which only compares configurations against each other.
+"""
+import json
+import os
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from langchain_chroma import Chroma
+
+from rag_components import chunking
+from rag_components.vector_store_update import (
+    LOADERS,
+    get_embeddings,
+    iter_file_with_metadata,
+)
+
+DEFAULT_CONFIGS = ["1000c:200c", "128:window", "200:window", "256:window", "200:40"]
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+class Command(BaseCommand):
+    help = "Benchmark index size, ingest time and recall@k across chunk configurations"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="Files or directories (default: uploads)")
+        parser.add_argument(
+            "--config",
+            action="append",
+            dest="configs",
+            help="TOKENS:OVERLAP, e.g. 200:window or 256:40. "
+            "1000c:200c is the old character splitter. Repeatable.",
+        )
+        parser.add_argument("--questions", help="JSONL file of question/expected pairs")
+        parser.add_argument("--probes", type=int, default=50)
+        parser.add_argument("--k", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        sections = self._load_sections(options["paths"])
+        if not sections:
+            raise CommandError("No supported documents found")
+        questions = self._questions(options, sections)
+        self.stdout.write(
+            f"{len(sections)} sections, {len(questions)} questions, k={options['k']}\n"
+        )
+
+        embeddings = get_embeddings()
+        dimension = len(embeddings.embed_query("dimension probe"))
+
+        self.stdout.write(
+            f"{'config':<14}{'chunks':>8}{'tokens':>10}{'text MB':>9}{'vec MB':>8}"
+            f"{'chunk s':>9}{'embed s':>9}{'recall@k':>10}"
+        )
+        for config in options["configs"] or DEFAULT_CONFIGS:
+            chunks, chunk_seconds = self._chunk(sections, config)
+            store = Chroma(
+                collection_name=f"bench_{uuid.uuid4().hex[:8]}",
+                embedding_function=embeddings,
+            )
+            try:
+                started = time.perf_counter()
+                for start in range(0, len(chunks), 256):
+                    store.add_documents(chunks[start : start + 256])
+                embed_seconds = time.perf_counter() - started
+                recall = self._recall(store, questions, options["k"])
+            finally:
+                store.delete_collection()
+
+            tokens = sum(chunking.count_tokens(c.page_content) for c in chunks)
+            text_mb = sum(len(c.page_content.encode()) for c in chunks) / 1e6
+            vector_mb = len(chunks) * dimension * 4 / 1e6
+            self.stdout.write(
+                f"{config:<14}{len(chunks):>8}{tokens:>10}{text_mb:>9.2f}{vector_mb:>8.2f}"
+                f"{chunk_seconds:>9.2f}{embed_seconds:>9.2f}{recall:>10.2%}"
+            )
+
+    def _load_sections(self, paths):
+        paths = paths or [os.path.join(settings.MEDIA_ROOT, "documents")]
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+            else:
+                files.append(path)
+        sections = []
+        for path in files:
+            if os.path.splitext(path)[1].lower() in LOADERS:
+                sections.extend(iter_file_with_metadata(path))
+        return sections
+
+    def _questions(self, options, sections):
+        if options["questions"]:
+            with open(options["questions"], encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        sentences = [
+            s
+            for section in sections
+            for s in chunking.split_sentences(section.page_content)
+            if len(s.split()) >= 6
+        ]
+        rng = random.Random(options["seed"])
+        probes = rng.sample(sentences, min(options["probes"], len(sentences)))
+        return [{"question": s, "expected": s} for s in probes]
+
+    def _chunk(self, sections, config):
+        size, _, overlap = config.partition(":")
+        started = time.perf_counter()
+        if size.endswith("c"):
+            # Baseline: the previous character-based splitter
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=int(size[:-1]), chunk_overlap=int(overlap.rstrip("c") or 0)
+            )
+            chunks = splitter.split_documents(sections)
+        else:
+            overlap = overlap or "window"
+            chunks = chunking.split_documents(
+                sections,
+                chunk_tokens=int(size),
+                overlap=overlap if overlap == "window" else int(overlap),
+            )
+        return chunks, time.perf_counter() - started
+
+    def _recall(self, store, questions, k):
+        hits = 0
+        for item in questions:
+            expected = _normalize(item["expected"])
+            found = store.similarity_search(item["question"], k=k)
+            if any(expected in _normalize(chunking.with_window(doc)) for doc in found):
+                hits += 1
+        return hits / len(questions) if questions else 0.0
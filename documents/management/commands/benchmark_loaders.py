@@ -0,0 +1,166 @@
+"""
+Measure document loader throughput per format.
+
+Usage:
+    python manage.py benchmark_loaders                 # files in MEDIA_ROOT/documents
+    python manage.py benchmark_loaders path/to/dir a.md
+    python manage.py benchmark_loaders --synthetic 2048  # generated 2 MB files
+
+Each file is parsed and split exactly as on upload (no embedding). The
+report shows extracted text MB/s and chunks per second; --memory adds a
+second, traced pass for the peak Python memory while parsing, which stays
+flat for the streaming loaders whatever the file size.
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from collections import defaultdict
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_components.vector_store_update import (
+    LOADERS,
+    iter_file_with_metadata,
+    split_documents,
+)
+
+SAMPLE_SECTION = [
+    ("heading", "Diarrhoea in children"),
+    ("text", "Give oral rehydration solution after every loose stool. "
+             "Continue breastfeeding and normal feeding. " * 4),
+    ("list", "Sunken eyes or no tears"),
+    ("list", "Drinks poorly or is not able to drink"),
+    ("list", "Blood in the stool"),
+    ("text", "Zinc tablets for 10-14 days shorten the illness. "
+             "Visit the health post if the child does not improve within two days. " * 3),
+]
+
+
+def _write_markdown(path, size):
+    with open(path, "w", encoding="utf-8") as f:
+        n = 0
+        while f.tell() < size:
+            n += 1
+            for kind, text in SAMPLE_SECTION:
+                if kind == "heading":
+                    f.write(f"\n## {text} {n}\n\n")
+                elif kind == "list":
+                    f.write(f"- {text}\n")
+                else:
+                    f.write(f"\n{text}\n\n")
+
+
+def _write_text(path, size):
+    with open(path, "w", encoding="utf-8") as f:
+        while f.tell() < size:
+            for _, text in SAMPLE_SECTION:
+                f.write(f"{text}\n\n")
+
+
+def _write_docx(path, size):
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("word/document.xml", "w") as xml:
+            xml.write(f'<w:document xmlns:w="{ns}"><w:body>'.encode())
+            written, n = 0, 0
+            while written < size:
+                n += 1
+                for kind, text in SAMPLE_SECTION:
+                    props = {
+                        "heading": '<w:pPr><w:pStyle w:val="Heading2"/></w:pPr>',
+                        "list": '<w:pPr><w:numPr><w:numId w:val="1"/></w:numPr></w:pPr>',
+                    }.get(kind, "")
+                    label = f"{text} {n}" if kind == "heading" else text
+                    xml.write(f"<w:p>{props}<w:r><w:t>{escape(label)}</w:t></w:r></w:p>".encode())
+                    written += len(label)
+            xml.write(b"</w:body></w:document>")
+
+
+SYNTHETIC = {".md": _write_markdown, ".txt": _write_text, ".docx": _write_docx}
+
+
+class Command(BaseCommand):
+    help = "Benchmark document loading and splitting throughput per file format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="Files or directories to load")
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            metavar="KB",
+            help="Generate one file of roughly this size per format and load it",
+        )
+        parser.add_argument("--repeat", type=int, default=1)
+        parser.add_argument(
+            "--memory", action="store_true", help="Also measure peak memory (slower)"
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = self._collect(options["paths"], options["synthetic"], tmp)
+            if not files:
+                raise CommandError("No supported files found")
+
+            results = defaultdict(lambda: defaultdict(float))
+            for _ in range(options["repeat"]):
+                for path in files:
+                    ext = os.path.splitext(path)[1].lower()
+                    result = results[ext]
+                    result["files"] += 1
+                    result["bytes"] += os.path.getsize(path)
+                    self._measure(path, result)
+                    if options["memory"]:
+                        result["peak"] = max(result["peak"], self._peak_memory(path))
+
+        self.stdout.write(
+            f"{'format':<8}{'files':>6}{'file MB':>9}{'text MB':>9}{'sections':>10}"
+            f"{'chunks':>9}{'seconds':>9}{'MB/s':>8}{'chunks/s':>10}{'peak KB':>9}"
+        )
+        for ext, r in sorted(results.items()):
+            text_mb = r["chars"] / 1e6
+            seconds = r["seconds"] or 1e-9
+            peak = f"{r['peak'] / 1024:.0f}" if options["memory"] else "-"
+            self.stdout.write(
+                f"{ext:<8}{int(r['files']):>6}{r['bytes'] / 1e6:>9.2f}{text_mb:>9.2f}"
+                f"{int(r['sections']):>10}{int(r['chunks']):>9}{seconds:>9.2f}"
+                f"{text_mb / seconds:>8.2f}{r['chunks'] / seconds:>10.0f}{peak:>9}"
+            )
+
+    def _collect(self, paths, synthetic_kb, tmp):
+        if synthetic_kb:
+            files = []
+            for ext, write in SYNTHETIC.items():
+                path = os.path.join(tmp, f"sample{ext}")
+                write(path, synthetic_kb * 1024)
+                files.append(path)
+            return files
+
+        paths = paths or [os.path.join(settings.MEDIA_ROOT, "documents")]
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+            else:
+                files.append(path)
+        return [f for f in files if os.path.splitext(f)[1].lower() in LOADERS]
+
+    def _measure(self, path, result):
+        started = time.perf_counter()
+        for section in iter_file_with_metadata(path):
+            result["sections"] += 1
+            result["chars"] += len(section.page_content)
+            result["chunks"] += len(split_documents([section]))
+        result["seconds"] += time.perf_counter() - started
+
+    def _peak_memory(self, path):
+        tracemalloc.start()
+        try:
+            for section in iter_file_with_metadata(path):
+                split_documents([section])
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
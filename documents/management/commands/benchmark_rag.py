@@ -0,0 +1,142 @@
+"""
+Replay a question set through the chat pipeline and report latency per
+graph node, LLM tokens, retrieval recall@k, routes and cache hit rates.
+
+Usage:
+    python manage.py benchmark_rag
+    python manage.py benchmark_rag --questions eval.jsonl --repeat 3 --output after.json
+    python manage.py benchmark_rag --set RETRIEVER_K=5 --compare before.json
+    python manage.py benchmark_rag --corpus docs/ --set CHUNK_TOKENS=128
+
+The LLM and web search are deterministic fakes, so runs cost nothing and
+differences between two runs come from retrieval, prompts and settings
+(see rag_components/evaluation.py). Without --questions a small bundled set
+(rag_components/eval_questions.jsonl) checks routing only.
+
+--corpus indexes the given files or directories into a throwaway index
+with the current settings instead of querying the live index, so chunking
+changes can be compared. --set overrides a RAG_CONFIG key for the run
+(values are parsed as JSON when possible). --compare prints each headline
+metric next to a previous --output file.
+"""
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from rag_components import evaluation
+from rag_components.vector_store_update import LOADERS, add_file_to_vector_db
+
+DEFAULT_QUESTIONS = os.path.join(
+    os.path.dirname(evaluation.__file__), "eval_questions.jsonl"
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the RAG chat pipeline offline with a fake LLM"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="JSONL question set")
+        parser.add_argument("--repeat", type=int, default=1)
+        parser.add_argument("--audience", choices=["villager", "health_worker"])
+        parser.add_argument("--corpus", nargs="+", help="Files or directories to index first")
+        parser.add_argument(
+            "--set",
+            action="append",
+            default=[],
+            dest="overrides",
+            metavar="KEY=VALUE",
+            help="Override a RAG_CONFIG key. Repeatable.",
+        )
+        parser.add_argument("--output", help="Write the JSON results here")
+        parser.add_argument("--compare", help="Earlier JSON results to compare against")
+
+    def handle(self, *args, **options):
+        questions = evaluation.load_questions(options["questions"])
+        if not questions:
+            raise CommandError(f"No questions in {options['questions']}")
+
+        config = dict(getattr(settings, "RAG_CONFIG", {}))
+        for override in options["overrides"]:
+            key, sep, value = override.partition("=")
+            if not sep:
+                raise CommandError(f"--set expects KEY=VALUE, got {override!r}")
+            try:
+                config[key] = json.loads(value)
+            except json.JSONDecodeError:
+                config[key] = value
+
+        with tempfile.TemporaryDirectory() as tmp:
+            if options["corpus"]:
+                config["VECTOR_DB_PATH"] = tmp
+            with override_settings(RAG_CONFIG=config):
+                if options["corpus"]:
+                    self._index(options["corpus"])
+                result = evaluation.run_benchmark(
+                    questions, repeat=options["repeat"], audience=options["audience"]
+                )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+        self._print(result)
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                self._print_comparison(result, json.load(f))
+
+    def _index(self, paths):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+            else:
+                files.append(path)
+        files = [f for f in files if os.path.splitext(f)[1].lower() in LOADERS]
+        for path in files:
+            add_file_to_vector_db(path, doc_id=os.path.basename(path), source_name=os.path.basename(path))
+        self.stdout.write(f"Indexed {len(files)} files into a temporary index")
+
+    def _print(self, result):
+        out = self.stdout.write
+        summary = result["summary"]
+        out(self.style.SUCCESS(f"{summary['questions']} questions, {summary['runs']} runs"))
+        out("Config: " + ", ".join(f"{k}={v}" for k, v in result["config"].items()))
+
+        out(f"\n{'node':<28}{'avg ms':>10}{'p95 ms':>10}{'tokens in':>11}{'tokens out':>11}")
+        tokens = summary["tokens"]
+        latency = summary["latency"]
+        for node, ms in latency["nodes"].items():
+            used = tokens.get(node, {"in": 0, "out": 0})
+            out(f"{node:<28}{ms['avg_ms']:>10.1f}{ms['p95_ms']:>10.1f}{used['in']:>11.1f}{used['out']:>11.1f}")
+        out(f"{'total':<28}{latency['total']['avg_ms']:>10.1f}{latency['total']['p95_ms']:>10.1f}")
+
+        recall = summary["recall_at_k"]
+        if recall["recall"] is None:
+            out("\nRecall@k: no questions with expected text or documents")
+        else:
+            out(f"\nRecall@{recall['k']}: {recall['recall']:.2%} of {recall['judged']} questions")
+        routes = ", ".join(f"{route} {share:.0%}" for route, share in summary["routes"].items())
+        out(f"Routes: {routes}")
+        if summary["route_accuracy"] is not None:
+            out(f"Route accuracy: {summary['route_accuracy']:.2%}")
+        for label, counts in summary["caches"].items():
+            out(
+                f"Cache {label}: {counts['hit_rate']:.0%} hits "
+                f"({counts['hits']} hits, {counts['misses']} misses)"
+            )
+
+    def _print_comparison(self, result, baseline):
+        self.stdout.write(f"\n{'metric':<40}{'baseline':>12}{'current':>12}")
+        for metric, before, after in evaluation.compare(result, baseline):
+            self.stdout.write(f"{metric:<40}{_fmt(before):>12}{_fmt(after):>12}")
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
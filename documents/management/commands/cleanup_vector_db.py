@@ -1,14 +1,32 @@
 """
-Management command to clean up orphaned vectors in ChromaDB
-Usage: python manage.py cleanup_vector_db
+Management command to reconcile ChromaDB with the Document table
+Usage:
+    python manage.py cleanup_vector_db
+    python manage.py cleanup_vector_db --dry-run
+    python manage.py cleanup_vector_db --reindex --workers 4
+
+Finds orphaned vectors (chunks of deleted documents) and deletes them in
+batches, and documents with no vectors at all, which --reindex indexes
+again in parallel. The index is read in pages of metadata only, so this
+works on collections with millions of chunks.
 """
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from django.core.management.base import BaseCommand
+
 from documents.models import Document
-from rag_components.vector_store_update import get_vector_store, delete_document_vectors_by_doc_id
+from documents.utils import index_sources
+from rag_components.vector_store_update import (
+    DELETE_BATCH_SIZE,
+    SCAN_PAGE_SIZE,
+    add_file_to_vector_db,
+    count_chunks_by_doc,
+    delete_doc_ids,
+)
 
 
 class Command(BaseCommand):
-    help = 'Clean up orphaned vectors in ChromaDB for deleted documents'
+    help = 'Reconcile ChromaDB with documents: delete orphaned vectors, find unindexed documents'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,55 +34,115 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be deleted without actually deleting',
         )
+        parser.add_argument(
+            '--reindex',
+            action='store_true',
+            help='Index documents that have no vectors',
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Parallel re-index workers')
+        parser.add_argument('--page-size', type=int, default=SCAN_PAGE_SIZE)
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE)
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        
+
         self.stdout.write(self.style.SUCCESS('🔍 Scanning for orphaned vectors...'))
-        
-        # Get all existing document IDs
-        existing_doc_ids = set(str(doc.pk) for doc in Document.objects.all())
-        self.stdout.write(f"   Found {len(existing_doc_ids)} documents in database")
-        
-        # Get all doc_ids in vector store
-        vs = get_vector_store()
-        collection = vs._collection
-        all_vectors = collection.get()
-        
-        vector_doc_ids = set()
-        if all_vectors['metadatas']:
-            for metadata in all_vectors['metadatas']:
-                doc_id = metadata.get('doc_id')
-                if doc_id:
-                    vector_doc_ids.add(doc_id)
-        
-        self.stdout.write(f"   Found {len(vector_doc_ids)} unique doc_ids in vector DB")
-        
-        # Find orphans
-        orphaned_doc_ids = vector_doc_ids - existing_doc_ids
-        
-        if not orphaned_doc_ids:
-            self.stdout.write(self.style.SUCCESS('✅ No orphaned vectors found! Vector DB is clean.'))
-            return
-        
+
+        # Documents at the start: only these can be "missing" vectors, since
+        # one uploaded during the scan is indexed by its own save()
+        doc_ids_before = self._existing_doc_ids()
+        self.stdout.write(f"   Found {len(doc_ids_before)} documents in database")
+
+        # Chunks per doc_id in the vector store, in one paged pass
+        counts = count_chunks_by_doc(page_size=options['page_size'])
+        untracked = counts.pop(None, 0)
+        self.stdout.write(
+            f"   Found {len(counts)} unique doc_ids in {sum(counts.values())} chunks in vector DB"
+        )
+        if untracked:
+            self.stdout.write(f"   {untracked} chunks have no doc_id (indexed outside Django)")
+
+        # Orphans are judged against the table as it is after the scan:
+        # Document.save() writes the row before indexing, so a document
+        # uploaded meanwhile has vectors and a row by now
+        orphaned_doc_ids = set(counts) - self._existing_doc_ids()
+        missing_doc_ids = doc_ids_before - set(counts)
+
+        if orphaned_doc_ids:
+            self._delete_orphans(orphaned_doc_ids, counts, dry_run, options['batch_size'])
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ No orphaned vectors found!'))
+
+        if missing_doc_ids:
+            self._report_missing(missing_doc_ids, dry_run, options)
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Every document has vectors!'))
+
+    def _existing_doc_ids(self, doc_ids=None):
+        """doc_ids (as str) with a Document row; all of them if doc_ids is None."""
+        documents = Document.objects.all()
+        if doc_ids is not None:
+            documents = documents.filter(pk__in=[int(d) for d in doc_ids if str(d).isdigit()])
+        return set(str(pk) for pk in documents.values_list('pk', flat=True))
+
+    def _delete_orphans(self, orphaned_doc_ids, counts, dry_run, batch_size):
         self.stdout.write(self.style.WARNING(f'⚠️  Found {len(orphaned_doc_ids)} orphaned document(s):'))
         for doc_id in sorted(orphaned_doc_ids):
-            # Count chunks for this doc_id
-            chunk_count = sum(1 for m in all_vectors['metadatas'] if m.get('doc_id') == doc_id)
-            self.stdout.write(f'   - doc_id={doc_id} ({chunk_count} chunks)')
-        
+            self.stdout.write(f'   - doc_id={doc_id} ({counts[doc_id]} chunks)')
+
         if dry_run:
             self.stdout.write(self.style.WARNING('\n🔍 DRY RUN: No deletions performed'))
             self.stdout.write('   Run without --dry-run to actually clean up')
-        else:
-            self.stdout.write(self.style.WARNING('\n🗑️  Deleting orphaned vectors...'))
-            deleted_count = 0
-            for doc_id in orphaned_doc_ids:
+            return
+
+        # Re-check right before deleting, in case a document was uploaded
+        # since the orphan set was built
+        orphaned_doc_ids = orphaned_doc_ids - self._existing_doc_ids(orphaned_doc_ids)
+        self.stdout.write(self.style.WARNING('\n🗑️  Deleting orphaned vectors...'))
+        try:
+            delete_doc_ids(orphaned_doc_ids, batch_size=batch_size)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'   ✗ Failed to delete orphaned vectors: {e}'))
+            return
+        chunks = sum(counts[doc_id] for doc_id in orphaned_doc_ids)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Cleaned up {len(orphaned_doc_ids)} orphaned document(s), {chunks} chunks'
+            )
+        )
+
+    def _report_missing(self, missing_doc_ids, dry_run, options):
+        self.stdout.write(self.style.WARNING(f'⚠️  Found {len(missing_doc_ids)} document(s) with no vectors:'))
+        for doc_id in sorted(missing_doc_ids, key=int):
+            self.stdout.write(f'   - doc_id={doc_id}')
+
+        if not options['reindex'] or dry_run:
+            self.stdout.write('   Run with --reindex to index them')
+            return
+
+        # Documents deleted since the scan are not indexed again
+        missing_doc_ids = self._existing_doc_ids(missing_doc_ids)
+        self.stdout.write(self.style.WARNING('\n📥 Re-indexing documents...'))
+        sources = [s for s in index_sources(self.stderr.write) if s.doc_id in missing_doc_ids]
+        indexed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(
+                    add_file_to_vector_db,
+                    s.file_path,
+                    doc_id=s.doc_id,
+                    source_name=s.source_name,
+                    metadata=s.metadata,
+                ): s.doc_id
+                for s in sources
+            }
+            for future in as_completed(futures):
+                doc_id = futures[future]
                 try:
-                    delete_document_vectors_by_doc_id(doc_id)
-                    deleted_count += 1
-                    self.stdout.write(self.style.SUCCESS(f'   ✓ Deleted vectors for doc_id={doc_id}'))
+                    future.result()
+                    indexed += 1
+                    self.stdout.write(self.style.SUCCESS(f'   ✓ Indexed doc_id={doc_id}'))
                 except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'   ✗ Failed to delete doc_id={doc_id}: {e}'))
-            
-            self.stdout.write(self.style.SUCCESS(f'\n✅ Cleaned up {deleted_count} orphaned document(s)'))
+                    self.stdout.write(self.style.ERROR(f'   ✗ Failed to index doc_id={doc_id}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Re-indexed {indexed} document(s)'))
@@ -0,0 +1,35 @@
+"""
+Rebuild one or all shards of the vector index from the Document table.
+
+Usage:
+    python manage.py rebuild_vector_shard maternal_health
+    python manage.py rebuild_vector_shard --all
+
+The shard keeps serving queries from its current collection while the new
+one is built; the switch is an atomic manifest update (see
+rag_components/sharding.py).
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.utils import index_sources
+from rag_components import sharding
+from rag_components.vector_store_update import get_vector_db_path, rebuild_shard
+
+
+class Command(BaseCommand):
+    help = "Rebuild vector index shards without taking them offline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("shards", nargs="*", help="Shard names")
+        parser.add_argument("--all", action="store_true", help="Rebuild every shard")
+
+    def handle(self, *args, **options):
+        shards = options["shards"]
+        if options["all"]:
+            shards = sharding.all_shards(get_vector_db_path()) or [sharding.DEFAULT_SHARD]
+        if not shards:
+            raise CommandError("Name the shards to rebuild, or pass --all")
+
+        for shard in shards:
+            count = rebuild_shard(shard, index_sources(self.stderr.write))
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt shard {shard}: {count} chunks"))
@@ -0,0 +1,100 @@
+"""
+Report the size, duplication and query performance of the vector index.
+
+Usage:
+    python manage.py vector_index_health
+    python manage.py vector_index_health --sample 5000 --probes 100 --k 5
+    python manage.py vector_index_health --questions eval.jsonl --json report.json
+
+Prints chunks per shard and per document, embedding dimension, disk size
+and HNSW parameters, near-duplicate chunk pairs among sampled chunks,
+average/p95 query latency over a probe set and recall@k of HNSW against
+an exact brute-force search (see rag_components/index_health.py).
+
+--questions is a JSONL file of {"question": ...} used as probes instead of
+sentences sampled from the index.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from documents.utils import document_titles
+from rag_components.index_health import collect_report
+
+
+class Command(BaseCommand):
+    help = "Profile the vector index: size, duplicates, query latency and HNSW recall"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=2000, help="Chunks sampled for duplicates")
+        parser.add_argument("--probes", type=int, default=50, help="Queries timed and checked")
+        parser.add_argument("--k", type=int)
+        parser.add_argument("--threshold", type=float, default=0.98, help="Duplicate cosine")
+        parser.add_argument("--questions", help="JSONL file of probe questions")
+        parser.add_argument("--top", type=int, default=20, help="Largest documents listed")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", dest="json_path", help="Also write the report here")
+
+    def handle(self, *args, **options):
+        questions = None
+        if options["questions"]:
+            with open(options["questions"], encoding="utf-8") as f:
+                questions = [json.loads(line)["question"] for line in f if line.strip()]
+
+        report = collect_report(
+            sample=options["sample"],
+            probes=options["probes"],
+            k=options["k"],
+            threshold=options["threshold"],
+            questions=questions,
+            seed=options["seed"],
+        )
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, default=str)
+        self._print(report, options["top"])
+
+    def _print(self, report, top):
+        out = self.stdout.write
+        out(self.style.SUCCESS(f"Vector index {report['path']}"))
+        out(
+            f"  {report['chunks']} chunks, {len(report['documents'])} documents, "
+            f"dimension {report['dimension']}, {report['disk_bytes'] / 1e6:.1f} MB on disk"
+        )
+        if report["untracked_chunks"]:
+            out(f"  {report['untracked_chunks']} chunks have no doc_id")
+
+        out("\nShards")
+        for shard in report["shards"]:
+            hnsw = ", ".join(f"{k}={v}" for k, v in sorted(shard["hnsw"].items()))
+            out(f"  {shard['shard']:<22}{shard['collection']:<32}{shard['chunks']:>8}  {hnsw}")
+
+        out(f"\nLargest documents (top {top})")
+        documents = report["documents"][:top]
+        titles = document_titles(doc_id for doc_id, _ in documents)
+        for doc_id, chunks in documents:
+            title = titles.get(doc_id, "(deleted)")
+            out(f"  {doc_id:>8}  {chunks:>7}  {title}")
+
+        duplicates = report["duplicates"]
+        out(
+            f"\nNear duplicates: {duplicates['pairs']} pairs with cosine >= "
+            f"{duplicates['threshold']} among {duplicates['sampled']} sampled chunks"
+        )
+        for pair in duplicates["examples"]:
+            a, b = pair["a"], pair["b"]
+            out(
+                f"  {pair['similarity']:.3f}  doc {a['doc_id']}#{a['chunk']} ~ "
+                f"doc {b['doc_id']}#{b['chunk']}: {a['text'][:60]!r}"
+            )
+
+        latency, recall = report["latency"], report["recall"]
+        out(f"\nQueries ({latency['probes']} probes, k={latency['k']})")
+        out(
+            f"  search avg {latency['search_avg_ms']:.1f} ms, p95 {latency['search_p95_ms']:.1f} ms; "
+            f"with embedding avg {latency['total_avg_ms']:.1f} ms, p95 {latency['total_p95_ms']:.1f} ms"
+        )
+        if recall["recall"] is None:
+            out("  recall: no probes")
+        else:
+            out(f"  HNSW recall@{recall['k']} vs exact search: {recall['recall']:.2%}")
@@ -48,7 +48,12 @@ class Document(models.Model):
 
         # Add or update vectors for this document file
         try:
-            add_file_to_vector_db(self.file.path, doc_id=str(self.pk), source_name=self.title or os.path.basename(self.file.name))
+            add_file_to_vector_db(
+                self.file.path,
+                doc_id=str(self.pk),
+                source_name=self.title or os.path.basename(self.file.name),
+                metadata={"uploader": str(self.uploaded_by_id)},
+            )
         except Exception as e:
             # Log as appropriate in your project
             print(f"Failed to update vector DB for doc {self.pk}: {e}")
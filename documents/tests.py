@@ -1,3 +1,713 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import Counter
+from io import StringIO
+from types import GeneratorType
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings, tag
+from langchain_core.embeddings import Embeddings
+
+from accounts.models import Account
+from rag_components import chunking, evaluation, exact_search, index_health, tagging
+from rag_components import vector_store_update as vsu
+
+from .models import Document
+
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def write_docx(path, body):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(
+            "word/document.xml",
+            f'<w:document xmlns:w="{WORD_NS}"><w:body>{body}</w:body></w:document>',
+        )
+
+
+def paragraph(text, style=None, numbered=False):
+    props = ""
+    if style:
+        props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>'
+    elif numbered:
+        props = '<w:pPr><w:numPr><w:numId w:val="1"/></w:numPr></w:pPr>'
+    return f"<w:p>{props}<w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors, so tests need no model download."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = [0.0] * 64
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        return vector
+
+
+def use_approx_tokens(test):
+    # Never download the embedding tokenizer in tests
+    patcher = mock.patch.object(chunking, "_tokenizer", False)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class DocumentLoaderTests(SimpleTestCase):
+    def setUp(self):
+        use_approx_tokens(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _path(self, name, content=None):
+        path = os.path.join(self.tmp.name, name)
+        if content is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        return path
+
+    def test_markdown_sections_follow_headings(self):
+        path = self._path(
+            "malaria.md",
+            "# Malaria\n\nSpread by mosquitoes.\n\n"
+            "## Symptoms\n- fever\n- chills\n\n"
+            "```\n# not a heading\n```\n"
+            "## Prevention\n### Bed nets\nSleep under a treated net.\n",
+        )
+        sections = vsu.iter_file_with_metadata(path, source_name="Malaria", doc_id="7")
+        self.assertIsInstance(sections, GeneratorType)
+
+        sections = list(sections)
+        self.assertEqual(
+            [s.metadata["section"] for s in sections],
+            ["Malaria", "Malaria > Symptoms", "Malaria > Prevention > Bed nets"],
+        )
+        self.assertEqual(
+            sections[1].page_content,
+            "Symptoms\n\n- fever\n- chills\n\n```\n# not a heading\n```",
+        )
+        self.assertEqual(
+            sections[2].page_content, "Prevention\n\nBed nets\n\nSleep under a treated net."
+        )
+        self.assertEqual(sections[0].metadata["doc_id"], "7")
+        self.assertEqual(sections[0].metadata["source"], "Malaria")
+
+    def test_docx_headings_lists_and_tables(self):
+        path = self._path("guide.docx")
+        write_docx(
+            path,
+            paragraph("Child health", style="Title")
+            + paragraph("Keep the child warm.")
+            + paragraph("Danger signs", style="Heading2")
+            + paragraph("Not able to drink", numbered=True)
+            + paragraph("Convulsions", numbered=True)
+            + "<w:tbl><w:tr><w:tc>"
+            + paragraph("Age")
+            + "</w:tc><w:tc>"
+            + paragraph("Dose")
+            + "</w:tc></w:tr><w:tr><w:tc>"
+            + paragraph("2-12 months")
+            + "</w:tc><w:tc>"
+            + paragraph("10 mg")
+            + "</w:tc></w:tr></w:tbl>",
+        )
+
+        sections = vsu.load_file_with_metadata(path)
+        self.assertEqual(
+            [s.metadata["section"] for s in sections],
+            ["Child health", "Child health > Danger signs"],
+        )
+        self.assertEqual(
+            sections[1].page_content,
+            "Danger signs\n\n- Not able to drink\n- Convulsions\n\n"
+            "Age | Dose\n\n2-12 months | 10 mg",
+        )
+
+    @override_settings(RAG_CONFIG={"SECTION_MAX_CHARS": 50})
+    def test_long_sections_are_cut_at_block_boundaries(self):
+        path = self._path("notes.txt", "\n\n".join(["x" * 30] * 5))
+        sections = vsu.load_file_with_metadata(path)
+        self.assertEqual(len(sections), 5)
+        self.assertTrue(all(s.page_content == "x" * 30 for s in sections))
+
+    def test_loader_registry(self):
+        self.assertEqual(vsu.load_file_with_metadata(self._path("scan.png", "")), [])
+
+        with mock.patch.dict(vsu.LOADERS):
+
+            @vsu.register_loader(".csv")
+            def load_csv(file_path):
+                yield vsu.Document(page_content="a,b", metadata={})
+
+            docs = vsu.load_file_with_metadata(self._path("data.CSV", ""), doc_id="3")
+        self.assertEqual(docs[0].metadata["filename"], "data.CSV")
+        self.assertNotIn(".csv", vsu.LOADERS)
+
+    def test_chunks_are_added_in_batches(self):
+        path = self._path("notes.md", "".join(f"# Part {i}\n\nSome text.\n" for i in range(5)))
+        config = {"EMBED_BATCH_SIZE": 2, "VECTOR_DB_PATH": self._path("index")}
+        with override_settings(RAG_CONFIG=config), mock.patch.object(
+            vsu, "_add_chunks"
+        ) as add:
+            vsu.add_file_to_vector_db(path, doc_id="9", metadata={"uploader": "5"})
+
+        batches = [call.args[0] for call in add.call_args_list]
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+        self.assertTrue(all(c.metadata["doc_id"] == "9" for b in batches for c in b))
+        self.assertTrue(all(c.metadata["uploader"] == "5" for b in batches for c in b))
+
+
+class ChunkingTests(SimpleTestCase):
+    def setUp(self):
+        use_approx_tokens(self)
+
+    def test_token_estimate_weighs_devanagari(self):
+        self.assertEqual(chunking.count_tokens("Drink clean water."), 4)
+        # Vowel signs are free, every other letter is a token
+        self.assertEqual(chunking.count_tokens("पानी"), 2)
+        nepali = "सफा पानी पिउनुहोस्।"
+        self.assertGreater(chunking.count_tokens(nepali), len(nepali.split()) * 2)
+
+    def test_blocks_are_packed_without_crossing_boundaries(self):
+        paragraphs = [
+            "Boil water for one minute.",
+            "- ORS after every stool\n- Zinc for ten days",
+            "Age | Dose",
+            "Visit the health post if the fever lasts. Bring the child card.",
+        ]
+        chunks = chunking.chunk_text("\n\n".join(paragraphs), chunk_tokens=16)
+
+        self.assertTrue(all(c["tokens"] <= 16 for c in chunks))
+        self.assertEqual(
+            [c["text"] for c in chunks],
+            [
+                "Boil water for one minute.\n\n- ORS after every stool\n- Zinc for ten days",
+                "Age | Dose",
+                "Visit the health post if the fever lasts. Bring the child card.",
+            ],
+        )
+        # Sentence window: neighbours are stored, not repeated in the text
+        self.assertEqual(chunks[0]["window_before"], "")
+        self.assertEqual(chunks[1]["window_after"], "Visit the health post if the fever lasts.")
+        self.assertEqual(chunks[2]["window_before"], "Age | Dose")
+
+        # A block too large for one chunk is split at sentences
+        chunks = chunking.chunk_text(paragraphs[3], chunk_tokens=10)
+        self.assertEqual(
+            [c["text"] for c in chunks],
+            ["Visit the health post if the fever lasts.", "Bring the child card."],
+        )
+
+    def test_token_overlap_repeats_whole_sentences(self):
+        text = "One two three. Four five six. Seven eight nine. Ten eleven twelve."
+        chunks = chunking.chunk_text(text, chunk_tokens=8, overlap=4)
+        self.assertEqual(
+            [c["text"] for c in chunks],
+            ["One two three. Four five six.", "Four five six. Seven eight nine. Ten eleven twelve."],
+        )
+        self.assertNotIn("window_before", chunks[0])
+
+    def test_oversized_sentences_fall_back_to_words(self):
+        chunks = chunking.chunk_text(" ".join(["word"] * 25), chunk_tokens=10)
+        self.assertEqual([c["tokens"] for c in chunks], [10, 10, 5])
+
+    def test_split_documents_keeps_metadata_and_expands_window(self):
+        doc = vsu.Document(
+            page_content="First sentence here. Second sentence here.",
+            metadata={"doc_id": "4", "section": "Care"},
+        )
+        chunks = chunking.split_documents([doc], chunk_tokens=5)
+        self.assertEqual([c.metadata["chunk"] for c in chunks], [0, 1])
+        self.assertEqual(chunks[1].metadata["doc_id"], "4")
+        self.assertEqual(
+            chunking.with_window(chunks[1]), "First sentence here. Second sentence here."
+        )
+
+
+class TaggingTests(SimpleTestCase):
+    def setUp(self):
+        use_approx_tokens(self)
+
+    def test_tags(self):
+        self.assertEqual(tagging.detect_language("गर्भवती महिलाले कति पटक जाँच गराउनु पर्छ?"), "ne")
+        self.assertEqual(tagging.detect_language("How often should a pregnant woman visit?"), "en")
+        self.assertEqual(tagging.detect_topic("Antenatal visits during pregnancy"), "maternal_health")
+        self.assertEqual(tagging.detect_topic("सुत्केरी आमाको हेरचाह"), "maternal_health")
+        self.assertEqual(tagging.detect_topic("Opening hours of the office"), "general")
+        self.assertEqual(
+            tagging.detect_audience(
+                "Give amoxicillin 40 mg/kg per dose twice daily. Referral criteria: "
+                "see the IMNCI protocol."
+            ),
+            "health_worker",
+        )
+        self.assertEqual(tagging.detect_audience("Wash your hands with soap."), "villager")
+
+    def test_retrieval_filters_widen_to_no_filter(self):
+        filters = tagging.retrieval_filters("गर्भवती महिलाको जाँच", audience="villager")
+        self.assertEqual(
+            filters,
+            [
+                {
+                    "$and": [
+                        {"language": "ne"},
+                        {"topic": "maternal_health"},
+                        {"audience": "villager"},
+                    ]
+                },
+                {"$and": [{"language": "ne"}, {"audience": "villager"}]},
+                {"$and": [{"topic": "maternal_health"}, {"audience": "villager"}]},
+                {"audience": "villager"},
+                None,
+            ],
+        )
+        self.assertEqual(
+            tagging.retrieval_filters("what is this", audience="health_worker"),
+            [{"language": "en"}, None],
+        )
+
+    def test_ingested_chunks_are_tagged(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "care.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# Pregnancy care\n\nAttend four antenatal visits.\n\n"
+                        "# सरसफाइ\n\nखाना अघि साबुन पानीले हात धुनुहोस्।\n")
+            chunks = list(vsu.iter_file_chunks(path, source_name="Care", doc_id="1"))
+
+        self.assertEqual(
+            [(c.metadata["language"], c.metadata["topic"], c.metadata["audience"]) for c in chunks],
+            [("en", "maternal_health", "villager"), ("ne", "hygiene_sanitation", "villager")],
+        )
+
+
+class ShardedIndexTests(SimpleTestCase):
+    def setUp(self):
+        use_approx_tokens(self)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.files = os.path.join(tmp.name, "files")
+        os.makedirs(self.files)
+        self.config = {
+            "VECTOR_DB_PATH": os.path.join(tmp.name, "index"),
+            "SHARDING": {"STRATEGY": "topic"},
+            "RETRIEVER_K": 2,
+        }
+        config = override_settings(RAG_CONFIG=self.config)
+        config.enable()
+        self.addCleanup(config.disable)
+        embeddings = mock.patch.object(vsu, "get_embeddings", return_value=FakeEmbeddings())
+        embeddings.start()
+        self.addCleanup(embeddings.stop)
+        self.addCleanup(vsu.sharding.clear_store_cache)
+
+    def _add(self, name, text, doc_id):
+        path = os.path.join(self.files, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        vsu.add_file_to_vector_db(path, doc_id=doc_id, source_name=name)
+        return path
+
+    def test_topic_shards_fan_out_and_delete(self):
+        self._add("anc.md", "# Pregnancy\n\nPregnant women need four antenatal visits.\n", "1")
+        self._add("malaria.md", "# Malaria\n\nMosquito nets prevent malaria fever.\n", "2")
+        path = self.config["VECTOR_DB_PATH"]
+        self.assertEqual(
+            vsu.sharding.all_shards(path), ["infectious_disease", "maternal_health"]
+        )
+
+        # Unfiltered search merges both shards by distance
+        docs, where = vsu.search("malaria mosquito nets")
+        self.assertIsNone(where)
+        self.assertEqual([d.metadata["doc_id"] for d in docs], ["2", "1"])
+
+        # A topic filter only queries that shard
+        with mock.patch.object(
+            vsu, "_search_shards", wraps=vsu._search_shards
+        ) as search_shards:
+            docs, _ = vsu.search("visits", filters=[{"topic": "maternal_health"}])
+        self.assertEqual(len(search_shards.call_args.args[0]), 1)
+        self.assertEqual([d.metadata["doc_id"] for d in docs], ["1"])
+
+        retriever = vsu.get_retriever(k=1)
+        self.assertEqual(retriever.invoke("antenatal")[0].metadata["doc_id"], "1")
+
+        self.assertEqual(vsu.delete_document_vectors_by_doc_id("2"), 1)
+        docs, _ = vsu.search("malaria")
+        self.assertEqual([d.metadata["doc_id"] for d in docs], ["1"])
+
+    def test_shard_rebuild_swaps_collection(self):
+        anc = self._add("anc.md", "# Pregnancy\n\nPregnant women need antenatal visits.\n", "1")
+        malaria = self._add("malaria.md", "# Malaria\n\nMalaria fever spreads.\n", "2")
+        path = self.config["VECTOR_DB_PATH"]
+        before = vsu.sharding.collection_name(path, "maternal_health")
+
+        files = [
+            vsu.IndexSource(anc, "1", "anc.md", {}),
+            vsu.IndexSource(malaria, "2", "malaria.md", {}),
+        ]
+        self.assertEqual(vsu.rebuild_shard("maternal_health", files), 1)
+
+        after = vsu.sharding.collection_name(path, "maternal_health")
+        self.assertNotEqual(before, after)
+        self.assertEqual(
+            vsu.sharding.all_shards(path), ["infectious_disease", "maternal_health"]
+        )
+        # The replaced collection is retired, not dropped, so running
+        # queries against it can finish
+        self.assertIn(before, vsu.sharding._read_manifest(path)["retired"])
+        docs, _ = vsu.search("antenatal", k=5)
+        self.assertEqual(sorted(d.metadata["doc_id"] for d in docs), ["1", "2"])
+
+    def _source(self, name, text, doc_id, updated_at=None):
+        path = os.path.join(self.files, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return vsu.IndexSource(path, doc_id, name, {}, updated_at)
+
+    def test_full_rebuild_switches_pointer(self):
+        self._add("old.md", "# Malaria\n\nOld malaria guidance.\n", "9")
+        sources = [
+            self._source("anc.md", "# Pregnancy\n\nPregnant women need antenatal visits.\n", "1"),
+            self._source("malaria.md", "# Malaria\n\nMosquito nets prevent malaria.\n", "2"),
+        ]
+
+        # A document uploaded while the index is being built is caught up
+        late = self._source("burns.md", "# Burns\n\nCool a burn under water.\n", "3")
+        listings = iter([sources, sources + [late]])
+        result = vsu.rebuild_vector_index(
+            lambda: next(listings, sources + [late]), workers=2, log=lambda _: None
+        )
+
+        self.assertEqual(result["documents"], 3)
+        self.assertEqual(vsu.get_vector_db_path(), result["path"])
+        self.assertEqual(vsu.count_chunks_by_doc(result["path"]), {"1": 1, "2": 1, "3": 1})
+        docs, _ = vsu.search("malaria", k=5)
+        self.assertEqual(sorted(d.metadata["doc_id"] for d in docs), ["1", "2", "3"])
+
+    def test_writes_during_validation_and_switch_are_caught_up(self):
+        anc = self._source("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        malaria = self._source("malaria.md", "# Malaria\n\nMosquito nets prevent malaria.\n", "2")
+        burns = self._source("burns.md", "# Burns\n\nCool a burn under water.\n", "3")
+        listing = [anc, malaria]
+        real_validate, real_switch = vsu._validate, vsu._switch_pointer
+
+        def validate(*args):
+            real_validate(*args)
+            # Uploaded, and another deleted, while validation scanned the index
+            listing[:] = [anc, burns]
+
+        def switch(*args):
+            real_switch(*args)
+            listing[:] = [burns]
+
+        with mock.patch.object(vsu, "_validate", validate), mock.patch.object(
+            vsu, "_switch_pointer", switch
+        ):
+            result = vsu.rebuild_vector_index(lambda: list(listing), log=lambda _: None)
+
+        self.assertEqual(vsu.count_chunks_by_doc(result["path"]), {"3": 1})
+        self.assertEqual(result["documents"], 1)
+
+    def test_failed_rebuild_keeps_live_index(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        root = self.config["VECTOR_DB_PATH"]
+        sources = [self._source("malaria.md", "# Malaria\n\nMalaria fever.\n", "2")]
+
+        with mock.patch.object(vsu, "count_chunks_by_doc", return_value={"2": 0}):
+            with self.assertRaises(RuntimeError):
+                vsu.rebuild_vector_index(lambda: sources, log=lambda _: None)
+
+        self.assertEqual(vsu.get_vector_db_path(), root)
+        self.assertEqual([n for n in os.listdir(root) if n.startswith("index-")], [])
+        docs, _ = vsu.search("malaria", k=5)
+        self.assertEqual([d.metadata["doc_id"] for d in docs], ["1"])
+
+    def test_writes_from_other_processes_refresh_stores(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        path = vsu.get_vector_db_path()
+        store = vsu.get_vector_store("maternal_health")
+
+        # Nothing changed: the cached store is reused
+        self.assertIs(vsu.get_vector_store("maternal_health"), store)
+
+        # Another worker deletes a document and bumps the generation
+        generation = os.path.join(path, vsu.sharding.GENERATION)
+        with open(f"{generation}.other", "w") as f:
+            f.write("other worker\n")
+        os.replace(f"{generation}.other", generation)
+
+        self.assertIsNot(vsu.get_vector_store("maternal_health"), store)
+        docs, _ = vsu.search("antenatal")
+        self.assertEqual([d.metadata["doc_id"] for d in docs], ["1"])
+
+    def test_retired_client_keeps_serving_running_queries(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        path = vsu.get_vector_db_path()
+        store = vsu.get_vector_store("maternal_health")
+
+        generation = os.path.join(path, vsu.sharding.GENERATION)
+        with open(f"{generation}.other", "w") as f:
+            f.write("other worker\n")
+        os.replace(f"{generation}.other", generation)
+        vsu.sharding.check_generation(path)
+
+        # A thread still holding the old store can finish its query
+        self.assertEqual(len(store.similarity_search("antenatal", k=1)), 1)
+        self.assertIsNot(vsu.get_vector_store("maternal_health"), store)
+
+    def test_own_writes_never_retire_the_client(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        path = vsu.get_vector_db_path()
+        done = threading.Event()
+
+        def bump():
+            for _ in range(200):
+                vsu.sharding.bump_generation(path)
+            done.set()
+
+        with mock.patch.object(vsu.sharding, "_retire") as retire:
+            writer = threading.Thread(target=bump)
+            writer.start()
+            while not done.is_set():
+                vsu.sharding.check_generation(path)
+            writer.join()
+        retire.assert_not_called()
+
+    def test_paged_counts_and_batched_deletes(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n\n# Delivery\n\nLabour care.\n", "1")
+        self._add("malaria.md", "# Malaria\n\nMalaria fever.\n", "2")
+        self._add("burns.md", "# Burns\n\nCool a burn under water.\n", "3")
+
+        self.assertEqual(vsu.count_chunks_by_doc(page_size=1), {"1": 2, "2": 1, "3": 1})
+
+        vsu.delete_doc_ids(["1", "3"], batch_size=1)
+        self.assertEqual(vsu.count_chunks_by_doc(), {"2": 1})
+
+    def test_index_health_report(self):
+        self._add("anc.md", "# Pregnancy\n\nPregnant women need antenatal visits.\n", "1")
+        self._add("anc-copy.md", "# Pregnancy\n\nPregnant women need antenatal visits.\n", "2")
+        self._add("malaria.md", "# Malaria\n\nMosquito nets prevent malaria fever.\n", "3")
+
+        report = index_health.collect_report(sample=10, probes=3, k=2, page_size=1)
+
+        self.assertEqual(report["chunks"], 3)
+        self.assertEqual(report["dimension"], 64)
+        self.assertEqual(dict(report["documents"]), {"1": 1, "2": 1, "3": 1})
+        self.assertEqual(report["shards"][0]["hnsw"]["space"], "l2")
+        self.assertEqual(report["duplicates"]["pairs"], 1)
+        pair = report["duplicates"]["examples"][0]
+        self.assertEqual({pair["a"]["doc_id"], pair["b"]["doc_id"]}, {"1", "2"})
+        self.assertEqual(report["latency"]["probes"], 3)
+        self.assertEqual(report["recall"]["recall"], 1.0)
+
+
+class ExactSearchTests(SimpleTestCase):
+    def setUp(self):
+        use_approx_tokens(self)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.files = tmp.name
+        self.path = os.path.join(tmp.name, "index")
+        config = override_settings(
+            RAG_CONFIG={
+                "VECTOR_DB_PATH": self.path,
+                "HNSW": {"SPACE": "cosine", "EF_SEARCH": 50, "M": 8},
+                "EXACT_SEARCH": {"MAX_CHUNKS": 10, "DTYPE": "float16"},
+            }
+        )
+        config.enable()
+        self.addCleanup(config.disable)
+        embeddings = mock.patch.object(vsu, "get_embeddings", return_value=FakeEmbeddings())
+        embeddings.start()
+        self.addCleanup(embeddings.stop)
+        self.addCleanup(vsu.sharding.clear_store_cache)
+
+    _add = ShardedIndexTests._add
+
+    def test_hnsw_parameters_apply_to_new_collections(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        hnsw = vsu.get_vector_store()._collection.configuration["hnsw"]
+        self.assertEqual(
+            (hnsw["space"], hnsw["ef_search"], hnsw["max_neighbors"]), ("cosine", 50, 8)
+        )
+
+    def test_exact_search_matches_hnsw_and_follows_writes(self):
+        self._add("anc.md", "# Pregnancy\n\nPregnant women need antenatal visits.\n", "1")
+        self._add("malaria.md", "# Malaria\n\nMosquito nets prevent malaria fever.\n", "2")
+        embeddings = vsu.get_embeddings()
+        query = embeddings.embed_query("malaria fever")
+
+        exact = exact_search.search(self.path, embeddings, query, k=2)
+        hnsw = vsu._search_shards([vsu.get_vector_store()], query, 2, None)
+        self.assertEqual([d.metadata["doc_id"] for d, _ in exact], ["2", "1"])
+        self.assertEqual([d.page_content for d, _ in exact], [d.page_content for d, _ in hnsw])
+        for (_, a), (_, b) in zip(exact, hnsw):
+            self.assertAlmostEqual(a, b, places=2)
+
+        index = exact_search.get_index(self.path, embeddings)
+        self.assertIsInstance(index.vectors, np.memmap)
+        self.assertEqual(index.vectors.dtype, np.float16)
+
+        docs, _ = vsu.search("visits", filters=[{"doc_id": {"$in": ["2"]}}])
+        self.assertEqual([d.metadata["doc_id"] for d in docs], ["2"])
+
+        # A write invalidates the snapshot
+        self._add("burns.md", "# Burns\n\nCool a burn under water.\n", "3")
+        docs, _ = vsu.search("burn water", k=1)
+        self.assertEqual(docs[0].metadata["doc_id"], "3")
+
+    def test_stale_processes_keep_newer_snapshots(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        embeddings = vsu.get_embeddings()
+        token = exact_search.snapshot_token(self.path)
+        exact_search.get_index(self.path, embeddings)
+        collections = {"default": vsu.get_vector_store()._collection}
+
+        # A process still on an older generation writes its snapshot afterwards
+        exact_search._write_snapshot(self.path, "1-1", collections, "float32", "cosine")
+        directory, vectors_path, rows_path = exact_search._snapshot_paths(self.path, token)
+        self.assertTrue(os.path.exists(vectors_path) and os.path.exists(rows_path))
+
+        # A newer one removes both older snapshots
+        newer = f"1-{exact_search._token_order(token) + 1}"
+        exact_search._write_snapshot(self.path, newer, collections, "float32", "cosine")
+        self.assertEqual(
+            sorted(os.listdir(directory)), [f"rows-{newer}.json", f"vectors-{newer}.npy"]
+        )
+
+    def test_a_snapshot_removed_under_a_reader_is_rebuilt(self):
+        self._add("anc.md", "# Pregnancy\n\nAntenatal visits.\n", "1")
+        embeddings = vsu.get_embeddings()
+        token = exact_search.snapshot_token(self.path)
+        exact_search.get_index(self.path, embeddings)
+        real_open = exact_search._open_snapshot
+        calls = []
+
+        def open_snapshot(path, token):
+            # Another process removes the snapshot between the check and the open
+            calls.append(token)
+            if len(calls) == 1:
+                raise FileNotFoundError(token)
+            return real_open(path, token)
+
+        with mock.patch.object(exact_search, "_open_snapshot", open_snapshot):
+            self.assertEqual(len(exact_search._load(self.path, embeddings, token)), 1)
+        self.assertEqual(len(calls), 2)
+        exact_search._indexes.clear()
+
+        with mock.patch.object(exact_search, "_open_snapshot", side_effect=FileNotFoundError):
+            self.assertIsNone(exact_search.get_index(self.path, embeddings))
+            docs, _ = vsu.search("antenatal", k=1)
+        self.assertEqual(docs[0].metadata["doc_id"], "1")
+
+    def test_large_indexes_use_hnsw(self):
+        for i in range(11):
+            self._add(f"{i}.md", f"# Note {i}\n\nText number {i}.\n", str(i))
+        embeddings = vsu.get_embeddings()
+        self.assertIsNone(exact_search.get_index(self.path, embeddings))
+        docs, _ = vsu.search("Text number 3", k=1)
+        self.assertEqual(len(docs), 1)
+
+
+@tag("benchmark")
+class RagBenchmarkTests(SimpleTestCase):
+    def setUp(self):
+        use_approx_tokens(self)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        config = override_settings(
+            RAG_CONFIG={"VECTOR_DB_PATH": tmp.name, "RETRIEVER_K": 2, "CLASSIFIER_MODE": "hybrid"}
+        )
+        config.enable()
+        self.addCleanup(config.disable)
+        embeddings = mock.patch.object(vsu, "get_embeddings", return_value=FakeEmbeddings())
+        embeddings.start()
+        self.addCleanup(embeddings.stop)
+        self.addCleanup(vsu.sharding.clear_store_cache)
+        for name, text, doc_id in [
+            ("anc.md", "# Pregnancy\n\nPregnant women need four antenatal visits.\n", "1"),
+            ("malaria.md", "# Malaria\n\nMosquito nets prevent malaria fever.\n", "2"),
+        ]:
+            path = os.path.join(tmp.name, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            vsu.add_file_to_vector_db(path, doc_id=doc_id, source_name=name)
+
+    def test_benchmark_reports_routes_latency_tokens_and_recall(self):
+        questions = [
+            {"question": "Hello", "route": "greeting"},
+            {"question": "Who won the football match?", "route": "off_topic"},
+            {
+                "question": "How can mosquito nets prevent malaria fever?",
+                "expected": "Mosquito nets prevent malaria",
+                "expected_doc_ids": ["2"],
+                "route": "rag",
+            },
+            {
+                "question": "How many antenatal visits does a pregnant woman need?",
+                "expected_doc_ids": ["1"],
+                "route": "rag",
+            },
+        ]
+        result = evaluation.run_benchmark(questions, repeat=2)
+        summary = result["summary"]
+
+        self.assertEqual(summary["runs"], 8)
+        self.assertEqual(
+            [row["route"] for row in result["questions"]],
+            ["greeting", "off_topic", "rag", "rag"],
+        )
+        self.assertEqual(summary["route_accuracy"], 1.0)
+        self.assertEqual(summary["recall_at_k"], {"k": 2, "judged": 4, "recall": 1.0})
+        self.assertIn("retrieve_docs", summary["latency"]["nodes"])
+        self.assertGreater(summary["tokens"]["generate_rag_answer"]["in"], 0)
+        self.assertIn("malaria", result["questions"][2]["answer"].lower())
+        self.assertGreater(summary["caches"]["vector_store"]["hit_rate"], 0.5)
+
+        # Results round-trip through JSON and compare against themselves
+        baseline = json.loads(json.dumps(result))
+        deltas = {metric: (a, b) for metric, a, b in evaluation.compare(result, baseline)}
+        self.assertEqual(deltas["recall_at_k"], (1.0, 1.0))
+
+
+@mock.patch("documents.models.delete_document_vectors_by_doc_id", mock.Mock())
+@mock.patch("documents.models.add_file_to_vector_db", mock.Mock())
+class CleanupVectorDbTests(TestCase):
+    command = "documents.management.commands.cleanup_vector_db"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Account.objects.create_user(
+            "Admin", "User", "admin", "admin@example.com", "pw", "1", role="admin"
+        )
+
+    def _document(self, name):
+        return Document.objects.create(title=name, file=f"documents/{name}", uploaded_by=self.admin)
+
+    def test_documents_written_during_the_scan_are_left_alone(self):
+        indexed = self._document("anc.md")
+        deleted = self._document("malaria.md")  # no vectors yet
+
+        def scan(page_size):
+            # Uploaded (row first, then vectors) and deleted while the scan runs
+            nonlocal uploaded
+            uploaded = self._document("burns.md")
+            deleted.delete()
+            return Counter({str(indexed.pk): 2, str(uploaded.pk): 1, "999": 3})
+
+        uploaded = None
+        with mock.patch(f"{self.command}.count_chunks_by_doc", scan), mock.patch(
+            f"{self.command}.delete_doc_ids"
+        ) as delete_doc_ids, mock.patch(f"{self.command}.add_file_to_vector_db") as add_file:
+            call_command("cleanup_vector_db", "--reindex", stdout=StringIO())
+
+        delete_doc_ids.assert_called_once_with({"999"}, batch_size=vsu.DELETE_BATCH_SIZE)
+        add_file.assert_not_called()
@@ -0,0 +1,32 @@
+# documents/utils.py
+import os
+
+from rag_components.vector_store_update import IndexSource
+
+from .models import Document
+
+
+def index_sources(log=None):
+    """IndexSource for every Document whose file is on disk."""
+    documents = Document.objects.only("pk", "title", "file", "uploaded_by_id", "updated_at")
+    for doc in documents.iterator():
+        if not doc.file or not os.path.exists(doc.file.path):
+            if log:
+                log(f"Skipping document {doc.pk}: file missing")
+            continue
+        yield IndexSource(
+            doc.file.path,
+            str(doc.pk),
+            doc.title or os.path.basename(doc.file.name),
+            {"uploader": str(doc.uploaded_by_id)},
+            doc.updated_at,
+        )
+
+
+def document_titles(doc_ids):
+    """{doc_id: title} for the vector store doc_ids that still exist."""
+    ids = [int(d) for d in doc_ids if str(d).isdigit()]
+    return {
+        str(pk): title
+        for pk, title in Document.objects.filter(pk__in=ids).values_list("pk", "title")
+    }
@@ -9,9 +9,11 @@ from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.prompts import PromptTemplate
 from langchain_community.utilities import SerpAPIWrapper
 from langgraph.graph import StateGraph, END
+from .chunking import with_window
+from .tagging import retrieval_filters
+from .vector_store_update import search
 from .llm_and_rag import (
     get_llm,
-    get_retriever,
     is_rate_limit_error,
     is_connection_error,
     get_resilient_error_answer,
@@ -35,6 +37,7 @@ class GraphState(TypedDict):
         sources: A list of source information for the answer.
         chat_history: Recent chat history for context-aware responses.
         user_name: User's name for personalization.
+        audience: "villager" or "health_worker"; limits retrieved material.
     """
 
     question: str
@@ -44,6 +47,7 @@ class GraphState(TypedDict):
     sources: List[dict]
     chat_history: str
     user_name: str
+    audience: str
 
 
 # --- Prompt Templates ---
@@ -367,9 +371,11 @@ def retrieve_docs(state: GraphState) -> GraphState:
     """Node to retrieve documents from the vector store."""
     logger.debug("NODE: RETRIEVE DOCUMENTS")
     question = state["question"]
-    retriever = get_retriever()
-    documents = retriever.invoke(question)
-    logger.info("Retrieved %s documents.", len(documents))
+    # Narrowest metadata filter first, widening until something matches
+    documents, where = search(
+        question, filters=retrieval_filters(question, state.get("audience"))
+    )
+    logger.info("Retrieved %s documents (filter=%s).", len(documents), where)
     return {**state, "documents": documents}
 
 
@@ -392,9 +398,11 @@ def generate_rag_answer(state: GraphState) -> GraphState:
     llm = get_llm()
     rag_chain = prompt | llm
 
+    # Each chunk goes in with its neighbouring sentences (sentence window)
+    context = "\n\n---\n\n".join(with_window(doc) for doc in documents)
     generation = rag_chain.invoke(
         {
-            "context": documents,
+            "context": context,
             "question": question,
             "chat_history_section": chat_history_section,
         }
@@ -652,6 +660,7 @@ def get_agentic_rag_response(
     chat_history: str = None,
     user_name: str = None,
     config: RunnableConfig = None,
+    audience: str = None,
 ):
     """
     The main entry point for the agentic RAG.
@@ -661,6 +670,7 @@ def get_agentic_rag_response(
         chat_history: Formatted string of recent chat history (optional)
         user_name: User's name for personalization (optional)
         config: LangGraph configuration (optional)
+        audience: "villager" or "health_worker" (optional)
 
     Returns:
         dict with 'answer' and 'sources' keys
@@ -675,6 +685,7 @@ def get_agentic_rag_response(
             "sources": [],
             "chat_history": chat_history or "No previous conversation.",
             "user_name": user_name or "",
+            "audience": audience or "",
         }
         final_state = app.invoke(initial_state, config=config)
 
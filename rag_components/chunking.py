@@ -0,0 +1,203 @@
+# rag_components/chunking.py
+"""
+Token-based, structure-aware chunking.
+
+Chunk sizes are measured in tokens of the embedding model's tokenizer, not
+characters: a Devanagari sentence costs several times more tokens than an
+English one of the same length, and all-MiniLM-L6-v2 silently truncates
+anything past 256 tokens. When the tokenizer cannot be loaded (offline, or
+RAG_CONFIG["TOKENIZER"] = "approx") a script-aware estimate is used.
+
+A loader section (one heading's content, see vector_store_update) is split
+into blocks at blank lines: paragraphs, list runs and table rows. Blocks
+are packed into chunks of at most CHUNK_TOKENS and are only broken up, at
+sentence and then word boundaries, when a single block is too large, so a
+chunk never spans two headings.
+
+Overlap (CHUNK_OVERLAP):
+- "window" (default): chunks do not overlap. Each chunk stores the
+  neighbouring sentences in metadata["window_before"/"window_after"], and
+  with_window() adds them back when the chunk is put into a prompt
+  (sentence-window retrieval). The index holds every sentence once.
+- an int: up to that many tokens of whole trailing sentences from the
+  previous chunk are repeated at the start of the next one, on top of
+  CHUNK_TOKENS.
+"""
+import logging
+import re
+import unicodedata
+from typing import List
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+")
+APPROX_TOKEN = re.compile(r"[A-Za-z]+|\d+|\S")
+
+_tokenizer = None
+
+
+def _get_config(key, default=None):
+    return getattr(settings, "RAG_CONFIG", {}).get(key, default)
+
+
+def _load_tokenizer():
+    """The embedding model's tokenizer, or False if it cannot be loaded."""
+    global _tokenizer
+    if _tokenizer is None:
+        name = _get_config(
+            "TOKENIZER",
+            _get_config("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+        )
+        _tokenizer = False
+        if name != "approx":
+            try:
+                from tokenizers import Tokenizer
+
+                _tokenizer = Tokenizer.from_pretrained(name)
+            except Exception as e:
+                logger.warning(f"Tokenizer {name} unavailable, estimating tokens: {e}")
+    return _tokenizer
+
+
+def _approx_tokens(text: str) -> int:
+    # WordPiece-like estimate: Latin words split every ~6 letters, digits
+    # every 3; other scripts and punctuation cost one token per character,
+    # combining marks (Devanagari vowel signs, virama) none.
+    count = 0
+    for match in APPROX_TOKEN.finditer(text):
+        piece = match.group()
+        if piece[0].isascii() and piece[0].isalpha():
+            count += 1 + (len(piece) - 1) // 6
+        elif piece[0].isdigit():
+            count += 1 + (len(piece) - 1) // 3
+        elif not unicodedata.category(piece).startswith("M"):
+            count += 1
+    return count
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = _load_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return _approx_tokens(text)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in SENTENCE_END.split(text.strip()) if s]
+
+
+def _split_words(text, limit):
+    piece, pieces = [], []
+    for word in text.split():
+        if piece and count_tokens(" ".join(piece + [word])) > limit:
+            pieces.append(" ".join(piece))
+            piece = []
+        piece.append(word)
+    if piece:
+        pieces.append(" ".join(piece))
+    return pieces
+
+
+def _units(text, limit):
+    """(block_index, text, tokens) for every packable piece of a section."""
+    for index, block in enumerate(b.strip() for b in text.split("\n\n")):
+        if not block:
+            continue
+        tokens = count_tokens(block)
+        if tokens <= limit:
+            yield index, block, tokens
+            continue
+        for sentence in split_sentences(block):
+            tokens = count_tokens(sentence)
+            if tokens <= limit:
+                yield index, sentence, tokens
+            else:
+                for piece in _split_words(sentence, limit):
+                    yield index, piece, count_tokens(piece)
+
+
+def _join(units):
+    text, previous = "", None
+    for index, unit, _ in units:
+        if previous is not None:
+            text += " " if index == previous else "\n\n"
+        text += unit
+        previous = index
+    return text
+
+
+def _overlap(units, limit):
+    """Whole trailing sentences of `units` totalling at most `limit` tokens."""
+    sentences = split_sentences(units[-1][1]) if units else []
+    kept, used = [], 0
+    for sentence in reversed(sentences):
+        tokens = count_tokens(sentence)
+        if used + tokens > limit:
+            break
+        kept.insert(0, sentence)
+        used += tokens
+    return " ".join(kept), used
+
+
+def chunk_text(text: str, chunk_tokens: int = None, overlap=None) -> List[dict]:
+    """
+    Split `text` into [{"text", "tokens", "window_before", "window_after"}].
+    The window keys are only present in "window" overlap mode.
+    """
+    chunk_tokens = chunk_tokens or _get_config("CHUNK_TOKENS", 200)
+    overlap = _get_config("CHUNK_OVERLAP", "window") if overlap is None else overlap
+
+    groups, current, size = [], [], 0
+    for unit in _units(text, chunk_tokens):
+        if current and size + unit[2] > chunk_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(unit)
+        size += unit[2]
+    if current:
+        groups.append(current)
+
+    chunks = []
+    for i, group in enumerate(groups):
+        body, tokens = _join(group), sum(u[2] for u in group)
+        chunk = {"text": body, "tokens": tokens}
+        if overlap == "window":
+            before = split_sentences(groups[i - 1][-1][1])[-1:] if i else []
+            after = split_sentences(groups[i + 1][0][1])[:1] if i + 1 < len(groups) else []
+            chunk["window_before"] = " ".join(before)
+            chunk["window_after"] = " ".join(after)
+        elif overlap and i:
+            carried, carried_tokens = _overlap(groups[i - 1], int(overlap))
+            if carried:
+                chunk["text"] = f"{carried} {body}"
+                chunk["tokens"] = tokens + carried_tokens
+        chunks.append(chunk)
+    return chunks
+
+
+def split_documents(
+    documents: List[Document], chunk_tokens: int = None, overlap=None
+) -> List[Document]:
+    """Chunk each Document, copying its metadata onto every chunk."""
+    chunks = []
+    for doc in documents:
+        for index, chunk in enumerate(chunk_text(doc.page_content, chunk_tokens, overlap)):
+            metadata = {**doc.metadata, "chunk": index, "tokens": chunk["tokens"]}
+            for key in ("window_before", "window_after"):
+                if key in chunk:
+                    metadata[key] = chunk[key]
+            chunks.append(Document(page_content=chunk["text"], metadata=metadata))
+    return chunks
+
+
+def with_window(doc: Document) -> str:
+    """Chunk text with its stored neighbouring sentences, for the prompt."""
+    parts = [
+        doc.metadata.get("window_before", ""),
+        doc.page_content,
+        doc.metadata.get("window_after", ""),
+    ]
+    return " ".join(part for part in parts if part)
@@ -0,0 +1,356 @@
+# rag_components/evaluation.py
+"""
+Offline evaluation and latency benchmark of the chat pipeline.
+
+run_benchmark() replays a question set through get_agentic_rag_response
+with a deterministic fake LLM (FakeChatModel) and fake web search, so runs
+are free, repeatable and comparable. Retrieval is real: it uses the live
+index, or whatever index VECTOR_DB_PATH points at. For each run it reports:
+- latency per graph node and end to end (avg, p95)
+- average LLM tokens in/out per question and node (from usage_metadata, so it works with a real
+  model too)
+- retrieval recall@k: share of questions with expectations where a
+  retrieved chunk (with its sentence window) contains the expected text
+  or comes from an expected document
+- route distribution: rag, rag_fallback (web), greeting, off_topic
+- hit rates of the in-process caches on the request path (embedding
+  model, vector stores, exact-search snapshot)
+
+The fake LLM classifies with the keyword heuristics and answers with the
+context line that shares the most words with the question. When no
+context line matches, it replies with the "not enough information" marker,
+so weak retrieval shows up as web fallbacks, as it would with a real model.
+
+Questions are JSONL: {"question", "expected", "expected_doc_ids", "route",
+"audience"}. Every key except the question is optional. "route" is one of
+the routes above, or "health" to accept either rag route. Lines with only
+"title" (requests.jsonl-style files) use the title as the question.
+"""
+import hashlib
+import json
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from unittest import mock
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from . import chunking, exact_search, sharding
+from . import vector_store_update as vsu
+
+# llm_and_rag imports agentic_rag itself, so it has to come first
+from . import llm_and_rag  # noqa: F401
+from . import agentic_rag
+
+INSUFFICIENT_ANSWER = (
+    "I don't have enough information in my knowledge base to answer this accurately."
+)
+WORD = re.compile(r"\w{4,}")
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def _words(text):
+    return set(WORD.findall(text.lower()))
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for the chat model; see the module docstring."""
+
+    question: str = ""
+
+    @property
+    def _llm_type(self):
+        return "fake-rag-eval"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = messages[-1].content
+        if prompt.strip().startswith(agentic_rag.CLASSIFICATION_PROMPT_TEMPLATE.strip()[:80]):
+            text = agentic_rag._heuristic_classification(self.question)
+        else:
+            text = self._answer(prompt)
+        usage = {
+            "input_tokens": chunking.count_tokens(prompt),
+            "output_tokens": chunking.count_tokens(text),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _answer(self, prompt):
+        template = set(
+            (agentic_rag.RAG_PROMPT_TEMPLATE + agentic_rag.IMPROVED_FALLBACK_PROMPT_TEMPLATE).splitlines()
+        )
+        asked = _words(self.question)
+        best, overlap = None, 0
+        for line in prompt.splitlines():
+            line = line.strip()
+            if not line or line in template or self.question in line:
+                continue
+            shared = len(asked & _words(line))
+            if shared > overlap:
+                best, overlap = line, shared
+        return best[:400] if best else INSUFFICIENT_ANSWER
+
+
+class FakeWebSearch:
+    """Replaces SerpAPIWrapper: no network, same answer every time."""
+
+    def run(self, query):
+        return f"Web results for: {query}. Consult a qualified health worker."
+
+
+class _NodeTimer(BaseCallbackHandler):
+    """Times LangGraph nodes and collects LLM usage and retrieved documents."""
+
+    def __init__(self):
+        self.started = {}
+        self.llm_nodes = {}
+        self.nodes = []  # (node, seconds) in execution order
+        self.tokens = defaultdict(lambda: [0, 0])
+        self.documents = None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self.started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id in self.started:
+            node, started = self.started.pop(run_id)
+            self.nodes.append((node, time.perf_counter() - started))
+            if node == "retrieve_docs" and isinstance(outputs, dict):
+                self.documents = outputs.get("documents", [])
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.llm_nodes[run_id] = (metadata or {}).get("langgraph_node", "?")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node = self.llm_nodes.pop(run_id, "?")
+        for generation in response.generations[0]:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            self.tokens[node][0] += usage.get("input_tokens", 0)
+            self.tokens[node][1] += usage.get("output_tokens", 0)
+
+
+class _CacheCounter:
+    """Counts hits and misses of the in-process caches by peeking before each call."""
+
+    def __init__(self):
+        self.counts = defaultdict(Counter)
+
+    def wrap(self, stack, module, name, label, is_hit):
+        original = getattr(module, name)
+
+        def counted(*args, **kwargs):
+            self.counts[label]["hits" if is_hit(*args, **kwargs) else "misses"] += 1
+            return original(*args, **kwargs)
+
+        stack.enter_context(mock.patch.object(module, name, counted))
+
+    def report(self):
+        return {
+            label: {
+                "hits": counts["hits"],
+                "misses": counts["misses"],
+                "hit_rate": counts["hits"] / (counts["hits"] + counts["misses"]),
+            }
+            for label, counts in self.counts.items()
+        }
+
+
+def _route(nodes):
+    if "handle_greeting" in nodes:
+        return "greeting"
+    if "handle_off_topic" in nodes:
+        return "off_topic"
+    if "web_search" in nodes:
+        return "rag_fallback"
+    return "rag"
+
+
+def _route_matches(expected, route):
+    return expected == route or (expected == "health" and route in ("rag", "rag_fallback"))
+
+
+def _retrieval_hit(item, documents):
+    expected = item.get("expected")
+    doc_ids = {str(d) for d in item.get("expected_doc_ids") or []}
+    for doc in documents:
+        if doc_ids and str(doc.metadata.get("doc_id")) in doc_ids:
+            return True
+        if expected and _normalize(expected) in _normalize(chunking.with_window(doc)):
+            return True
+    return False
+
+
+def load_questions(path):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item["question"] = item.get("question") or item.get("title") or ""
+            if item["question"]:
+                items.append(item)
+    return items
+
+
+def _ms(seconds):
+    if not seconds:
+        return {"avg_ms": 0.0, "p95_ms": 0.0}
+    return {
+        "avg_ms": float(np.mean(seconds)) * 1000,
+        "p95_ms": float(np.percentile(seconds, 95)) * 1000,
+    }
+
+
+def config_snapshot():
+    """The settings a benchmark result depends on, for comparing runs."""
+    config = {
+        key: vsu._get_config(key)
+        for key in ("RETRIEVER_K", "CHUNK_TOKENS", "CHUNK_OVERLAP", "CLASSIFIER_MODE")
+    }
+    config["SHARDING"] = sharding.strategy()
+    config["EXACT_SEARCH"] = exact_search.max_chunks()
+    for name in ("CLASSIFICATION_PROMPT_TEMPLATE", "RAG_PROMPT_TEMPLATE"):
+        text = getattr(agentic_rag, name)
+        config[name] = hashlib.sha1(text.encode()).hexdigest()[:12]
+    return config
+
+
+def run_benchmark(questions, repeat=1, audience=None):
+    """
+    Replay `questions` (dicts, see load_questions) `repeat` times.
+
+    Returns {"config", "summary", "questions"}; "questions" holds the last
+    repetition per question.
+    """
+    llm = FakeChatModel()
+    caches = _CacheCounter()
+    node_seconds, total_seconds = defaultdict(list), []
+    tokens = defaultdict(lambda: [0, 0])
+    routes, rows = Counter(), {}
+    hits = judged = route_checked = route_correct = 0
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(agentic_rag, "get_llm", return_value=llm))
+        stack.enter_context(mock.patch.object(agentic_rag, "SerpAPIWrapper", FakeWebSearch))
+        caches.wrap(
+            stack, vsu, "get_embeddings", "embedding_model",
+            lambda: vsu._embeddings_cache is not None,
+        )
+        caches.wrap(
+            stack, sharding, "get_store", "vector_store",
+            lambda path, shard, embeddings: (path, sharding.collection_name(path, shard))
+            in sharding._stores,
+        )
+        caches.wrap(
+            stack, exact_search, "get_index", "exact_snapshot",
+            lambda path, embeddings: exact_search.enabled()
+            and exact_search._indexes.get(path, (None,))[0] == exact_search.snapshot_token(path),
+        )
+
+        for _ in range(repeat):
+            for index, item in enumerate(questions):
+                llm.question = item["question"]
+                timer = _NodeTimer()
+                started = time.perf_counter()
+                response = agentic_rag.get_agentic_rag_response(
+                    item["question"],
+                    config={"callbacks": [timer]},
+                    audience=item.get("audience", audience),
+                )
+                elapsed = time.perf_counter() - started
+                total_seconds.append(elapsed)
+
+                nodes = [node for node, _ in timer.nodes]
+                for node, seconds in timer.nodes:
+                    node_seconds[node].append(seconds)
+                for node, (used_in, used_out) in timer.tokens.items():
+                    tokens[node][0] += used_in
+                    tokens[node][1] += used_out
+                route = _route(nodes)
+                routes[route] += 1
+
+                hit = None
+                if timer.documents is not None and (
+                    item.get("expected") or item.get("expected_doc_ids")
+                ):
+                    hit = _retrieval_hit(item, timer.documents)
+                    judged += 1
+                    hits += hit
+                if item.get("route"):
+                    route_checked += 1
+                    route_correct += _route_matches(item["route"], route)
+
+                rows[index] = {
+                    "question": item["question"],
+                    "route": route,
+                    "nodes": nodes,
+                    "ms": elapsed * 1000,
+                    "retrieved": [
+                        d.metadata.get("doc_id") for d in timer.documents or []
+                    ],
+                    "retrieval_hit": hit,
+                    "answer": response["answer"][:200],
+                }
+
+    runs = sum(routes.values())
+    return {
+        "config": config_snapshot(),
+        "summary": {
+            "questions": len(questions),
+            "runs": runs,
+            "latency": {
+                "total": _ms(total_seconds),
+                "nodes": {node: _ms(seconds) for node, seconds in sorted(node_seconds.items())},
+            },
+            # per run, so results with a different --repeat compare
+            "tokens": {
+                node: {"in": used[0] / max(runs, 1), "out": used[1] / max(runs, 1)}
+                for node, used in sorted(tokens.items())
+            },
+            "recall_at_k": {
+                "k": vsu._get_config("RETRIEVER_K", 3),
+                "judged": judged,
+                "recall": hits / judged if judged else None,
+            },
+            "routes": {route: count / max(runs, 1) for route, count in sorted(routes.items())},
+            "route_accuracy": route_correct / route_checked if route_checked else None,
+            "caches": caches.report(),
+        },
+        "questions": [rows[i] for i in sorted(rows)],
+    }
+
+
+def compare(current, baseline):
+    """[(metric, baseline, current)] for the headline numbers of two results."""
+
+    def flat(result):
+        summary = result["summary"]
+        values = {
+            "latency.total.avg_ms": summary["latency"]["total"]["avg_ms"],
+            "latency.total.p95_ms": summary["latency"]["total"]["p95_ms"],
+            "recall_at_k": summary["recall_at_k"]["recall"],
+            "route_accuracy": summary["route_accuracy"],
+        }
+        for node, latency in summary["latency"]["nodes"].items():
+            values[f"latency.{node}.avg_ms"] = latency["avg_ms"]
+        for node, used in summary["tokens"].items():
+            values[f"tokens.{node}.in"] = used["in"]
+            values[f"tokens.{node}.out"] = used["out"]
+        for route, share in summary["routes"].items():
+            values[f"routes.{route}"] = share
+        return values
+
+    before, after = flat(baseline), flat(current)
+    return [(key, before.get(key), after.get(key)) for key in sorted(set(before) | set(after))]
@@ -0,0 +1,287 @@
+# rag_components/exact_search.py
+"""
+Exact brute-force search for small indexes.
+
+Below RAG_CONFIG["EXACT_SEARCH"]["MAX_CHUNKS"] chunks, scoring every
+vector with NumPy is both faster than HNSW and exact. The embeddings of
+every shard are snapshotted into <index>/exact/vectors-<token>.npy with the
+ids, shards and metadata alongside in rows-<token>.json. The matrix is
+opened with mmap_mode="r", so gunicorn and Celery workers share one copy
+through the page cache.
+
+On 384-dimension vectors one query takes about 0.5 ms over 5,000 float32
+rows and 1.6 ms over 20,000. HNSW takes about 1.4 ms at either size, and
+its recall@10 falls as the index grows. DTYPE "float16" halves the matrix,
+but BLAS has no float16 kernels: rows are upcast on every query, which is
+roughly ten times slower.
+
+The token is the index generation (sharding.generation), so any write
+makes the next query rebuild the snapshot. The first process to notice
+writes it, and the others load the file. Distances follow the collection's
+HNSW space, so hits rank exactly as Chroma would rank them. Chunk text is
+fetched from Chroma for the top k ids only.
+
+`where` filters support equality, $eq, $ne, $in, $nin, $and and $or on
+metadata; any other operator falls back to HNSW.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from langchain_core.documents import Document
+
+from . import sharding
+
+SNAPSHOT_DIR = "exact"
+SCAN_PAGE_SIZE = 5000
+# Rows scored per matrix product, bounding the float32 copy of float16 rows
+# (float32 rows are used in place)
+SCORE_BLOCK = 8192
+# Stored per chunk for prompts only; never filtered on
+SKIP_METADATA = ("window_before", "window_after")
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class UnsupportedFilter(Exception):
+    pass
+
+
+def _get_config(key, default=None):
+    return getattr(settings, "RAG_CONFIG", {}).get(key, default)
+
+
+def max_chunks() -> int:
+    return _get_config("EXACT_SEARCH", {}).get("MAX_CHUNKS", 0)
+
+
+def enabled() -> bool:
+    return max_chunks() > 0
+
+
+class ExactIndex:
+    def __init__(self, path, ids, shards, metadatas, vectors, space):
+        self.path = path
+        self.ids = ids
+        self.shards = np.asarray(shards, dtype=object)
+        self.vectors = vectors
+        self.space = space
+        self._metadatas = metadatas
+        self._columns = {}
+        if space == "l2":
+            self.sq_norms = np.empty(len(ids), dtype=np.float32)
+            for start in range(0, len(ids), SCORE_BLOCK):
+                block = np.asarray(vectors[start : start + SCORE_BLOCK], dtype=np.float32)
+                self.sq_norms[start : start + len(block)] = (block**2).sum(axis=1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _column(self, key):
+        if key not in self._columns:
+            self._columns[key] = np.asarray(
+                [m.get(key) for m in self._metadatas], dtype=object
+            )
+        return self._columns[key]
+
+    def _mask(self, where):
+        if not where:
+            return None
+        masks = []
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask(part) for part in condition]
+                combine = np.logical_and if key == "$and" else np.logical_or
+                masks.append(combine.reduce(parts))
+                continue
+            column = self._column(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                if op == "$eq":
+                    masks.append(column == value)
+                elif op == "$ne":
+                    masks.append(column != value)
+                elif op == "$in":
+                    masks.append(np.isin(column, list(value)))
+                elif op == "$nin":
+                    masks.append(~np.isin(column, list(value)))
+                else:
+                    raise UnsupportedFilter(op)
+        return np.logical_and.reduce(masks)
+
+    def _distances(self, query):
+        distances = np.empty(len(self.ids), dtype=np.float32)
+        if self.space == "cosine":
+            query = query / max(np.linalg.norm(query), 1e-12)
+        for start in range(0, len(self.ids), SCORE_BLOCK):
+            block = np.asarray(self.vectors[start : start + SCORE_BLOCK], dtype=np.float32)
+            distances[start : start + len(block)] = block @ query
+        if self.space == "l2":
+            # Chroma's l2 is the squared distance
+            return self.sq_norms - 2.0 * distances + query @ query
+        # cosine rows are stored normalized
+        return 1.0 - distances
+
+    def search(self, embedding, k, where=None):
+        """[(id, shard, distance)] of the k nearest chunks matching `where`."""
+        distances = self._distances(np.asarray(embedding, dtype=np.float32))
+        mask = self._mask(where)
+        if mask is not None:
+            distances[~mask] = np.inf
+        k = min(k, int(np.isfinite(distances).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(self.ids[i], self.shards[i], float(distances[i])) for i in top]
+
+
+def _snapshot_paths(path, token):
+    directory = os.path.join(path, SNAPSHOT_DIR)
+    return (
+        directory,
+        os.path.join(directory, f"vectors-{token}.npy"),
+        os.path.join(directory, f"rows-{token}.json"),
+    )
+
+
+def _write_snapshot(path, token, collections, dtype, space):
+    directory, vectors_path, rows_path = _snapshot_paths(path, token)
+    os.makedirs(directory, exist_ok=True)
+    ids, shards, metadatas, blocks = [], [], [], []
+    for shard, collection in collections.items():
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "metadatas"], limit=SCAN_PAGE_SIZE, offset=offset
+            )
+            if len(page["ids"]):
+                ids.extend(page["ids"])
+                shards.extend([shard] * len(page["ids"]))
+                metadatas.extend(
+                    {k: v for k, v in (m or {}).items() if k not in SKIP_METADATA}
+                    for m in page["metadatas"]
+                )
+                block = np.asarray(page["embeddings"], dtype=np.float32)
+                if space == "cosine":
+                    block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+                blocks.append(block.astype(dtype))
+            if len(page["ids"]) < SCAN_PAGE_SIZE:
+                break
+            offset += SCAN_PAGE_SIZE
+    matrix = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=dtype)
+
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(rows_path + suffix, "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "shards": shards, "metadatas": metadatas, "space": space}, f)
+    with open(vectors_path + suffix, "wb") as f:
+        np.save(f, matrix)
+    # rows first: a reader only trusts a snapshot once its vectors exist
+    os.replace(rows_path + suffix, rows_path)
+    os.replace(vectors_path + suffix, vectors_path)
+
+    # Only older snapshots: a process still on an earlier generation must not
+    # remove the one a newer writer has just made
+    for name in os.listdir(directory):
+        if name.endswith(".tmp"):
+            continue
+        other = os.path.splitext(name)[0].partition("-")[2]
+        if other != token and _token_order(other) < _token_order(token):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _open_snapshot(path, token):
+    _, vectors_path, rows_path = _snapshot_paths(path, token)
+    with open(rows_path, encoding="utf-8") as f:
+        rows = json.load(f)
+    vectors = np.load(vectors_path, mmap_mode="r")
+    return ExactIndex(path, rows["ids"], rows["shards"], rows["metadatas"], vectors, rows["space"])
+
+
+def _load(path, embeddings, token):
+    stores = {
+        shard: sharding.get_store(path, shard, embeddings) for shard in sharding.all_shards(path)
+    }
+    collections = {shard: store._collection for shard, store in stores.items()}
+    if sum(c.count() for c in collections.values()) > max_chunks():
+        return None
+    space = "l2"
+    for collection in collections.values():
+        hnsw = (collection.configuration or {}).get("hnsw") or {}
+        space = hnsw.get("space") or space
+        break
+
+    _, vectors_path, _ = _snapshot_paths(path, token)
+    if os.path.exists(vectors_path):
+        try:
+            return _open_snapshot(path, token)
+        except FileNotFoundError:
+            # Removed by another process between the check and the open
+            pass
+    dtype = _get_config("EXACT_SEARCH", {}).get("DTYPE", "float32")
+    _write_snapshot(path, token, collections, dtype, space)
+    try:
+        return _open_snapshot(path, token)
+    except FileNotFoundError:
+        # Removed again straight away; this query falls back to HNSW
+        return None
+
+
+def _token_order(token):
+    """Generation mtime in a snapshot token, for ordering (0 if unknown)."""
+    try:
+        return int(token.rpartition("-")[2])
+    except ValueError:
+        return 0
+
+
+def snapshot_token(path):
+    generation = sharding.generation(path)
+    return f"{generation[0]}-{generation[1]}" if generation else "0"
+
+
+def get_index(path, embeddings):
+    """The exact index of `path`, or None if disabled or the index is too large."""
+    if not enabled():
+        return None
+    token = snapshot_token(path)
+    with _lock:
+        cached = _indexes.get(path)
+        if cached and cached[0] == token:
+            return cached[1]
+        index = _load(path, embeddings, token)
+        _indexes[path] = (token, index)
+        return index
+
+
+def search(path, embeddings, embedding, k, where=None):
+    """
+    [(Document, distance)] like the HNSW fan-out, or None when exact search
+    does not apply (disabled, too many chunks, or an unsupported filter).
+    """
+    index = get_index(path, embeddings)
+    if index is None:
+        return None
+    try:
+        hits = index.search(embedding, k, where)
+    except UnsupportedFilter:
+        return None
+
+    by_shard = {}
+    for id_, shard, _ in hits:
+        by_shard.setdefault(shard, []).append(id_)
+    found = {}
+    for shard, ids in by_shard.items():
+        rows = sharding.get_store(path, shard, embeddings)._collection.get(
+            ids=ids, include=["documents", "metadatas"]
+        )
+        for id_, text, metadata in zip(rows["ids"], rows["documents"], rows["metadatas"]):
+            found[id_] = Document(page_content=text or "", metadata=metadata or {}, id=id_)
+    return [(found[id_], distance) for id_, _, distance in hits if id_ in found]
@@ -0,0 +1,277 @@
+# rag_components/index_health.py
+"""
+Health and performance profile of the vector index.
+
+collect_report() reads the live index (every shard) and returns a plain
+dict, shown by `manage.py vector_index_health` and the admin page:
+- size: chunks per shard and per document, embedding dimension, bytes on
+  disk, and each collection's HNSW parameters
+- near duplicates: chunk pairs above a cosine similarity threshold among
+  `sample` randomly sampled chunks, compared blockwise with NumPy
+- latency: average and p95 of the retrieval fan-out (and of embedding the
+  query) over a probe set
+- recall@k of HNSW against an exact brute-force search over all vectors,
+  streamed page by page so memory stays flat
+
+Probes are the first sentence of sampled chunks unless questions are given.
+"""
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from . import chunking, sharding
+from . import vector_store_update as vsu
+
+DUPLICATE_BLOCK = 512
+
+
+def _disk_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _hnsw(collection):
+    try:
+        config = collection.configuration or {}
+    except Exception:
+        config = {}
+    hnsw = dict(config.get("hnsw") or {})
+    hnsw.setdefault("space", (collection.metadata or {}).get("hnsw:space", "l2"))
+    return hnsw
+
+
+def distances(space, queries, vectors):
+    """Chroma's distance for `space` between every query and vector row."""
+    if space == "cosine":
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return 1.0 - queries @ vectors.T
+    if space == "ip":
+        return 1.0 - queries @ vectors.T
+    # Chroma's "l2" is the squared Euclidean distance
+    return (
+        (queries**2).sum(axis=1)[:, None]
+        - 2.0 * queries @ vectors.T
+        + (vectors**2).sum(axis=1)[None, :]
+    )
+
+
+def _sample(collection, n, rng, block=100):
+    """About `n` rows (ids, documents, metadatas, embeddings) from random pages."""
+    count = collection.count()
+    if not count or not n:
+        return []
+    starts = range(0, count, block)
+    if count > n:
+        starts = sorted(rng.sample(list(starts), min(len(starts), math.ceil(n / block))))
+    rows = []
+    include = ["documents", "metadatas", "embeddings"]
+    for start in starts:
+        page = collection.get(include=include, limit=block, offset=start)
+        rows.extend(
+            zip(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+        )
+    return rows
+
+
+def near_duplicates(rows, threshold=0.98, examples=10):
+    """Pairs of sampled rows whose cosine similarity is >= threshold."""
+    if len(rows) < 2:
+        return {"sampled": len(rows), "threshold": threshold, "pairs": 0, "examples": []}
+    vectors = np.asarray([r[3] for r in rows], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    pairs, found = 0, []
+    for start in range(0, len(vectors), DUPLICATE_BLOCK):
+        similarity = vectors[start : start + DUPLICATE_BLOCK] @ vectors.T
+        # Each pair once: only columns to the right of the diagonal
+        rows_idx = np.arange(similarity.shape[0])[:, None] + start
+        similarity[np.arange(similarity.shape[1])[None, :] <= rows_idx] = -1.0
+        i, j = np.nonzero(similarity >= threshold)
+        pairs += len(i)
+        for a, b in zip(i[:examples], j[:examples]):
+            found.append((float(similarity[a, b]), start + a, b))
+    found.sort(reverse=True)
+
+    def describe(index):
+        _, text, metadata, _ = rows[index]
+        metadata = metadata or {}
+        return {
+            "doc_id": metadata.get("doc_id"),
+            "chunk": metadata.get("chunk"),
+            "text": (text or "")[:120],
+        }
+
+    return {
+        "sampled": len(rows),
+        "threshold": threshold,
+        "pairs": pairs,
+        "examples": [
+            {"similarity": round(s, 4), "a": describe(a), "b": describe(b)}
+            for s, a, b in found[:examples]
+        ],
+    }
+
+
+def exact_top_k(collections, queries, k, page_size=vsu.SCAN_PAGE_SIZE):
+    """
+    Exact [(distance, id)] nearest neighbours per query over every
+    collection, streaming vectors a page at a time and keeping a running
+    top k.
+    """
+    best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=object)
+    for collection in collections:
+        space = _hnsw(collection)["space"]
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+            if len(page["ids"]):
+                d = distances(space, queries, np.asarray(page["embeddings"], dtype=np.float32))
+                ids = np.broadcast_to(np.asarray(page["ids"], dtype=object), d.shape)
+                d = np.concatenate([best_d, d], axis=1)
+                ids = np.concatenate([best_ids, ids], axis=1)
+                keep = np.argsort(d, axis=1)[:, :k]
+                best_d = np.take_along_axis(d, keep, axis=1)
+                best_ids = np.take_along_axis(ids, keep, axis=1)
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+    return [list(zip(d.tolist(), ids)) for d, ids in zip(best_d, best_ids)]
+
+
+def hnsw_top_k(collections, queries, k):
+    """HNSW [(distance, id)] per query, merged across collections by distance."""
+    merged = [[] for _ in queries]
+    for collection in collections:
+        if not collection.count():
+            continue
+        result = collection.query(
+            query_embeddings=queries,
+            n_results=min(k, collection.count()),
+            include=["distances"],
+        )
+        for hits, ids, dists in zip(merged, result["ids"], result["distances"]):
+            hits.extend(zip(dists, ids))
+    return [sorted(hits)[:k] for hits in merged]
+
+
+def recall_at_k(approximate, exact):
+    """
+    Share of the exact top k that HNSW found. A hit is any returned chunk no
+    farther than the exact k-th neighbour, so ties between identical
+    chunks do not count as misses.
+    """
+    scores = []
+    for found, truth in zip(approximate, exact):
+        if not truth:
+            continue
+        limit = truth[-1][0] + 1e-5 * max(1.0, abs(truth[-1][0]))
+        scores.append(min(sum(d <= limit for d, _ in found), len(truth)) / len(truth))
+    return float(np.mean(scores)) if scores else None
+
+
+def _avg_ms(seconds):
+    return float(np.mean(seconds)) * 1000 if seconds else 0.0
+
+
+def _p95_ms(seconds):
+    return float(np.percentile(seconds, 95)) * 1000 if seconds else 0.0
+
+
+def collect_report(
+    sample=2000,
+    probes=50,
+    k=None,
+    threshold=0.98,
+    questions=None,
+    seed=0,
+    path=None,
+    page_size=vsu.SCAN_PAGE_SIZE,
+):
+    """Profile the index at `path` (default: the live one). See module docstring."""
+    path = path or vsu.get_vector_db_path()
+    k = k or vsu._get_config("RETRIEVER_K", 3)
+    rng = random.Random(seed)
+    embeddings = vsu.get_embeddings()
+
+    stores = {
+        shard: sharding.get_store(path, shard, embeddings)
+        for shard in sharding.all_shards(path)
+    }
+    collections = [store._collection for store in stores.values()]
+    shards = [
+        {
+            "shard": shard,
+            "collection": store._collection.name,
+            "chunks": store._collection.count(),
+            "hnsw": _hnsw(store._collection),
+        }
+        for shard, store in stores.items()
+    ]
+    total = sum(s["chunks"] for s in shards)
+
+    counts = vsu.count_chunks_by_doc(path, page_size=page_size)
+    untracked = counts.pop(None, 0)
+
+    # Sample each shard in proportion to its size
+    rows = []
+    for shard, collection in zip(shards, collections):
+        if total:
+            rows.extend(_sample(collection, math.ceil(sample * shard["chunks"] / total), rng))
+    dimension = len(rows[0][3]) if rows else None
+
+    # Probe set
+    if questions:
+        texts = list(questions)[:probes]
+    else:
+        picked = rng.sample(rows, min(probes, len(rows)))
+        texts = [(chunking.split_sentences(r[1] or "") or [""])[0] for r in picked]
+    texts = [t for t in texts if t.strip()]
+
+    embed_seconds, search_seconds, vectors = [], [], []
+    for text in texts:
+        started = time.perf_counter()
+        vector = embeddings.embed_query(text)
+        embed_seconds.append(time.perf_counter() - started)
+        vectors.append(vector)
+        started = time.perf_counter()
+        vsu._search_shards(list(stores.values()), vector, k, None)
+        search_seconds.append(time.perf_counter() - started)
+
+    recall = None
+    if vectors and total:
+        queries = np.asarray(vectors, dtype=np.float32)
+        exact = exact_top_k(collections, queries, k, page_size)
+        recall = recall_at_k(hnsw_top_k(collections, vectors, k), exact)
+
+    total_seconds = [e + s for e, s in zip(embed_seconds, search_seconds)]
+    return {
+        "path": path,
+        "generated_at": time.time(),
+        "disk_bytes": _disk_bytes(path),
+        "chunks": total,
+        "dimension": dimension,
+        "shards": shards,
+        "documents": counts.most_common(),
+        "untracked_chunks": untracked,
+        "duplicates": near_duplicates(rows, threshold),
+        "latency": {
+            "probes": len(texts),
+            "k": k,
+            "search_avg_ms": _avg_ms(search_seconds),
+            "search_p95_ms": _p95_ms(search_seconds),
+            "embed_avg_ms": _avg_ms(embed_seconds),
+            "total_avg_ms": _avg_ms(total_seconds),
+            "total_p95_ms": _p95_ms(total_seconds),
+        },
+        "recall": {"k": k, "probes": len(vectors), "recall": recall},
+    }
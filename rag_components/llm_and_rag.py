@@ -118,7 +118,11 @@ from .agentic_rag import get_agentic_rag_response
 
 
 def get_rag_response(
-    question: str, chat_history: str = None, user_name: str = None, k: int = None
+    question: str,
+    chat_history: str = None,
+    user_name: str = None,
+    k: int = None,
+    audience: str = None,
 ):
     """
     Returns {"answer": ..., "sources": [ {title, content, metadata}, ... ] }
@@ -128,11 +132,12 @@ def get_rag_response(
         chat_history: Formatted string of recent chat history (optional)
         user_name: User's name for personalization (optional)
         k: Number of documents to retrieve (optional, for compatibility)
+        audience: "villager" or "health_worker", filters retrieved material (optional)
     """
     # This function now delegates to the new agentic RAG with context awareness
     try:
         return get_agentic_rag_response(
-            question, chat_history=chat_history, user_name=user_name
+            question, chat_history=chat_history, user_name=user_name, audience=audience
         )
     except Exception as e:
         print(f"RAG wrapper error: {e}")
@@ -0,0 +1,336 @@
+# rag_components/sharding.py
+"""
+Shards of the vector index.
+
+RAG_CONFIG["SHARDING"] = {"STRATEGY": ..., "SHARDS": n} decides which
+Chroma collection a chunk lives in:
+- "none" (default): a single shard, "default", in the collection the index
+  has always used ("langchain"), so existing indexes keep working
+- "topic": one shard per chunk topic (see tagging.py)
+- "uploader": one shard per uploading user
+- "hash": SHARDS shards by a stable hash of doc_id
+
+Searches fan out over the shards in parallel and merge by distance
+(vector_store_update.search); a topic filter on a topic-sharded index
+only touches that shard. Deletes go to every shard.
+
+Which collection serves a shard is recorded in shards.json in the index
+directory. rebuild_shard() fills a new collection while the old one
+keeps serving, then atomically replaces the manifest, so a shard can be
+rebuilt without downtime. Every process re-reads the manifest when its
+mtime changes; the replaced collection is kept for RETIRE_SECONDS so
+queries already running against it finish, and dropped by a later rebuild.
+
+Chroma clients do not see HNSW changes made by other processes (gunicorn
+workers, Celery). Every write replaces the GENERATION file in the index
+directory, and check_generation(), called before each use of the index,
+compares its inode and mtime with the last one this process saw: one stat
+per request, and a reconnect only after another process wrote. The old
+client is not closed under threads still using it; it is retired and its
+resources released once nothing holds it (_retire).
+
+RAG_CONFIG["HNSW"] sets the index parameters of new collections (space,
+ef_construction, ef_search, M). Only ef_search can change on an existing
+collection; the others take effect when the index or shard is rebuilt.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+import zlib
+
+import chromadb
+from django.conf import settings
+from langchain_chroma import Chroma
+
+logger = logging.getLogger(__name__)
+
+# RAG_CONFIG["HNSW"] keys -> Chroma hnsw configuration keys
+HNSW_KEYS = {
+    "SPACE": "space",
+    "EF_CONSTRUCTION": "ef_construction",
+    "EF_SEARCH": "ef_search",
+    "M": "max_neighbors",
+}
+
+DEFAULT_SHARD = "default"
+DEFAULT_COLLECTION = "langchain"
+MANIFEST = "shards.json"
+GENERATION = "GENERATION"
+RETIRE_SECONDS = 600
+
+_clients = {}
+_stores = {}
+_generations = {}
+_manifest = (None, {})
+_lock = threading.Lock()
+
+
+def _get_config(key, default=None):
+    return getattr(settings, "RAG_CONFIG", {}).get(key, default)
+
+
+def strategy():
+    return _get_config("SHARDING", {}).get("STRATEGY", "none")
+
+
+def get_client(path):
+    """One Chroma client per process and path; collections share it."""
+    with _lock:
+        if path not in _clients:
+            os.makedirs(path, exist_ok=True)
+            _clients[path] = chromadb.PersistentClient(path=path)
+        return _clients[path]
+
+
+def forget_path(path):
+    """Close the client and drop the stores of an index directory."""
+    with _lock:
+        client = _forget(path)
+    if client is not None:
+        client.close()
+
+
+def _forget(path):
+    """Drop the cached client and stores of `path`; returns the client."""
+    client = _clients.pop(path, None)
+    for key in [key for key in _stores if key[0] == path]:
+        del _stores[key]
+    return client
+
+
+def _retire(client):
+    """
+    Let the next client for the path load the index from disk again,
+    without closing `client` under threads that are still using it.
+
+    Chroma shares one System per path between clients; closing the last
+    client stops it. Instead the System is detached from Chroma's cache
+    (so a new client starts a fresh one) and stopped once `client` is
+    garbage collected, i.e. when no running query or write holds it.
+    """
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    identifier = client._identifier
+    with SharedSystemClient._refcount_lock:
+        system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+        SharedSystemClient._identifier_to_refcount.pop(identifier, None)
+    # close() would release the refcount of the path's next System
+    client._closed = True
+    if system is not None:
+        weakref.finalize(client, system.stop)
+
+
+def generation(path):
+    """Token that changes whenever any process writes to the index at `path`."""
+    try:
+        stat = os.stat(os.path.join(path, GENERATION))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _check_generation(path):
+    """check_generation() body; the caller holds _lock."""
+    current = generation(path)
+    if _generations.get(path) != current:
+        client = _forget(path)
+        if client is not None:
+            _retire(client)
+        _generations[path] = current
+
+
+def check_generation(path):
+    """Reconnect to the index at `path` if another process has written to it."""
+    with _lock:
+        _check_generation(path)
+
+
+def bump_generation(path):
+    """Tell other processes the index at `path` changed."""
+    os.makedirs(path, exist_ok=True)
+    target = os.path.join(path, GENERATION)
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"{time.time_ns()}\n")
+    # Under the lock, so a sibling thread never sees our own new generation
+    # as another process's write
+    with _lock:
+        _check_generation(path)
+        # A new inode per write, so two writes within the mtime resolution differ
+        os.replace(tmp, target)
+        _generations[path] = generation(path)
+
+
+def collection_configuration():
+    """Chroma configuration for new collections, from RAG_CONFIG["HNSW"]."""
+    hnsw = _get_config("HNSW", {})
+    config = {key: hnsw[name] for name, key in HNSW_KEYS.items() if hnsw.get(name) is not None}
+    return {"hnsw": config} if config else None
+
+
+def _new_store(path, name, embeddings) -> Chroma:
+    config = collection_configuration()
+    store = Chroma(
+        collection_name=name,
+        embedding_function=embeddings,
+        client=get_client(path),
+        collection_configuration=config,
+    )
+    if config:
+        # An existing collection keeps the parameters it was created with;
+        # ef_search is the only one Chroma can change afterwards
+        current = (store._collection.configuration or {}).get("hnsw") or {}
+        wanted = config["hnsw"]
+        if "ef_search" in wanted and current.get("ef_search") != wanted["ef_search"]:
+            store._collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+        stale = [k for k, v in wanted.items() if k != "ef_search" and current.get(k) not in (None, v)]
+        if stale:
+            logger.warning(
+                f"Collection {name} was built with other HNSW {', '.join(stale)}; "
+                "rebuild the index to apply RAG_CONFIG['HNSW']"
+            )
+    return store
+
+
+def shard_for(metadata: dict) -> str:
+    """Shard a chunk belongs in, from its metadata."""
+    kind = strategy()
+    if kind == "topic":
+        return metadata.get("topic") or "general"
+    if kind == "uploader":
+        return f"user{metadata.get('uploader') or 0}"
+    if kind == "hash":
+        shards = _get_config("SHARDING", {}).get("SHARDS", 4)
+        key = str(metadata.get("doc_id") or "")
+        return f"h{zlib.crc32(key.encode()) % shards}"
+    return DEFAULT_SHARD
+
+
+def shards_for_filter(where: dict):
+    """Shards a `where` filter can match, or None for all of them."""
+    if strategy() != "topic" or not where:
+        return None
+    conditions = where.get("$and", [where])
+    for condition in conditions:
+        topic = condition.get("topic")
+        if isinstance(topic, str):
+            return [topic]
+    return None
+
+
+def _manifest_path(path):
+    return os.path.join(path, MANIFEST)
+
+
+def _read_manifest(path) -> dict:
+    global _manifest
+    try:
+        mtime = os.stat(_manifest_path(path)).st_mtime_ns
+    except FileNotFoundError:
+        return {"shards": {}, "retired": {}}
+    if _manifest[0] != (path, mtime):
+        with open(_manifest_path(path), encoding="utf-8") as f:
+            data = json.load(f)
+        data.setdefault("retired", {})
+        _manifest = ((path, mtime), data)
+    return _manifest[1]
+
+
+def load_manifest(path) -> dict:
+    """{shard: collection name}, re-read only when the file changes."""
+    return _read_manifest(path)["shards"]
+
+
+def save_manifest(path, shards: dict, retired: dict = None):
+    """Replace the manifest atomically; readers see the old or new one."""
+    tmp = f"{_manifest_path(path)}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"shards": shards, "retired": retired or {}}, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _manifest_path(path))
+
+
+def collection_name(path, shard: str) -> str:
+    name = load_manifest(path).get(shard)
+    if name:
+        return name
+    return DEFAULT_COLLECTION if shard == DEFAULT_SHARD else f"rag_{shard}"
+
+
+def all_shards(path) -> list:
+    """Shards in the manifest plus any collection created on the fly."""
+    shards = set(load_manifest(path))
+    names = {collection_name(path, shard) for shard in shards}
+    for collection in get_client(path).list_collections():
+        name = getattr(collection, "name", collection)
+        if name in names:
+            continue
+        if name == DEFAULT_COLLECTION:
+            shards.add(DEFAULT_SHARD)
+        elif name.startswith("rag_") and "__" not in name:
+            shards.add(name[4:])
+    return sorted(shards)
+
+
+def get_store(path, shard: str, embeddings) -> Chroma:
+    name = collection_name(path, shard)
+    with _lock:
+        store = _stores.get((path, name))
+    if store is None:
+        store = _new_store(path, name, embeddings)
+        with _lock:
+            _stores[(path, name)] = store
+    return store
+
+
+def clear_store_cache():
+    with _lock:
+        _stores.clear()
+
+
+def rebuild_shard(path, shard: str, chunk_batches, embeddings) -> int:
+    """
+    Rebuild `shard` from `chunk_batches` (lists of chunks; those belonging
+    to other shards are skipped) without taking it offline. Returns the
+    number of chunks indexed.
+    """
+    old = collection_name(path, shard)
+    new = f"rag_{shard}__{int(time.time())}"
+    store = _new_store(path, new, embeddings)
+    count = 0
+    try:
+        for batch in chunk_batches:
+            batch = [c for c in batch if shard_for(c.metadata) == shard]
+            if batch:
+                store.add_documents(batch)
+                count += len(batch)
+    except Exception:
+        _drop_collection(path, new)
+        raise
+
+    manifest = _read_manifest(path)
+    shards = {**manifest["shards"], shard: new}
+    now = time.time()
+    retired = {}
+    for name, since in {**manifest["retired"], old: now}.items():
+        if now - since < RETIRE_SECONDS:
+            retired[name] = since
+        else:
+            _drop_collection(path, name)
+    save_manifest(path, shards, retired)
+    bump_generation(path)
+    return count
+
+
+def _drop_collection(path, name):
+    try:
+        get_client(path).delete_collection(name)
+    except Exception:
+        # Already gone, or never created
+        pass
+    with _lock:
+        _stores.pop((path, name), None)
@@ -0,0 +1,135 @@
+# rag_components/tagging.py
+"""
+Chunk tags for metadata-filtered retrieval.
+
+At ingestion every chunk gets:
+- language: "ne" when most of its letters are Devanagari, else "en"
+- topic: the TOPIC_KEYWORDS entry with the most hits in the document
+  title, section headings and text, or "general"
+- audience: "health_worker" for clinical material (doses, protocols,
+  referral criteria), else "villager"
+
+At query time retrieval_filters() turns the question's language and topic
+and the asker's role into Chroma `where` filters, from the most specific
+to none, and retrieval uses the first one that finds anything. Chunks
+indexed before tagging have none of these keys and are only reached by the
+unfiltered fallback.
+"""
+import re
+
+DEVANAGARI = re.compile(r"[ऀ-ॿ]")
+LETTER = re.compile(r"[^\W\d_]")
+
+TOPIC_KEYWORDS = {
+    "maternal_health": [
+        "pregnan", "antenatal", "postnatal", "delivery", "labour", "labor",
+        "breastfeed", "maternal", "midwife", "garbha", "prasuti",
+        "गर्भवती", "गर्भ", "सुत्केरी", "प्रसूति", "स्तनपान",
+    ],
+    "child_health": [
+        "child", "infant", "newborn", "baby", "immuni", "vaccin", "diarrh",
+        "pneumonia", "baccha", "bacha", "बच्चा", "शिशु", "नवजात", "खोप",
+    ],
+    "nutrition": [
+        "nutrition", "diet", "malnutrition", "anaemia", "anemia", "vitamin",
+        "protein", "पोषण", "खाना", "कुपोषण", "रक्तअल्पता",
+    ],
+    "infectious_disease": [
+        "malaria", "tuberculosis", "tb ", "dengue", "typhoid", "cholera",
+        "hiv", "infection", "fever", "mosquito", "औलो", "क्षयरोग", "ज्वरो", "संक्रमण",
+    ],
+    "chronic_disease": [
+        "diabetes", "hypertension", "blood pressure", "asthma", "copd",
+        "heart", "kidney", "cancer", "मधुमेह", "उच्च रक्तचाप",
+    ],
+    "mental_health": [
+        "mental", "depress", "anxiety", "stress", "suicid", "मानसिक", "तनाव", "चिन्ता",
+    ],
+    "hygiene_sanitation": [
+        "hygiene", "sanitation", "handwash", "hand wash", "toilet", "latrine",
+        "clean water", "drinking water", "सरसफाइ", "शौचालय", "हात धुने", "खानेपानी",
+    ],
+    "first_aid": [
+        "first aid", "wound", "burn", "bleeding", "fracture", "snake bite",
+        "snakebite", "poison", "injury", "प्राथमिक उपचार", "घाउ", "पोलेको", "सर्पदंश",
+    ],
+}
+
+CLINICAL_TERMS = [
+    "dosage", "dose", " mg", "mg/kg", " ml", "protocol", "guideline",
+    "diagnos", "differential", "contraindicat", "prescri", "referral",
+    "refer to", "clinical", "injection", "intravenous", " iv ", "management of",
+    "treatment algorithm", "मात्रा", "प्रेषण",
+]
+# Clinical terms a section needs before it is tagged for health workers
+CLINICAL_THRESHOLD = 3
+
+
+def detect_language(text: str) -> str:
+    letters = len(LETTER.findall(text))
+    if not letters:
+        return "en"
+    return "ne" if len(DEVANAGARI.findall(text)) / letters >= 0.3 else "en"
+
+
+def detect_topic(text: str) -> str:
+    text = text.lower()
+    scores = {
+        topic: sum(text.count(keyword) for keyword in keywords)
+        for topic, keywords in TOPIC_KEYWORDS.items()
+    }
+    topic, score = max(scores.items(), key=lambda item: item[1])
+    return topic if score else "general"
+
+
+def detect_audience(text: str) -> str:
+    text = f" {text.lower()} "
+    hits = sum(text.count(term) for term in CLINICAL_TERMS)
+    return "health_worker" if hits >= CLINICAL_THRESHOLD else "villager"
+
+
+def section_tags(section) -> dict:
+    """topic and audience of a loader section, in the context of its document."""
+    context = " ".join(
+        [
+            section.metadata.get("source") or "",
+            section.metadata.get("section") or "",
+            section.page_content,
+        ]
+    )
+    return {"topic": detect_topic(context), "audience": detect_audience(section.page_content)}
+
+
+def _where(conditions):
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def retrieval_filters(question: str, audience: str = None) -> list:
+    """
+    Chroma `where` filters to try in order, ending with None (no filter).
+
+    Villagers are first searched against villager material only; health
+    workers search both audiences.
+    """
+    language = {"language": detect_language(question)}
+    topic = detect_topic(question)
+    topic = {"topic": topic} if topic != "general" else None
+    audience = {"audience": "villager"} if audience == "villager" else None
+
+    candidates = [
+        [language, topic, audience],
+        [language, audience],
+        [topic, audience],
+        [audience],
+        [],
+    ]
+    filters = []
+    for conditions in candidates:
+        where = _where([c for c in conditions if c])
+        if where not in filters:
+            filters.append(where)
+    return filters
@@ -1,13 +1,26 @@
 # rag_components/vector_store_update.py
+import heapq
 import os
-from typing import List
+import re
+import shutil
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, List, NamedTuple, Optional
+from xml.etree import ElementTree
+
 from django.conf import settings
+from django.utils import timezone
 
 # langchain imports (adjust to installed provider libs)
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+
+from . import chunking, exact_search, sharding, tagging
 
 
 # helpers
@@ -18,35 +31,255 @@ def _get_config(key, default=None):
 ####################
 # Loading & splitting
 ####################
-def load_file_with_metadata(
+# Loaders are generators: they yield one page (PDF) or one section (DOCX,
+# Markdown, text) at a time, so a large upload is never held in memory as a
+# whole. Register a new format with @register_loader(".ext").
+LOADERS = {}
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MD_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+MD_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+MD_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+def register_loader(*extensions):
+    def decorator(loader):
+        for ext in extensions:
+            LOADERS[ext.lower()] = loader
+        return loader
+
+    return decorator
+
+
+def get_loader(file_path: str):
+    return LOADERS.get(os.path.splitext(file_path)[1].lower())
+
+
+def _sections(blocks, max_chars: int = None) -> Iterator[Document]:
+    """
+    Group (kind, text, level) blocks into sections that end at headings.
+
+    kind is "heading" (level 1-9), "list" (one item) or "text". Each section
+    starts with its heading and carries the heading path in
+    metadata["section"]; consecutive list items stay together. A section
+    longer than SECTION_MAX_CHARS is cut at a block boundary.
+    """
+    max_chars = max_chars or _get_config("SECTION_MAX_CHARS", 8000)
+    path, parts, size = [], [], 0
+
+    def section():
+        text = ""
+        for i, (kind, part, _) in enumerate(parts):
+            if i:
+                text += "\n" if kind == "list" and parts[i - 1][0] == "list" else "\n\n"
+            text += part
+        return Document(page_content=text, metadata={"section": " > ".join(path)})
+
+    def has_body():
+        return any(kind != "heading" for kind, _, _ in parts)
+
+    for kind, text, level in blocks:
+        text = text.strip("\n").rstrip()
+        if not text.strip():
+            continue
+        if kind == "heading":
+            text = text.strip()
+            if has_body():
+                yield section()
+                parts, size = [], 0
+            # Keep parent headings that have no body yet, drop siblings
+            parts = [p for p in parts if p[2] < level]
+            path = path[: level - 1] + [text]
+        elif size + len(text) > max_chars and parts:
+            yield section()
+            parts, size = [], 0
+        parts.append((kind, text, level))
+        size += len(text)
+
+    if has_body():
+        yield section()
+
+
+def _markdown_blocks(lines):
+    paragraph, fence = [], None
+
+    def flush():
+        text = "\n".join(paragraph)
+        paragraph.clear()
+        return text
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if fence:
+            paragraph.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                yield "text", flush(), 0
+            continue
+        match = MD_FENCE.match(line)
+        if match:
+            if paragraph:
+                yield ("list" if MD_LIST_ITEM.match(paragraph[0]) else "text"), flush(), 0
+            fence = match.group(1)
+            paragraph.append(line)
+            continue
+        heading = MD_HEADING.match(line)
+        if heading or not line.strip() or MD_LIST_ITEM.match(line):
+            if paragraph:
+                yield ("list" if MD_LIST_ITEM.match(paragraph[0]) else "text"), flush(), 0
+            if heading:
+                yield "heading", heading.group(2), len(heading.group(1))
+            elif line.strip():
+                paragraph.append(line)
+            continue
+        paragraph.append(line)
+
+    if paragraph:
+        yield ("list" if MD_LIST_ITEM.match(paragraph[0]) else "text"), flush(), 0
+
+
+def _text_blocks(lines):
+    paragraph = []
+    for line in lines:
+        if line.strip():
+            paragraph.append(line.rstrip("\r\n"))
+        elif paragraph:
+            yield "text", "\n".join(paragraph), 0
+            paragraph = []
+    if paragraph:
+        yield "text", "\n".join(paragraph), 0
+
+
+def _docx_paragraph(element):
+    """(kind, text, level) for a w:p element."""
+    text = []
+    for node in element.iter():
+        if node.tag == WORD_NS + "t" and node.text:
+            text.append(node.text)
+        elif node.tag == WORD_NS + "tab":
+            text.append("\t")
+        elif node.tag in (WORD_NS + "br", WORD_NS + "cr"):
+            text.append("\n")
+    text = "".join(text)
+
+    style = element.find(f"{WORD_NS}pPr/{WORD_NS}pStyle")
+    style = style.get(WORD_NS + "val", "") if style is not None else ""
+    if style == "Title":
+        return "heading", text, 1
+    if style.startswith("Heading") and style[7:].isdigit():
+        return "heading", text, int(style[7:])
+    if element.find(f"{WORD_NS}pPr/{WORD_NS}numPr") is not None or style.startswith("List"):
+        return "list", f"- {text}", 0
+    return "text", text, 0
+
+
+def _docx_blocks(file_path):
+    """Stream the paragraphs of word/document.xml; table rows become one line."""
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+        body, table_depth, row, cell = None, 0, [], []
+
+        def discard(element):
+            # Detach parsed top-level elements so memory stays flat
+            if body is not None and len(body) and body[0] is element:
+                del body[0]
+            else:
+                element.clear()
+
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == WORD_NS + "body":
+                    body = element
+                elif tag == WORD_NS + "tbl":
+                    table_depth += 1
+                continue
+            if tag == WORD_NS + "p":
+                kind, text, level = _docx_paragraph(element)
+                if table_depth:
+                    cell.append(text)
+                else:
+                    yield kind, text, level
+                    discard(element)
+            elif tag == WORD_NS + "tc":
+                row.append(" ".join(t for t in cell if t))
+                cell = []
+            elif tag == WORD_NS + "tr":
+                yield "text", " | ".join(row), 0
+                row = []
+            elif tag == WORD_NS + "tbl":
+                table_depth -= 1
+                if not table_depth:
+                    discard(element)
+
+
+@register_loader(".pdf")
+def load_pdf(file_path: str) -> Iterator[Document]:
+    # One Document per page
+    yield from PyPDFLoader(file_path).lazy_load()
+
+
+@register_loader(".txt")
+def load_text(file_path: str) -> Iterator[Document]:
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        yield from _sections(_text_blocks(f))
+
+
+@register_loader(".md", ".markdown")
+def load_markdown(file_path: str) -> Iterator[Document]:
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        yield from _sections(_markdown_blocks(f))
+
+
+@register_loader(".docx")
+def load_docx(file_path: str) -> Iterator[Document]:
+    yield from _sections(_docx_blocks(file_path))
+
+
+def iter_file_with_metadata(
     file_path: str, source_name: str = None, doc_id: str = None
-):
-    """Load file and attach metadata."""
+) -> Iterator[Document]:
+    """Yield the pages/sections of a file with metadata attached."""
     filename = os.path.basename(file_path)
-    if filename.lower().endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
-    elif filename.lower().endswith(".txt"):
-        loader = TextLoader(file_path, encoding="utf-8")
-    else:
-        # unsupported -> return empty
-        return []
+    loader = get_loader(file_path)
+    if loader is None:
+        # unsupported -> nothing
+        return
 
-    docs = loader.load()
-    for d in docs:
+    for d in loader(file_path):
         # attach helpful metadata
         d.metadata["source"] = source_name or filename
         d.metadata["doc_id"] = doc_id
         d.metadata["filename"] = filename
-    return docs
+        yield d
+
+
+def load_file_with_metadata(
+    file_path: str, source_name: str = None, doc_id: str = None
+):
+    """Load file and attach metadata."""
+    return list(iter_file_with_metadata(file_path, source_name, doc_id))
 
 
 def split_documents(documents: List):
-    chunk_size = _get_config("CHUNK_SIZE", 1000)
-    chunk_overlap = _get_config("CHUNK_OVERLAP", 200)
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len
-    )
-    return splitter.split_documents(documents)
+    """Token-based chunks of loader pages/sections, see chunking.py."""
+    return chunking.split_documents(documents)
+
+
+def iter_file_chunks(
+    file_path: str, source_name: str = None, doc_id: str = None
+) -> Iterator[Document]:
+    """Chunks of a file, split and tagged one page/section at a time."""
+    for section in iter_file_with_metadata(file_path, source_name, doc_id):
+        section.metadata.update(tagging.section_tags(section))
+        for chunk in split_documents([section]):
+            chunk.metadata["language"] = tagging.detect_language(chunk.page_content)
+            yield chunk
+
+
+def _batches(items, size):
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 ####################
@@ -68,137 +301,426 @@ def get_embeddings():
     return _embeddings_cache
 
 
-def get_vector_db_path():
+# VECTOR_DB_PATH holds index directories and a CURRENT file naming the live
+# one; rebuild_vector_index() builds a new directory and swaps CURRENT.
+# Without CURRENT (never rebuilt) the index lives in VECTOR_DB_PATH itself.
+POINTER_FILE = "CURRENT"
+_pointer = (None, None)
+
+
+def get_index_root():
     return _get_config("VECTOR_DB_PATH", os.path.join(settings.BASE_DIR, "vector_db"))
 
 
-# Cache management
-_vector_store_cache = None
+def _live_path():
+    global _pointer
+    root = get_index_root()
+    pointer = os.path.join(root, POINTER_FILE)
+    try:
+        mtime = os.stat(pointer).st_mtime_ns
+    except FileNotFoundError:
+        return root
+    if _pointer[0] != (pointer, mtime):
+        with open(pointer, encoding="utf-8") as f:
+            _pointer = ((pointer, mtime), os.path.join(root, f.read().strip()))
+    return _pointer[1]
+
+
+def get_vector_db_path():
+    """
+    Directory of the live index. CURRENT is re-read when it changes, and
+    cached stores are refreshed if another process wrote to the index.
+    """
+    path = _live_path()
+    sharding.check_generation(path)
+    return path
 
 
-def get_vector_store():
+# Cache management: stores are cached per shard collection in sharding.py
+def get_vector_store(shard: str = sharding.DEFAULT_SHARD):
     """
-    Get vector store instance. Uses caching but respects cache clears after deletions.
+    Get vector store instance for a shard (the only one unless sharding is
+    configured). Uses caching but respects cache clears after deletions.
     """
-    global _vector_store_cache
+    return sharding.get_store(get_vector_db_path(), shard, get_embeddings())
 
-    # If cache exists, return it
-    if _vector_store_cache is not None:
-        return _vector_store_cache
 
-    # Otherwise create new instance
+def get_vector_stores():
+    """{shard: store} for every shard of the index."""
     path = get_vector_db_path()
-    os.makedirs(path, exist_ok=True)
     embeddings = get_embeddings()
-    _vector_store_cache = Chroma(persist_directory=path, embedding_function=embeddings)
-    return _vector_store_cache
+    return {
+        shard: sharding.get_store(path, shard, embeddings)
+        for shard in sharding.all_shards(path)
+    }
 
 
-def _clear_vector_store_cache():
-    """Clear the cached vector store to force fresh connection."""
-    global _vector_store_cache
-    _vector_store_cache = None
+def _clear_vector_store_cache(path=None):
+    """
+    Make every process (gunicorn workers, Celery) reconnect to the index
+    before its next query, so none keeps serving deleted chunks.
+    """
+    sharding.bump_generation(path or get_vector_db_path())
     print("Vector store cache cleared")
 
 
+def _add_chunks(chunks, embeddings=None, path=None):
+    """Add chunks to the shards they belong in."""
+    by_shard = {}
+    for chunk in chunks:
+        by_shard.setdefault(sharding.shard_for(chunk.metadata), []).append(chunk)
+    path = path or get_vector_db_path()
+    embeddings = embeddings or get_embeddings()
+    for shard, group in by_shard.items():
+        # add_documents will compute embeddings for only these chunks
+        sharding.get_store(path, shard, embeddings).add_documents(group)
+
+
 ####################
 # Incremental ops
 ####################
-def add_file_to_vector_db(file_path: str, doc_id: str, source_name: str = None):
+def add_file_to_vector_db(
+    file_path: str, doc_id: str, source_name: str = None, metadata: dict = None
+):
     """
-    Load a file, split it into chunks, and add to an existing Chroma store.
-    Each chunk has metadata including doc_id to allow deletes.
+    Load a file, split it into chunks, and add them to the Chroma store.
+    Each chunk has metadata including doc_id to allow deletes, plus any
+    extra `metadata` (e.g. uploader, used for sharding). Chunks are
+    embedded EMBED_BATCH_SIZE at a time while the file is still being read.
     """
-    path = get_vector_db_path()
-    os.makedirs(path, exist_ok=True)
-    embeddings = get_embeddings()
-    vector_store = get_vector_store()
-
-    docs = load_file_with_metadata(file_path, source_name=source_name, doc_id=doc_id)
-    if not docs:
-        return vector_store
-
-    chunks = split_documents(docs)
-    if not chunks:
-        return vector_store
-
-    # add_documents will compute embeddings for only these chunks
-    vector_store.add_documents(chunks)
-    # ChromaDB auto-persists in newer versions, no need for .persist()
-    return vector_store
+    # Embed and store in batches as the file is parsed
+    batch_size = _get_config("EMBED_BATCH_SIZE", 64)
+    chunks = iter_file_chunks(file_path, source_name=source_name, doc_id=doc_id)
+    added = False
+    for batch in _batches(chunks, batch_size):
+        for chunk in batch:
+            chunk.metadata.update(metadata or {})
+        _add_chunks(batch)
+        added = True
+    # ChromaDB auto-persists in newer versions, no need for .persist(); other
+    # processes still need to reconnect to see the new chunks
+    if added:
+        sharding.bump_generation(get_vector_db_path())
 
 
 def delete_document_vectors_by_doc_id(doc_id: str):
     """
-    Delete all vectors whose metadata.doc_id == doc_id.
+    Delete all vectors whose metadata.doc_id == doc_id, in every shard.
     Uses ChromaDB's where clause to filter by metadata.
-    Forces a fresh reload of the collection to avoid caching issues.
+    Other processes reload the collections before their next query.
     """
-    vector_store = get_vector_store()
-
-    # Get the underlying Chroma collection
-    collection = vector_store._collection
-
-    # Query for all document IDs with matching doc_id metadata
+    deleted = 0
     try:
-        # ChromaDB uses 'where' parameter for metadata filtering
-        results = collection.get(where={"doc_id": doc_id})
+        for vector_store in get_vector_stores().values():
+            collection = vector_store._collection
+            # ChromaDB uses 'where' parameter for metadata filtering
+            ids_to_delete = collection.get(where={"doc_id": doc_id}, include=[])["ids"]
+            if ids_to_delete:
+                collection.delete(ids=ids_to_delete)
+                deleted += len(ids_to_delete)
+    except Exception as e:
+        print(f"Error deleting vectors for doc_id {doc_id}: {e}")
+        raise
 
-        # Extract the IDs to delete
-        ids_to_delete = results.get("ids", [])
+    if deleted:
+        print(f"Deleted {deleted} chunks for doc_id: {doc_id}")
+        _clear_vector_store_cache()
+    else:
+        print(f"No chunks found for doc_id: {doc_id}")
+    return deleted
 
-        if ids_to_delete:
-            # Delete by IDs
-            collection.delete(ids=ids_to_delete)
-            print(f"Deleted {len(ids_to_delete)} chunks for doc_id: {doc_id}")
 
-            # CRITICAL: Clear any module-level caches by getting a fresh instance
-            # This ensures subsequent retrievals don't use stale cached data
-            _clear_vector_store_cache()
-        else:
-            print(f"No chunks found for doc_id: {doc_id}")
+####################
+# Reconciliation (cleanup_vector_db)
+####################
+# Scans page through collections with limit/offset and only fetch metadata,
+# so memory stays flat on collections with millions of chunks.
+SCAN_PAGE_SIZE = 5000
+DELETE_BATCH_SIZE = 500
 
-    except Exception as e:
-        print(f"Error deleting vectors for doc_id {doc_id}: {e}")
-        raise
 
-    return vector_store
+def count_chunks_by_doc(path=None, page_size: int = SCAN_PAGE_SIZE) -> Counter:
+    """
+    {doc_id: chunks} over every shard, in one paged pass. Chunks without a
+    doc_id are counted under None.
+    """
+    path = path or get_vector_db_path()
+    counts = Counter()
+    for shard in sharding.all_shards(path):
+        collection = sharding.get_store(path, shard, get_embeddings())._collection
+        offset = 0
+        while True:
+            rows = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            counts.update((m or {}).get("doc_id") for m in rows["metadatas"])
+            if len(rows["ids"]) < page_size:
+                break
+            offset += page_size
+    return counts
+
+
+def delete_doc_ids(doc_ids, path=None, batch_size: int = DELETE_BATCH_SIZE):
+    """Delete the chunks of many documents, batch_size doc_ids per call per shard."""
+    doc_ids = sorted(doc_ids)
+    if not doc_ids:
+        return
+    live = path is None
+    path = path or get_vector_db_path()
+    for shard in sharding.all_shards(path):
+        collection = sharding.get_store(path, shard, get_embeddings())._collection
+        for start in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[start : start + batch_size]
+            collection.delete(where={"doc_id": {"$in": batch}})
+    if live:
+        _clear_vector_store_cache(path)
 
 
 ####################
 # Full rebuild (management command likely)
 ####################
-def rebuild_vector_db_from_media():
-    """Rebuild entire vector DB from all files under MEDIA_ROOT/documents."""
-    path = get_vector_db_path()
-    os.makedirs(path, exist_ok=True)
+class IndexSource(NamedTuple):
+    """A file to index, as listed by documents.utils.index_sources()."""
+
+    file_path: str
+    doc_id: str
+    source_name: str
+    metadata: dict
+    updated_at: Optional[datetime] = None
+
+
+def _ingest(source: IndexSource, path: str, embeddings) -> int:
+    """Index one file into the index at `path`; returns its chunk count."""
+    batch_size = _get_config("EMBED_BATCH_SIZE", 64)
+    count = 0
+    chunks = iter_file_chunks(source.file_path, source.source_name, source.doc_id)
+    for batch in _batches(chunks, batch_size):
+        for chunk in batch:
+            chunk.metadata.update(source.metadata or {})
+        _add_chunks(batch, embeddings, path)
+        count += len(batch)
+    return count
+
+
+def _validate(path, expected: dict):
+    """Raise if the index at `path` does not hold exactly the expected chunks."""
+    actual = count_chunks_by_doc(path)
+    wrong = {
+        doc_id: (count, actual.get(doc_id, 0))
+        for doc_id, count in expected.items()
+        if actual.get(doc_id, 0) != count
+    }
+    extra = set(actual) - set(expected)
+    if wrong or extra:
+        raise RuntimeError(
+            f"New index failed validation: chunk counts (expected, found) {wrong}, "
+            f"unexpected doc_ids {sorted(extra, key=str)}"
+        )
+    if sum(expected.values()):
+        docs, _ = search_index(path, "health", k=1)
+        if not docs:
+            raise RuntimeError("New index failed validation: probe query found nothing")
+
+
+def _switch_pointer(root, name):
+    """Atomically point CURRENT at index directory `name`."""
+    pointer = os.path.join(root, POINTER_FILE)
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+
+
+def _prune_indexes(root, keep):
+    """Delete all but the newest `keep` index directories (never the live one)."""
+    live = os.path.basename(get_vector_db_path())
+    names = sorted(
+        (n for n in os.listdir(root) if n.startswith("index-") and n != live),
+        reverse=True,
+    )
+    for name in names[max(keep - 1, 0):]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def rebuild_vector_index(list_sources, workers: int = None, log=print) -> dict:
+    """
+    Blue/green rebuild of the whole index.
+
+    `list_sources()` returns the IndexSources to index (the Document table).
+    A new index directory is filled in parallel while the live one keeps
+    serving, then documents added, changed or deleted meanwhile are caught
+    up, the result is validated and CURRENT is switched atomically. Writes
+    keep going to the live index throughout, so the catch-up is repeated
+    after validation and once more after the switch. Processes move to the
+    new index on their next request. On any failure before the switch the
+    new directory is removed and the live index is untouched.
+
+    Returns {"path", "documents", "chunks"}.
+    """
+    root = get_index_root()
+    os.makedirs(root, exist_ok=True)
+    name = f"index-{timezone.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+    path = os.path.join(root, name)
+    workers = workers or _get_config("INDEX_WORKERS", 4)
     embeddings = get_embeddings()
+    started = timezone.now()
+    expected = {}
+
+    def ingest_all(sources):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reindex") as pool:
+            futures = {pool.submit(_ingest, s, path, embeddings): s for s in sources}
+            for future in futures:
+                expected[futures[future].doc_id] = future.result()
+
+    def catch_up(since):
+        """Apply uploads, edits and deletes made since `since`; returns how many."""
+        current = {s.doc_id: s for s in list_sources()}
+        gone = set(expected) - set(current)
+        delete_doc_ids(gone, path)
+        for doc_id in gone:
+            del expected[doc_id]
+        changed = [
+            s
+            for doc_id, s in current.items()
+            if doc_id not in expected or (s.updated_at and s.updated_at >= since)
+        ]
+        delete_doc_ids([s.doc_id for s in changed], path)
+        ingest_all(changed)
+        return len(gone) + len(changed)
 
-    # collect all docs from media/documents
-    upload_dir = os.path.join(settings.MEDIA_ROOT, "documents")
-    all_docs = []
-    if not os.path.exists(upload_dir):
-        return Chroma(persist_directory=path, embedding_function=embeddings)
-
-    for filename in os.listdir(upload_dir):
-        file_path = os.path.join(upload_dir, filename)
-        # If uploaded filenames are UUIDs this filename might not contain readable title; include filename
-        docs = load_file_with_metadata(file_path, source_name=filename, doc_id=None)
-        all_docs.extend(docs)
-
-    chunks = split_documents(all_docs)
-    if chunks:
-        return Chroma.from_documents(
-            documents=chunks, embedding=embeddings, persist_directory=path
-        )
+    try:
+        sources = list(list_sources())
+        log(f"Indexing {len(sources)} documents into {name} with {workers} workers")
+        ingest_all(sources)
+
+        # Catch up with uploads, edits and deletes made during the build.
+        # Each pass re-checks whatever changed since the previous one started.
+        since, started = started, timezone.now()
+        caught = catch_up(since)
+        if caught:
+            log(f"Caught up {caught} documents changed during the build")
+
+        _validate(path, expected)
+
+        # Validation scans every chunk; catch up again right before the switch
+        since, started = started, timezone.now()
+        caught = catch_up(since)
+        if caught:
+            log(f"Caught up {caught} documents changed during validation")
+    except Exception:
+        sharding.forget_path(path)
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+    _switch_pointer(root, name)
+
+    # Writers that read CURRENT just before the switch went to the old index
+    try:
+        caught = catch_up(started)
+    except Exception as e:
+        log(f"Catch-up after the switch failed ({e}); run the rebuild again")
     else:
-        return Chroma(persist_directory=path, embedding_function=embeddings)
+        if caught:
+            log(f"Caught up {caught} documents changed during the switch")
+
+    _prune_indexes(root, _get_config("INDEX_KEEP", 2))
+    return {"path": path, "documents": len(expected), "chunks": sum(expected.values())}
+
+
+def rebuild_shard(shard: str, sources) -> int:
+    """
+    Rebuild one shard of the live index from `sources` (IndexSources)
+    while the current copy keeps serving queries.
+    """
+    batch_size = _get_config("EMBED_BATCH_SIZE", 64)
+
+    def batches():
+        for source in sources:
+            chunks = iter_file_chunks(source.file_path, source.source_name, source.doc_id)
+            for batch in _batches(chunks, batch_size):
+                for chunk in batch:
+                    chunk.metadata.update(source.metadata or {})
+                yield batch
+
+    return sharding.rebuild_shard(get_vector_db_path(), shard, batches(), get_embeddings())
 
 
 ####################
 # Retriever convenience
 ####################
-def get_retriever(k: int = None):
-    vs = get_vector_store()
-    search_k = k or _get_config("RETRIEVER_K", 3)
-    return vs.as_retriever(search_kwargs={"k": search_k})
+_executor = None
+
+
+def _search_shards(stores, embedding, k, where):
+    """Query shards in parallel and merge the hits by distance."""
+    global _executor
+    if len(stores) == 1:
+        return stores[0].similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter=where
+        )
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=_get_config("SHARD_QUERY_WORKERS", 8),
+            thread_name_prefix="shard-query",
+        )
+    futures = [
+        _executor.submit(
+            store.similarity_search_by_vector_with_relevance_scores,
+            embedding,
+            k=k,
+            filter=where,
+        )
+        for store in stores
+    ]
+    hits = [hit for future in futures for hit in future.result()]
+    return heapq.nsmallest(k, hits, key=lambda hit: hit[1])
+
+
+def search_index(path, query: str, k: int = None, filters=(None,)):
+    embeddings = get_embeddings()
+    k = k or _get_config("RETRIEVER_K", 3)
+    embedding = embeddings.embed_query(query)
+    shards = sharding.all_shards(path) or [sharding.DEFAULT_SHARD]
+    for where in filters:
+        # Small indexes are searched exactly (exact_search.py)
+        hits = exact_search.search(path, embeddings, embedding, k, where)
+        if hits is None:
+            targets = [s for s in sharding.shards_for_filter(where) or shards if s in shards]
+            stores = [sharding.get_store(path, shard, embeddings) for shard in targets]
+            hits = _search_shards(stores, embedding, k, where) if stores else []
+        if hits:
+            return [doc for doc, _ in hits], where
+    return [], None
+
+
+def search(query: str, k: int = None, filters=(None,)):
+    """
+    Top-k chunks for `query` under the first `where` filter in `filters`
+    that matches anything, across all shards the filter can match. The
+    query is embedded once for all attempts. Below EXACT_SEARCH's
+    MAX_CHUNKS the search is brute force instead of HNSW.
+
+    Returns (documents, where).
+    """
+    return search_index(get_vector_db_path(), query, k, filters)
+
+
+class ShardedRetriever(BaseRetriever):
+    """Retriever over every shard (or the exact index), via search()."""
+
+    k: int = 3
+    where: Optional[dict] = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return search(query, k=self.k, filters=[self.where])[0]
+
+
+def get_retriever(k: int = None, where: dict = None):
+    """Retriever over the store; `where` is a Chroma metadata filter."""
+    k = k or _get_config("RETRIEVER_K", 3)
+    if sharding.strategy() != "none" or exact_search.enabled():
+        return ShardedRetriever(k=k, where=where)
+    search_kwargs = {"k": k}
+    if where:
+        search_kwargs["filter"] = where
+    return get_vector_store().as_retriever(search_kwargs=search_kwargs)
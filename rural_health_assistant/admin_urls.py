@@ -56,6 +56,11 @@ urlpatterns = [
     # Document Management
     path("documents/", admin_views.document_list, name="document_list"),
     path("documents/create/", admin_views.document_create, name="document_create"),
+    path(
+        "documents/index-health/",
+        admin_views.vector_index_health,
+        name="vector_index_health",
+    ),
     path(
         "documents/<int:document_id>/",
         admin_views.document_detail,
@@ -92,4 +97,9 @@ urlpatterns = [
     path("profile/", admin_views.admin_profile, name="profile"),
     # Export
     path("export/", admin_views.export_data, name="export_data"),
+    path(
+        "export/download/<str:filename>/",
+        admin_views.export_download,
+        name="export_download",
+    ),
 ]
@@ -5,22 +5,47 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.db.models import Count, Q, Avg
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
+from django.urls import reverse
 from django.core.paginator import Paginator
+from django.conf import settings
+from django.core.cache import cache
 from datetime import timedelta, datetime
 from accounts.models import Account, HealthWorkerProfile
 from accounts.forms import HealthWorkerCreationForm
+from appointments import slots
 from appointments.models import Appointment
 from appointments.utils import send_appointment_email
 from chat.models import ChatHistory
+from chat.utils import chat_search_q, paginate_chats
 from contact.models import ContactEnquiry
 from documents.models import Document
 from documents.forms import DocumentUploadForm
+from documents.utils import document_titles
 from awareness.models import Awareness
 from awareness.forms import AwarenessForm
 from awareness.utils import trigger_awareness_email
+from .exports import (
+    EXPORTS,
+    export_filename,
+    export_path,
+    parse_date,
+    streaming_csv_response,
+)
+from .metrics import get_dashboard_snapshot
+from .rollups import TREND_RANGES, get_trends, parse_trend_range
+from .tasks import (
+    INDEX_HEALTH_CACHE_KEY,
+    INDEX_HEALTH_STATUS_KEY,
+    INDEX_HEALTH_STATUS_TTL,
+    generate_export_file,
+    refresh_vector_index_health,
+)
 import json
-import csv
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 
 def is_admin(user):
@@ -32,54 +57,16 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     """Main admin dashboard with analytics"""
-
-    # Time periods
     now = timezone.now()
-    today = now.date()
-    last_7_days = now - timedelta(days=7)
-    last_30_days = now - timedelta(days=30)
-    this_month_start = datetime(now.year, now.month, 1, tzinfo=now.tzinfo)
-
-    # ========== USER STATISTICS ==========
-    total_users = Account.objects.count()
-    villagers_count = Account.objects.filter(role="villager").count()
-    health_workers_count = Account.objects.filter(role="health_worker").count()
-    admins_count = Account.objects.filter(role="admin").count()
-    new_users_week = Account.objects.filter(date_joined__gte=last_7_days).count()
-    active_users_week = (
-        ChatHistory.objects.filter(timestamp__gte=last_7_days)
-        .values("user")
-        .distinct()
-        .count()
-    )
+    today = timezone.localdate()
+    snapshot = get_dashboard_snapshot()
+    trend_range = parse_trend_range(request.GET.get("range"))
+    trends = get_trends(["appointments", "users"], trend_range)
 
-    # ========== APPOINTMENT STATISTICS ==========
-    total_appointments = Appointment.objects.count()
-    pending_appointments = Appointment.objects.filter(status="pending").count()
-    approved_appointments = Appointment.objects.filter(status="approved").count()
-    completed_appointments = Appointment.objects.filter(status="completed").count()
-    cancelled_appointments = Appointment.objects.filter(status="cancelled").count()
-    today_appointments = Appointment.objects.filter(date=today).count()
+    # Recent items (cheap LIMIT queries, not cached)
     recent_appointments = Appointment.objects.select_related(
         "villager", "healthworker"
     ).order_by("-created_at")[:5]
-
-    # ========== CHAT STATISTICS ==========
-    total_chats = ChatHistory.objects.count()
-    chats_today = ChatHistory.objects.filter(timestamp__date=today).count()
-    chats_this_week = ChatHistory.objects.filter(timestamp__gte=last_7_days).count()
-
-    # ========== OTHER STATISTICS ==========
-    total_documents = Document.objects.count()
-    documents_this_month = Document.objects.filter(
-        created_at__gte=this_month_start
-    ).count()
-    total_enquiries = ContactEnquiry.objects.count()
-    pending_enquiries = ContactEnquiry.objects.filter(status="pending").count()
-    total_awareness = Awareness.objects.count()
-    awareness_events = Awareness.objects.filter(is_event=True).count()
-
-    # Recent items
     recent_enquiries = ContactEnquiry.objects.order_by("-created_at")[:5]
     recent_documents = Document.objects.select_related("uploaded_by").order_by(
         "-created_at"
@@ -88,67 +75,38 @@ def admin_dashboard(request):
         is_event=True, event_date__gte=today
     ).order_by("event_date")[:5]
 
-    # Top health workers
-    top_health_workers = (
-        Appointment.objects.filter(healthworker__isnull=False)
-        .values(
-            "healthworker__username",
-            "healthworker__first_name",
-            "healthworker__last_name",
-        )
-        .annotate(appointment_count=Count("id"))
-        .order_by("-appointment_count")[:5]
-    )
-
-    # ========== TREND DATA FOR CHARTS ==========
-    appointment_trend = []
-    user_trend = []
-
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        appointment_trend.append(
-            {
-                "date": date.strftime("%b %d"),
-                "count": Appointment.objects.filter(created_at__date=date).count(),
-            }
-        )
-        user_trend.append(
-            {
-                "date": date.strftime("%b %d"),
-                "count": Account.objects.filter(date_joined__date=date).count(),
-            }
-        )
-
     context = {
         "title": "Admin Dashboard",
-        "total_users": total_users,
-        "villagers_count": villagers_count,
-        "health_workers_count": health_workers_count,
-        "admins_count": admins_count,
-        "new_users_week": new_users_week,
-        "active_users_week": active_users_week,
-        "total_appointments": total_appointments,
-        "pending_appointments": pending_appointments,
-        "approved_appointments": approved_appointments,
-        "completed_appointments": completed_appointments,
-        "cancelled_appointments": cancelled_appointments,
-        "today_appointments": today_appointments,
+        "total_users": snapshot["total_users"],
+        "villagers_count": snapshot["villagers_count"],
+        "health_workers_count": snapshot["health_workers_count"],
+        "admins_count": snapshot["admins_count"],
+        "new_users_week": snapshot["new_users_week"],
+        "active_users_week": snapshot["active_users_week"],
+        "total_appointments": snapshot["total_appointments"],
+        "pending_appointments": snapshot["pending_appointments"],
+        "approved_appointments": snapshot["approved_appointments"],
+        "completed_appointments": snapshot["completed_appointments"],
+        "cancelled_appointments": snapshot["cancelled_appointments"],
+        "today_appointments": snapshot["today_appointments"],
         "recent_appointments": recent_appointments,
-        "total_chats": total_chats,
-        "chats_today": chats_today,
-        "chats_this_week": chats_this_week,
-        "total_documents": total_documents,
-        "documents_this_month": documents_this_month,
-        "total_enquiries": total_enquiries,
-        "pending_enquiries": pending_enquiries,
-        "total_awareness": total_awareness,
-        "awareness_events": awareness_events,
+        "total_chats": snapshot["total_chats"],
+        "chats_today": snapshot["chats_today"],
+        "chats_this_week": snapshot["chats_this_week"],
+        "total_documents": snapshot["total_documents"],
+        "documents_this_month": snapshot["documents_this_month"],
+        "total_enquiries": snapshot["total_enquiries"],
+        "pending_enquiries": snapshot["pending_enquiries"],
+        "total_awareness": snapshot["total_awareness"],
+        "awareness_events": snapshot["awareness_events"],
         "recent_enquiries": recent_enquiries,
         "recent_documents": recent_documents,
         "upcoming_events": upcoming_events,
-        "top_health_workers": top_health_workers,
-        "appointment_trend": json.dumps(appointment_trend),
-        "user_trend": json.dumps(user_trend),
+        "top_health_workers": snapshot["top_health_workers"],
+        "appointment_trend": json.dumps(trends["appointments"]),
+        "user_trend": json.dumps(trends["users"]),
+        "trend_range": trend_range,
+        "trend_ranges": TREND_RANGES,
         "current_date": now,
     }
 
@@ -368,9 +326,18 @@ def appointment_update_status(request, appointment_id):
             appointment.status = new_status
             if note:
                 appointment.note = note
-            appointment.save()
-            send_appointment_email(appointment, created=False)
-            messages.success(request, f"Appointment status updated to {new_status}.")
+            try:
+                # Reopening a cancelled appointment can collide with a newer booking
+                slots.save_reserving_slot(appointment)
+            except slots.SlotUnavailable:
+                messages.error(
+                    request,
+                    "That time slot has been booked by another appointment. "
+                    "Reschedule or reassign this appointment first.",
+                )
+            else:
+                send_appointment_email(appointment, created=False)
+                messages.success(request, f"Appointment status updated to {new_status}.")
         else:
             messages.error(request, "Invalid status.")
 
@@ -390,7 +357,17 @@ def appointment_assign(request, appointment_id):
         )
 
         appointment.healthworker = health_worker
-        appointment.save()
+        try:
+            slots.save_reserving_slot(appointment)
+        except slots.SlotUnavailable:
+            messages.error(
+                request,
+                f"{health_worker.get_full_name()} already has an appointment at this time. "
+                "Choose another health worker or reschedule first.",
+            )
+            return redirect(
+                "custom_admin:appointment_assign", appointment_id=appointment_id
+            )
 
         # Send notification to the newly assigned health worker and the villager
         send_appointment_email(appointment)
@@ -606,6 +583,70 @@ def document_delete(request, document_id):
     return render(request, "custom_admin/documents/delete.html", context)
 
 
+@login_required
+@user_passes_test(is_admin)
+def vector_index_health(request):
+    """Vector index health report; profiling is slow, so a Celery worker runs it"""
+    status = cache.get(INDEX_HEALTH_STATUS_KEY)
+    if request.method == "POST":
+        if status and status["state"] in ("queued", "running"):
+            messages.info(request, "The vector index report is already being generated.")
+            return redirect("custom_admin:vector_index_health")
+        # Before queueing, so a fast worker's "running"/"done" is not overwritten
+        cache.set(
+            INDEX_HEALTH_STATUS_KEY,
+            {"state": "queued", "at": time.time()},
+            INDEX_HEALTH_STATUS_TTL,
+        )
+        try:
+            refresh_vector_index_health.delay()
+        except Exception:
+            logger.exception("Could not queue the vector index report")
+            if status:
+                cache.set(INDEX_HEALTH_STATUS_KEY, status, None)
+            else:
+                cache.delete(INDEX_HEALTH_STATUS_KEY)
+            messages.error(
+                request,
+                "Background jobs are unavailable right now, so the report "
+                "cannot be refreshed. Please try again later.",
+            )
+        else:
+            messages.success(
+                request, "The vector index report is being generated. Check back shortly."
+            )
+        return redirect("custom_admin:vector_index_health")
+
+    report = cache.get(INDEX_HEALTH_CACHE_KEY)
+    largest = []
+    if report:
+        documents = report["documents"][:20]
+        titles = document_titles(doc_id for doc_id, _ in documents)
+        largest = [
+            {"doc_id": doc_id, "chunks": chunks, "title": titles.get(doc_id)}
+            for doc_id, chunks in documents
+        ]
+
+    context = {
+        "title": "Vector Index Health",
+        "report": report,
+        "generated_at": (
+            datetime.fromtimestamp(report["generated_at"], tz=timezone.get_current_timezone())
+            if report
+            else None
+        ),
+        "disk_mb": report["disk_bytes"] / 1e6 if report else None,
+        "largest_documents": largest,
+        "status": status,
+        "status_at": (
+            datetime.fromtimestamp(status["at"], tz=timezone.get_current_timezone())
+            if status
+            else None
+        ),
+    }
+    return render(request, "custom_admin/documents/index_health.html", context)
+
+
 # ==================== AWARENESS MANAGEMENT ====================
 
 
@@ -679,6 +720,7 @@ def awareness_detail(request, awareness_id):
     context = {
         "title": awareness.title,
         "awareness": awareness,
+        "broadcast": awareness.broadcasts.first(),
     }
     return render(request, "custom_admin/awareness/detail.html", context)
 
@@ -745,16 +787,13 @@ def chat_history_list(request):
             Q(user__username__icontains=search)
             | Q(user__first_name__icontains=search)
             | Q(user__last_name__icontains=search)
-            | Q(question__icontains=search)
-            | Q(answer__icontains=search)
+            | chat_search_q(search)
         )
 
-    chats = chats.order_by("-timestamp")
-
-    # Pagination
-    paginator = Paginator(chats, 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination: no COUNT(*)/OFFSET over the whole chat table
+    page_obj = paginate_chats(
+        chats, after=request.GET.get("after"), before=request.GET.get("before")
+    )
 
     context = {
         "title": "Chat History",
@@ -801,83 +840,55 @@ def chat_delete(request, chat_id):
 @login_required
 @user_passes_test(is_admin)
 def export_data(request):
-    """Export data as CSV"""
+    """Export data as CSV (streamed, or generated in the background)"""
     data_type = request.GET.get("type")
+    if data_type not in EXPORTS:
+        return HttpResponse("Invalid export type", status=400)
 
-    today = timezone.now().strftime("%Y-%m-%d")
-
-    if data_type == "users":
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = f'attachment; filename="users_{today}.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                "Username",
-                "Email",
-                "First Name",
-                "Last Name",
-                "Role",
-                "Active",
-                "Date Joined",
-            ]
-        )
+    date_from = parse_date(request.GET.get("from"))
+    date_to = parse_date(request.GET.get("to"))
 
-        users = Account.objects.all()
-        for user in users:
-            writer.writerow(
-                [
-                    user.username,
-                    user.email,
-                    user.first_name,
-                    user.last_name,
-                    user.role,
-                    user.is_active,
-                    user.date_joined,
-                ]
-            )
-
-    elif data_type == "appointments":
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = (
-            f'attachment; filename="appointments_{today}.csv"'
+    if request.GET.get("background") == "1":
+        # Very large exports: write to EXPORT_ROOT from a Celery worker
+        filename = export_filename(
+            data_type,
+            date_from,
+            date_to,
+            stamp=timezone.now().strftime("%Y-%m-%d_%H%M%S"),
         )
-
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                "ID",
-                "Villager",
-                "Health Worker",
-                "Date",
-                "Time",
-                "Status",
-                "Priority",
-                "Created",
-            ]
+        try:
+            generate_export_file.delay(
+                data_type,
+                filename,
+                date_from.isoformat() if date_from else None,
+                date_to.isoformat() if date_to else None,
+            )
+        except Exception:
+            logger.exception("Could not queue %s export", data_type)
+            messages.error(
+                request,
+                "Background exports are unavailable right now. "
+                "Please try again later or download the export directly.",
+            )
+            return redirect("custom_admin:dashboard")
+        messages.success(
+            request,
+            f"Export is being generated. It will be available at "
+            f"{reverse('custom_admin:export_download', args=[filename])} when ready.",
         )
+        return redirect("custom_admin:dashboard")
 
-        appointments = Appointment.objects.select_related(
-            "villager", "healthworker"
-        ).all()
-        for appt in appointments:
-            writer.writerow(
-                [
-                    appt.id,
-                    appt.villager.get_full_name(),
-                    appt.healthworker.get_full_name() if appt.healthworker else "N/A",
-                    appt.date,
-                    appt.time,
-                    appt.status,
-                    appt.priority,
-                    appt.created_at,
-                ]
-            )
+    return streaming_csv_response(data_type, date_from, date_to)
 
-    else:
-        return HttpResponse("Invalid export type", status=400)
 
-    return response
+@login_required
+@user_passes_test(is_admin)
+def export_download(request, filename):
+    """Serve a finished background export to admins only"""
+    path = export_path(filename)
+    if path is None:
+        raise Http404("Export not found")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=filename)
 
 
 # =============================================
@@ -0,0 +1,16 @@
+# rural_health_assistant/celery.py
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "rural_health_assistant.settings")
+
+app = Celery("rural_health_assistant")
+
+# Read CELERY_* settings from Django settings
+app.config_from_object("django.conf:settings", namespace="CELERY")
+
+# Discover tasks.py in every installed app, plus the project package itself
+# (admin exports live in rural_health_assistant/tasks.py).
+app.autodiscover_tasks()
+app.autodiscover_tasks(["rural_health_assistant"])
@@ -0,0 +1,272 @@
+# rural_health_assistant/exports.py
+"""
+Streaming CSV exports for the custom admin panel.
+
+Every export is described by an entry in EXPORTS: the queryset, the column
+headers, the values_list() fields (names are resolved in the database via
+annotations, not per-row Python calls) and the date field used by the
+?from=/&to= range filter. Rows are read with .iterator() and written through
+a pseudo-buffer, so memory use and time-to-first-byte don't grow with the
+row count.
+
+Background exports are written to settings.EXPORT_ROOT, outside MEDIA_ROOT,
+and downloaded through an admin-only view.
+"""
+import csv
+import os
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import CharField, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from accounts.models import Account
+from appointments.models import Appointment
+from awareness.models import Awareness
+from chat.models import ChatHistory
+from contact.models import ContactEnquiry
+from documents.models import Document
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _full_name(prefix, default=""):
+    """DB-side equivalent of Account.get_full_name() for a related account."""
+    name = Trim(
+        Concat(
+            f"{prefix}__first_name",
+            Value(" "),
+            f"{prefix}__last_name",
+            output_field=CharField(),
+        )
+    )
+    return Coalesce(NullIf(name, Value("")), Value(default), output_field=CharField())
+
+
+def _users():
+    return Account.objects.all()
+
+
+def _appointments():
+    return Appointment.objects.annotate(
+        villager_name=_full_name("villager"),
+        healthworker_name=_full_name("healthworker", default="N/A"),
+    )
+
+
+def _chats():
+    return ChatHistory.objects.all()
+
+
+def _enquiries():
+    return ContactEnquiry.objects.all()
+
+
+def _documents():
+    return Document.objects.annotate(uploader_name=_full_name("uploaded_by"))
+
+
+def _awareness():
+    return Awareness.objects.all()
+
+
+EXPORTS = {
+    "users": {
+        "queryset": _users,
+        "date_field": "date_joined",
+        "header": [
+            "Username",
+            "Email",
+            "First Name",
+            "Last Name",
+            "Role",
+            "Active",
+            "Date Joined",
+        ],
+        "fields": [
+            "username",
+            "email",
+            "first_name",
+            "last_name",
+            "role",
+            "is_active",
+            "date_joined",
+        ],
+    },
+    "appointments": {
+        "queryset": _appointments,
+        "date_field": "created_at",
+        "header": [
+            "ID",
+            "Villager",
+            "Health Worker",
+            "Date",
+            "Time",
+            "Status",
+            "Priority",
+            "Created",
+        ],
+        "fields": [
+            "id",
+            "villager_name",
+            "healthworker_name",
+            "date",
+            "time",
+            "status",
+            "priority",
+            "created_at",
+        ],
+    },
+    "chats": {
+        "queryset": _chats,
+        "date_field": "timestamp",
+        "header": ["ID", "Username", "Question", "Answer", "Timestamp"],
+        "fields": ["id", "user__username", "question", "answer", "timestamp"],
+    },
+    "enquiries": {
+        "queryset": _enquiries,
+        "date_field": "created_at",
+        "header": [
+            "ID",
+            "First Name",
+            "Last Name",
+            "Email",
+            "Phone",
+            "Message",
+            "Status",
+            "Admin Response",
+            "Created",
+        ],
+        "fields": [
+            "id",
+            "first_name",
+            "last_name",
+            "email",
+            "phone",
+            "message",
+            "status",
+            "admin_response",
+            "created_at",
+        ],
+    },
+    "documents": {
+        "queryset": _documents,
+        "date_field": "created_at",
+        "header": ["ID", "Title", "File", "Summary", "Uploaded By", "Created", "Updated"],
+        "fields": [
+            "id",
+            "title",
+            "file",
+            "summary",
+            "uploader_name",
+            "created_at",
+            "updated_at",
+        ],
+    },
+    "awareness": {
+        "queryset": _awareness,
+        "date_field": "created_at",
+        "header": ["ID", "Title", "Description", "Is Event", "Event Date", "Created"],
+        "fields": [
+            "id",
+            "title",
+            "description",
+            "is_event",
+            "event_date",
+            "created_at",
+        ],
+    },
+}
+
+
+class Echo:
+    """
+    Pseudo-buffer: csv.writer writes a row and we yield it straight out.
+    Also used by chat.utils for chat history exports.
+    """
+
+    def write(self, value):
+        return value
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    except ValueError:
+        return None
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(data_type, date_from=None, date_to=None):
+    """Return the values_list queryset for `data_type`, range-filtered."""
+    spec = EXPORTS[data_type]
+    queryset = spec["queryset"]()
+    date_field = spec["date_field"]
+    if date_from:
+        queryset = queryset.filter(**{f"{date_field}__gte": _start_of(date_from)})
+    if date_to:
+        # Inclusive end date; a half-open range keeps the date index usable
+        queryset = queryset.filter(
+            **{f"{date_field}__lt": _start_of(date_to + timedelta(days=1))}
+        )
+    return queryset.order_by("pk").values_list(*spec["fields"])
+
+
+def iter_csv_rows(data_type, date_from=None, date_to=None):
+    """Yield CSV-encoded lines for `data_type`, header first."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORTS[data_type]["header"])
+    rows = export_queryset(data_type, date_from, date_to).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_filename(data_type, date_from=None, date_to=None, stamp=None):
+    name = f"{data_type}_{stamp or timezone.now().strftime('%Y-%m-%d')}"
+    if date_from or date_to:
+        name += f"_{date_from or 'start'}_to_{date_to or 'now'}"
+    return f"{name}.csv"
+
+
+def streaming_csv_response(data_type, date_from=None, date_to=None):
+    response = StreamingHttpResponse(
+        iter_csv_rows(data_type, date_from, date_to), content_type="text/csv"
+    )
+    filename = export_filename(data_type, date_from, date_to)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_path(filename):
+    """
+    Path of an existing export file, or None. Only bare names are accepted,
+    so a crafted name can't reach outside EXPORT_ROOT.
+    """
+    if not filename or os.path.basename(filename) != filename or filename.startswith("."):
+        return None
+    path = os.path.join(settings.EXPORT_ROOT, filename)
+    return path if os.path.isfile(path) else None
+
+
+def write_export_file(data_type, filename, date_from=None, date_to=None):
+    """
+    Write an export to EXPORT_ROOT/<filename> and return its path.
+
+    Written to a temporary name first and renamed when complete, so a
+    half-written file is never served.
+    """
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    path = os.path.join(settings.EXPORT_ROOT, filename)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as fh:
+        for line in iter_csv_rows(data_type, date_from, date_to):
+            fh.write(line)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,52 @@
+# rural_health_assistant/jobs.py
+"""
+Per-run bookkeeping for periodic jobs.
+
+    with track_job("auto_cancel_appointments") as run:
+        ...
+        run["rows"] += cancelled
+        run["batches"] += 1
+
+Every run is stored as a JobRun with its start time, duration, the "rows"
+count and any other counters set on `run`, including failed runs (the
+exception is recorded and re-raised).
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+from custom_admin.models import JobRun
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def track_job(job):
+    run = Counter()
+    started_at = timezone.now()
+    started = time.monotonic()
+    error = ""
+    try:
+        yield run
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = int((time.monotonic() - started) * 1000)
+        rows = run.pop("rows", 0)
+        try:
+            JobRun.objects.create(
+                job=job,
+                started_at=started_at,
+                duration_ms=duration_ms,
+                rows=rows,
+                details=dict(run),
+                succeeded=not error,
+                error=error[:1000],
+            )
+        except Exception:
+            logger.exception(f"Could not record run of {job}")
+        logger.info(f"{job}: {rows} rows in {duration_ms} ms {dict(run)}")
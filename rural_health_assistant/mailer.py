@@ -0,0 +1,195 @@
+# rural_health_assistant/mailer.py
+"""
+Email outbox.
+
+Nothing on a request thread or in a periodic job talks to SMTP.
+queue_email() stores the message as an OutboundEmail row and nudges the
+drain_email_outbox task, which sends due rows in batches over one reused
+SMTP connection. A failed message is retried with exponential backoff
+(EMAIL_OUTBOX_RETRY_DELAY seconds, doubled per attempt) and marked "failed"
+after EMAIL_OUTBOX_MAX_ATTEMPTS. Beat also drains the outbox every minute,
+so mail queued while the broker is down still goes out.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from custom_admin.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Claimed rows are pushed this far into the future so a concurrent drain
+# skips them; the claim of a worker that dies mid-batch simply expires.
+CLAIM_SECONDS = 300
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def queue_email(
+    subject,
+    body,
+    to,
+    html_body="",
+    from_email=None,
+    priority=OutboundEmail.PRIORITY_NORMAL,
+):
+    """Store a message in the outbox. It is sent after the transaction commits."""
+    recipients = [to] if isinstance(to, str) else [addr for addr in to if addr]
+    if not recipients:
+        return None
+    email = OutboundEmail.objects.create(
+        subject=subject[:255],
+        body=body,
+        html_body=html_body or "",
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or "",
+        to=recipients,
+        priority=priority,
+    )
+    transaction.on_commit(kick)
+    return email
+
+
+def queue_emails(messages, priority=OutboundEmail.PRIORITY_NORMAL):
+    """
+    Bulk version of queue_email(). `messages` are dicts of queue_email()
+    keyword arguments (subject, body, to, optionally html_body/from_email).
+    """
+    rows = []
+    for message in messages:
+        to = message["to"]
+        recipients = [to] if isinstance(to, str) else [addr for addr in to if addr]
+        if recipients:
+            rows.append(
+                OutboundEmail(
+                    subject=message["subject"][:255],
+                    body=message["body"],
+                    html_body=message.get("html_body") or "",
+                    from_email=message.get("from_email") or settings.DEFAULT_FROM_EMAIL or "",
+                    to=recipients,
+                    priority=message.get("priority", priority),
+                )
+            )
+    created = OutboundEmail.objects.bulk_create(rows, batch_size=500)
+    if created:
+        transaction.on_commit(kick)
+    return len(created)
+
+
+def kick():
+    """Ask a worker to drain now; at most one nudge per second is published."""
+    from .tasks import drain_email_outbox
+
+    if not cache.add("outbox:kick", 1, timeout=1):
+        return
+    try:
+        # retry=False: fail fast when the broker is down, beat will drain
+        drain_email_outbox.apply_async(retry=False)
+    except Exception:
+        logger.warning("Could not queue drain_email_outbox; leaving mail for beat")
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("priority", "next_attempt_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        OutboundEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by("priority", "id"))
+
+
+def _build_message(row, connection):
+    message = EmailMultiAlternatives(
+        row.subject,
+        row.body,
+        row.from_email or settings.DEFAULT_FROM_EMAIL,
+        row.to,
+        connection=connection,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, "text/html")
+    return message
+
+
+def _reschedule(row, error):
+    row.attempts += 1
+    row.last_error = str(error)[:1000]
+    if row.attempts >= _setting("EMAIL_OUTBOX_MAX_ATTEMPTS", 6):
+        row.status = "failed"
+        logger.error(f"Giving up on email #{row.pk} after {row.attempts} attempts: {error}")
+    else:
+        delay = _setting("EMAIL_OUTBOX_RETRY_DELAY", 60) * 2 ** (row.attempts - 1)
+        row.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    row.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def send_batch(batch_size=None):
+    """
+    Send one batch of due messages over a single SMTP connection.
+
+    Returns (sent, failed, claimed).
+    """
+    rows = _claim(batch_size or _setting("EMAIL_OUTBOX_BATCH_SIZE", 50))
+    if not rows:
+        return 0, 0, 0
+
+    sent, failed = [], 0
+    connection = get_connection()
+    try:
+        for index, row in enumerate(rows):
+            try:
+                # No-op while the connection is up; reopens after a failure
+                connection.open()
+            except Exception as e:
+                # Server unreachable: back off the rest of the batch too
+                for pending in rows[index:]:
+                    _reschedule(pending, e)
+                failed += len(rows) - index
+                break
+            try:
+                connection.send_messages([_build_message(row, connection)])
+            except Exception as e:
+                _reschedule(row, e)
+                failed += 1
+                connection.close()
+            else:
+                sent.append(row.pk)
+    finally:
+        connection.close()
+
+    OutboundEmail.objects.filter(pk__in=sent).update(
+        status="sent", sent_at=timezone.now(), attempts=F("attempts") + 1, last_error=""
+    )
+    return len(sent), failed, len(rows)
+
+
+def drain_outbox(max_batches=20):
+    """Send batches until the outbox has nothing due. Returns (sent, failed)."""
+    total_sent = total_failed = 0
+    for _ in range(max_batches):
+        sent, failed, claimed = send_batch()
+        total_sent += sent
+        total_failed += failed
+        if not claimed:
+            break
+    return total_sent, total_failed
+
+
+def purge_sent(days=30):
+    """Delete sent messages older than `days`."""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboundEmail.objects.filter(status="sent", sent_at__lt=cutoff).delete()
+    return deleted
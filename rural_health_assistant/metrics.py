@@ -0,0 +1,210 @@
+# rural_health_assistant/metrics.py
+"""
+Shared metrics service for the admin dashboards.
+
+Each table is read with a single conditional-aggregate query
+(Count(..., filter=Q(...))). The resulting snapshot is a plain dict, cached
+for DASHBOARD_CACHE_TTL seconds and dropped whenever one of the underlying
+models is written (see connect_signals()). Trend charts are not part of the
+snapshot; they are read from the daily rollups (see rollups.py).
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from accounts.models import Account, HealthWorkerProfile
+from appointments.models import Appointment
+from awareness.models import Awareness
+from chat.models import ChatHistory
+from contact.models import ContactEnquiry
+from documents.models import Document
+
+SNAPSHOT_CACHE_KEY = "dashboard:snapshot"
+
+
+def _get_ttl():
+    return getattr(settings, "DASHBOARD_CACHE_TTL", 60)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def compute_dashboard_snapshot():
+    """Compute every dashboard number; one query per table plus two top-5 lists."""
+    now = timezone.now()
+    today = timezone.localdate()
+    today_start = _day_start(today)
+    tomorrow_start = _day_start(today + timedelta(days=1))
+    last_7_days = now - timedelta(days=7)
+    last_30_days = now - timedelta(days=30)
+    this_month_start = _day_start(today.replace(day=1))
+
+    users = Account.objects.aggregate(
+        total=Count("id"),
+        villagers=Count("id", filter=Q(role="villager")),
+        health_workers=Count("id", filter=Q(role="health_worker")),
+        admins=Count("id", filter=Q(role="admin")),
+        new_week=Count("id", filter=Q(date_joined__gte=last_7_days)),
+        new_month=Count("id", filter=Q(date_joined__gte=last_30_days)),
+    )
+
+    appointments = Appointment.objects.aggregate(
+        total=Count("id"),
+        pending=Count("id", filter=Q(status="pending")),
+        approved=Count("id", filter=Q(status="approved")),
+        completed=Count("id", filter=Q(status="completed")),
+        cancelled=Count("id", filter=Q(status="cancelled")),
+        today=Count("id", filter=Q(date=today)),
+        upcoming=Count(
+            "id",
+            filter=Q(
+                date__gte=today,
+                date__lte=today + timedelta(days=7),
+                status__in=["pending", "approved"],
+            ),
+        ),
+        this_month=Count("id", filter=Q(created_at__gte=this_month_start)),
+    )
+
+    chats = ChatHistory.objects.aggregate(
+        total=Count("id"),
+        today=Count(
+            "id", filter=Q(timestamp__gte=today_start, timestamp__lt=tomorrow_start)
+        ),
+        week=Count("id", filter=Q(timestamp__gte=last_7_days)),
+        month=Count("id", filter=Q(timestamp__gte=last_30_days)),
+        users=Count("user", distinct=True),
+        active_users_week=Count(
+            "user", distinct=True, filter=Q(timestamp__gte=last_7_days)
+        ),
+    )
+
+    documents = Document.objects.aggregate(
+        total=Count("id"),
+        this_month=Count("id", filter=Q(created_at__gte=this_month_start)),
+    )
+
+    enquiries = ContactEnquiry.objects.aggregate(
+        total=Count("id"),
+        pending=Count("id", filter=Q(status="pending")),
+        in_progress=Count("id", filter=Q(status="in_progress")),
+        resolved=Count("id", filter=Q(status="resolved")),
+        week=Count("id", filter=Q(created_at__gte=last_7_days)),
+    )
+
+    awareness = Awareness.objects.aggregate(
+        total=Count("id"),
+        events=Count("id", filter=Q(is_event=True)),
+    )
+
+    available_health_workers = HealthWorkerProfile.objects.filter(
+        availability=True
+    ).count()
+
+    top_health_workers = list(
+        Appointment.objects.filter(healthworker__isnull=False)
+        .values(
+            "healthworker__username",
+            "healthworker__first_name",
+            "healthworker__last_name",
+        )
+        .annotate(appointment_count=Count("id"))
+        .order_by("-appointment_count")[:5]
+    )
+
+    most_active_users = list(
+        ChatHistory.objects.values(
+            "user__username", "user__first_name", "user__last_name", "user__role"
+        )
+        .annotate(chat_count=Count("id"))
+        .order_by("-chat_count")[:5]
+    )
+
+    avg_chats_per_user = chats["total"] / chats["users"] if chats["users"] else 0
+
+    return {
+        # User stats
+        "total_users": users["total"],
+        "villagers_count": users["villagers"],
+        "health_workers_count": users["health_workers"],
+        "admins_count": users["admins"],
+        "new_users_week": users["new_week"],
+        "new_users_month": users["new_month"],
+        "active_users_week": chats["active_users_week"],
+        # Appointment stats
+        "total_appointments": appointments["total"],
+        "pending_appointments": appointments["pending"],
+        "approved_appointments": appointments["approved"],
+        "completed_appointments": appointments["completed"],
+        "cancelled_appointments": appointments["cancelled"],
+        "today_appointments": appointments["today"],
+        "upcoming_appointments": appointments["upcoming"],
+        "appointments_this_month": appointments["this_month"],
+        # Chat stats
+        "total_chats": chats["total"],
+        "chats_today": chats["today"],
+        "chats_this_week": chats["week"],
+        "chats_this_month": chats["month"],
+        "avg_chats_per_user": round(avg_chats_per_user, 1),
+        "most_active_users": most_active_users,
+        # Document stats
+        "total_documents": documents["total"],
+        "documents_this_month": documents["this_month"],
+        # Enquiry stats
+        "total_enquiries": enquiries["total"],
+        "pending_enquiries": enquiries["pending"],
+        "in_progress_enquiries": enquiries["in_progress"],
+        "resolved_enquiries": enquiries["resolved"],
+        "enquiries_this_week": enquiries["week"],
+        # Awareness stats
+        "total_awareness": awareness["total"],
+        "awareness_events": awareness["events"],
+        "awareness_posts": awareness["total"] - awareness["events"],
+        # Health worker stats
+        "available_health_workers": available_health_workers,
+        "top_health_workers": top_health_workers,
+    }
+
+
+def get_dashboard_snapshot():
+    """Return the cached dashboard snapshot, computing it on a miss."""
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is None:
+        snapshot = compute_dashboard_snapshot()
+        cache.set(SNAPSHOT_CACHE_KEY, snapshot, _get_ttl())
+    return snapshot
+
+
+def invalidate_dashboard_snapshot(**kwargs):
+    cache.delete(SNAPSHOT_CACHE_KEY)
+
+
+DASHBOARD_MODELS = (
+    Account,
+    HealthWorkerProfile,
+    Appointment,
+    ChatHistory,
+    ContactEnquiry,
+    Document,
+    Awareness,
+)
+
+
+def connect_signals():
+    """Drop the snapshot whenever a model it is computed from changes."""
+    for model in DASHBOARD_MODELS:
+        post_save.connect(
+            invalidate_dashboard_snapshot,
+            sender=model,
+            dispatch_uid=f"dashboard_snapshot_save_{model.__name__}",
+        )
+        post_delete.connect(
+            invalidate_dashboard_snapshot,
+            sender=model,
+            dispatch_uid=f"dashboard_snapshot_delete_{model.__name__}",
+        )
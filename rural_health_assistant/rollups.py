@@ -0,0 +1,304 @@
+# rural_health_assistant/rollups.py
+"""
+Daily rollups behind the dashboard trend charts.
+
+Each entry in ROLLUPS names a model, the field that places a row on a day
+and the dimensions counted alongside the total. Counts are stored in
+custom_admin.DailyMetric, so a 30/90/365-day trend reads O(days) rows
+instead of scanning ChatHistory/Appointment.
+
+Maintenance:
+  * creates bump the affected counters in place (post_save);
+  * edits that move a row to another day/dimension, and deletes, mark the
+    day dirty and it is recomputed once when the transaction commits;
+  * bulk paths that skip signals (queryset.update(), bulk_create()) are
+    picked up by the refresh_daily_rollups task, and
+    `manage.py backfill_rollups` rebuilds any range from scratch.
+"""
+import threading
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from accounts.models import Account
+from appointments.models import Appointment
+from chat.models import ChatHistory
+from custom_admin.models import DailyMetric
+
+TREND_RANGES = (7, 30, 90, 365)
+DEFAULT_TREND_RANGE = 7
+
+ROLLUPS = {
+    # Admin "appointments" trend: bucketed by booking day
+    "appointments": {
+        "model": Appointment,
+        "date_field": "created_at",
+        "dimensions": {"status": "status", "priority": "priority"},
+    },
+    # Health worker workload: bucketed by the appointment's own date
+    "appointments_scheduled": {
+        "model": Appointment,
+        "date_field": "date",
+        "dimensions": {"healthworker": "healthworker_id", "status": "status"},
+    },
+    "chats": {
+        "model": ChatHistory,
+        "date_field": "timestamp",
+        "dimensions": {},
+    },
+    "users": {
+        "model": Account,
+        "date_field": "date_joined",
+        "dimensions": {"role": "role"},
+    },
+}
+
+
+def _metrics_for(model):
+    return [name for name, spec in ROLLUPS.items() if spec["model"] is model]
+
+
+def _is_datetime(spec):
+    field = spec["model"]._meta.get_field(spec["date_field"])
+    return field.get_internal_type() == "DateTimeField"
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _local_day(value):
+    if isinstance(value, datetime):
+        return timezone.localdate(value)
+    return value
+
+
+def parse_trend_range(value):
+    """?range= query value -> one of TREND_RANGES (DEFAULT_TREND_RANGE if invalid)."""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_TREND_RANGE
+    return days if days in TREND_RANGES else DEFAULT_TREND_RANGE
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+
+def get_trends(metrics, days, dimension="", value="", date_format="%b %d"):
+    """
+    Return {metric: [{"date": label, "count": n}, ...]} for the last `days`
+    days (oldest first, zero-filled) with a single query.
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    rows = DailyMetric.objects.filter(
+        metric__in=metrics,
+        dimension=dimension,
+        value=str(value),
+        date__gte=start,
+        date__lte=today,
+    ).values_list("metric", "date", "count")
+
+    counts = {(metric, day): count for metric, day, count in rows}
+    span = [start + timedelta(days=i) for i in range(days)]
+    return {
+        metric: [
+            {"date": day.strftime(date_format), "count": counts.get((metric, day), 0)}
+            for day in span
+        ]
+        for metric in metrics
+    }
+
+
+# ---------------------------------------------------------------------------
+# Rebuilds
+# ---------------------------------------------------------------------------
+
+
+def _range_queryset(spec, start, end):
+    field = spec["date_field"]
+    queryset = spec["model"]._base_manager.order_by()
+    if _is_datetime(spec):
+        return queryset.filter(
+            **{
+                f"{field}__gte": _day_start(start),
+                f"{field}__lt": _day_start(end + timedelta(days=1)),
+            }
+        ).annotate(day=TruncDate(field))
+    return queryset.filter(**{f"{field}__gte": start, f"{field}__lte": end}).annotate(
+        day=F(field)
+    )
+
+
+def _count_rows(metric, start, end):
+    """DailyMetric rows (unsaved) for `metric` over [start, end], from the source table."""
+    spec = ROLLUPS[metric]
+    queryset = _range_queryset(spec, start, end)
+
+    rows = [
+        DailyMetric(date=row["day"], metric=metric, count=row["n"])
+        for row in queryset.values("day").annotate(n=Count("pk"))
+    ]
+    for dimension, attname in spec["dimensions"].items():
+        for row in queryset.values("day", attname).annotate(n=Count("pk")):
+            if row[attname] is None:
+                continue
+            rows.append(
+                DailyMetric(
+                    date=row["day"],
+                    metric=metric,
+                    dimension=dimension,
+                    value=str(row[attname]),
+                    count=row["n"],
+                )
+            )
+    return rows
+
+
+def rebuild_rollups(metric, start, end):
+    """
+    Recompute `metric` for every day in [start, end]; returns rows written.
+
+    The range is locked and cleared before the source table is read, so an
+    increment (_bump) that lands meanwhile either waits for this rebuild or
+    is already in the counts read; a counter row created in between is
+    overwritten by the upsert rather than failing it.
+    """
+    with transaction.atomic():
+        existing = DailyMetric.objects.filter(metric=metric, date__gte=start, date__lte=end)
+        list(existing.select_for_update().values_list("pk", flat=True))
+        existing.delete()
+        rows = _count_rows(metric, start, end)
+        DailyMetric.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["metric", "dimension", "value", "date"],
+            update_fields=["count"],
+        )
+    return len(rows)
+
+
+def date_bounds(metric):
+    """(first day, last day) with data for `metric`; (None, None) if empty."""
+    spec = ROLLUPS[metric]
+    bounds = spec["model"]._base_manager.aggregate(
+        first=Min(spec["date_field"]), last=Max(spec["date_field"])
+    )
+    return _local_day(bounds["first"]), _local_day(bounds["last"])
+
+
+# ---------------------------------------------------------------------------
+# Incremental maintenance (signals)
+# ---------------------------------------------------------------------------
+
+
+def _instance_key(metric, instance):
+    """
+    (day, ((dimension, value), ...)) for a model instance, read from
+    __dict__ so deferred fields are never fetched. None if unknown.
+    """
+    spec = ROLLUPS[metric]
+    attname = spec["model"]._meta.get_field(spec["date_field"]).attname
+    if attname not in instance.__dict__ or instance.__dict__[attname] is None:
+        return None
+    dims = []
+    for dimension, dim_attname in spec["dimensions"].items():
+        if dim_attname not in instance.__dict__:
+            return None
+        if instance.__dict__[dim_attname] is not None:
+            dims.append((dimension, str(instance.__dict__[dim_attname])))
+    return _local_day(instance.__dict__[attname]), tuple(dims)
+
+
+def _bump(metric, day, dimension, value, delta):
+    lookup = {"metric": metric, "date": day, "dimension": dimension, "value": value}
+    if DailyMetric.objects.filter(**lookup).update(count=F("count") + delta):
+        return
+    try:
+        with transaction.atomic():
+            DailyMetric.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        # Another writer created the row first
+        DailyMetric.objects.filter(**lookup).update(count=F("count") + delta)
+
+
+def _increment(metric, key):
+    day, dims = key
+    _bump(metric, day, "", "", 1)
+    for dimension, value in dims:
+        _bump(metric, day, dimension, value, 1)
+
+
+_pending = threading.local()
+
+
+def _flush_dirty_days():
+    dirty = getattr(_pending, "days", None)
+    if not dirty:
+        return
+    _pending.days = set()
+    for metric, day in dirty:
+        rebuild_rollups(metric, day, day)
+
+
+def mark_dirty(metric, day):
+    """Recompute (metric, day) once the current transaction commits."""
+    if not hasattr(_pending, "days"):
+        _pending.days = set()
+    _pending.days.add((metric, day))
+    # Registered on every call (cheap); the first flush drains the set, so a
+    # bulk delete of many rows recomputes each day only once.
+    transaction.on_commit(_flush_dirty_days)
+
+
+def remember_rollup_keys(sender, instance, **kwargs):
+    instance._rollup_keys = {
+        metric: _instance_key(metric, instance) for metric in _metrics_for(sender)
+    }
+
+
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_rollup_keys", {})
+    for metric in _metrics_for(sender):
+        key = _instance_key(metric, instance)
+        old = previous.get(metric)
+        if created:
+            if key is not None:
+                _increment(metric, key)
+        elif key != old:
+            for changed in (old, key):
+                if changed is not None:
+                    mark_dirty(metric, changed[0])
+    remember_rollup_keys(sender, instance)
+
+
+def update_rollups_on_delete(sender, instance, **kwargs):
+    previous = getattr(instance, "_rollup_keys", {})
+    for metric in _metrics_for(sender):
+        key = previous.get(metric) or _instance_key(metric, instance)
+        if key is not None:
+            mark_dirty(metric, key[0])
+
+
+def connect_signals():
+    for model in {spec["model"] for spec in ROLLUPS.values()}:
+        uid = model.__name__
+        post_init.connect(
+            remember_rollup_keys, sender=model, dispatch_uid=f"rollups_init_{uid}"
+        )
+        post_save.connect(
+            update_rollups_on_save, sender=model, dispatch_uid=f"rollups_save_{uid}"
+        )
+        post_delete.connect(
+            update_rollups_on_delete, sender=model, dispatch_uid=f"rollups_delete_{uid}"
+        )
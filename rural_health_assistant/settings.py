@@ -57,14 +57,82 @@ INSTALLED_APPS = [
 CELERY_BEAT_SCHEDULE = {
     "auto-cancel-appointments": {
         "task": "appointments.tasks.auto_cancel_appointments",
-        "schedule": 30.0,  # Run every 30 minutes
+        "schedule": 1800.0,  # Run every 30 minutes
+    },
+    "refresh-daily-rollups": {
+        "task": "rural_health_assistant.tasks.refresh_daily_rollups",
+        "schedule": 3600.0,  # Hourly
+    },
+    "drain-email-outbox": {
+        "task": "rural_health_assistant.tasks.drain_email_outbox",
+        "schedule": 60.0,  # Safety net; queue_email() also triggers a drain
+    },
+    "resume-awareness-broadcasts": {
+        "task": "awareness.tasks.resume_awareness_broadcasts",
+        "schedule": 300.0,  # Every 5 minutes
+    },
+    "refine-pending-priorities": {
+        "task": "appointments.tasks.refine_pending_priorities",
+        "schedule": 300.0,  # Bookings made while the broker was down
+    },
+    "purge-email-outbox": {
+        "task": "rural_health_assistant.tasks.purge_email_outbox",
+        "schedule": 86400.0,  # Daily
     },
 }
 
+# Cache: shared Redis cache in production so invalidation reaches every
+# worker; per-process memory cache for local development.
+if os.environ.get("REDIS_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_CACHE_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Seconds the admin dashboard metrics snapshot is cached for
+DASHBOARD_CACHE_TTL = 60
+
+# Seconds a per-worker, per-day slot bitmap (appointments/slots.py) is
+# cached; writes invalidate it, the TTL only bounds a lost invalidation
+SLOT_CACHE_TTL = 300
+# How long a villager's chosen slot is held while they finish the form
+SLOT_HOLD_SECONDS = 300
+
+# Live triage queues (appointments/triage.py): Redis sorted sets when a
+# Redis URL is configured, otherwise read from the database on every poll.
+# TRIAGE_BACKEND = "local" keeps per-process heaps (single process only).
+TRIAGE_REDIS_URL = os.environ.get("TRIAGE_REDIS_URL", os.environ.get("REDIS_CACHE_URL"))
+TRIAGE_BACKEND = os.environ.get("TRIAGE_BACKEND", "")
+# Redis queues are re-merged from the database this often
+TRIAGE_RELOAD_SECONDS = 3600
+# Age at which refine_pending_priorities treats a booking's LLM triage as
+# never queued
+TRIAGE_SWEEP_AFTER_SECONDS = 120
+# How often the health worker dashboard polls /appointments/triage/
+TRIAGE_POLL_SECONDS = 10
+
+# Triage classification cache (appointments.TriageCacheEntry): minimum cosine
+# similarity for reusing the result of a similar cached reason (0 = exact
+# normalized-text matches only). Off by default: embeddings barely separate
+# "chest pain" from "no chest pain", so a similar hit is only ever trusted
+# when it is critical (see appointments.utils.lookup_cached_priority).
+TRIAGE_CACHE_SIMILARITY = float(os.environ.get("TRIAGE_CACHE_SIMILARITY", "0"))
+
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get(
     "CELERY_RESULT_BACKEND", "redis://localhost:6379/0"
 )
+# Publishing from a request gives up after ~1s when the broker is down; callers
+# fall back (needs_triage bookings wait for the sweep, the outbox for beat)
+CELERY_BROKER_TRANSPORT_OPTIONS = {"max_retries": 2, "interval_start": 0, "interval_step": 0.5}
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
@@ -172,6 +240,11 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Background CSV exports (users, chats, enquiries) hold personal and health
+# data, so they live outside MEDIA_ROOT and are only served to admins by
+# custom_admin:export_download.
+EXPORT_ROOT = os.environ.get("EXPORT_ROOT", os.path.join(BASE_DIR, "private", "exports"))
+
 # Login URLs
 LOGIN_URL = "accounts:login"
 LOGIN_REDIRECT_URL = "chat:index"
@@ -184,8 +257,21 @@ load_dotenv()
 
 RAG_CONFIG = {
     "VECTOR_DB_PATH": os.path.join(BASE_DIR, "vector_db"),
-    "CHUNK_SIZE": 1000,
-    "CHUNK_OVERLAP": 200,
+    "CHUNK_TOKENS": 200,  # embedding-model tokens; MiniLM truncates past 256
+    "CHUNK_OVERLAP": "window",  # "window" (neighbour sentences) or N tokens
+    "SECTION_MAX_CHARS": 8000,  # loaders cut longer heading sections
+    "EMBED_BATCH_SIZE": 64,  # chunks embedded per add_documents call
+    # Split the index into collections: none | topic | uploader | hash
+    "SHARDING": {"STRATEGY": "none", "SHARDS": 4},
+    "SHARD_QUERY_WORKERS": 8,
+    # HNSW parameters of new collections (SPACE: l2 | cosine | ip); only
+    # EF_SEARCH applies to existing ones, the rest need rebuild_vector_index
+    "HNSW": {"SPACE": "l2", "EF_CONSTRUCTION": 100, "EF_SEARCH": 100, "M": 16},
+    # Brute-force search over a memory-mapped matrix below MAX_CHUNKS (0 = off);
+    # DTYPE float16 halves its memory but is ~10x slower per query
+    "EXACT_SEARCH": {"MAX_CHUNKS": 20000, "DTYPE": "float32"},
+    "INDEX_WORKERS": 4,  # parallel files during a full blue/green rebuild
+    "INDEX_KEEP": 2,  # index directories kept after a rebuild (live included)
     "EMBEDDING_MODEL": "sentence-transformers/all-MiniLM-L6-v2",
     "LLM_MODEL": "gemini-2.5-flash-lite",  # example, change as needed
     "TEMPERATURE": 0,
@@ -212,6 +298,16 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Outbox (rural_health_assistant/mailer.py): messages per SMTP connection,
+# and retry backoff (seconds, doubled per attempt) before giving up
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+# Awareness broadcasts (awareness/utils.py): recipients per SMTP connection,
+# messages per second, and how long a silent run counts as crashed
+AWARENESS_BROADCAST_BATCH_SIZE = 100
+AWARENESS_BROADCAST_RATE = 10
+AWARENESS_BROADCAST_STALL_SECONDS = 600
 
 
 
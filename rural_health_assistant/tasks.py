@@ -0,0 +1,67 @@
+import time
+from datetime import timedelta
+
+from celery import shared_task
+from django.core.cache import cache
+from django.utils import timezone
+
+from .exports import parse_date, write_export_file
+from .mailer import drain_outbox, purge_sent
+from .rollups import ROLLUPS, rebuild_rollups
+
+INDEX_HEALTH_CACHE_KEY = "rag:index_health"
+INDEX_HEALTH_STATUS_KEY = "rag:index_health:status"
+# A queued/running status expires after this long, so a lost task does not
+# block the admin page's Refresh button forever
+INDEX_HEALTH_STATUS_TTL = 3600
+
+
+@shared_task
+def generate_export_file(data_type, filename, date_from=None, date_to=None):
+    path = write_export_file(
+        data_type, filename, parse_date(date_from), parse_date(date_to)
+    )
+    return f"Export written to {path}"
+
+
+@shared_task(ignore_result=True)
+def refresh_vector_index_health(sample=1000, probes=20):
+    """Profile the vector index for the admin page; slow on a large index."""
+    from rag_components.index_health import collect_report
+
+    cache.set(
+        INDEX_HEALTH_STATUS_KEY,
+        {"state": "running", "at": time.time()},
+        INDEX_HEALTH_STATUS_TTL,
+    )
+    try:
+        report = collect_report(sample=sample, probes=probes)
+    except Exception as e:
+        cache.set(
+            INDEX_HEALTH_STATUS_KEY,
+            {"state": "failed", "at": time.time(), "error": str(e)[:500]},
+            None,
+        )
+        raise
+    cache.set(INDEX_HEALTH_CACHE_KEY, report, None)
+    cache.set(INDEX_HEALTH_STATUS_KEY, {"state": "done", "at": time.time()}, None)
+
+
+@shared_task
+def refresh_daily_rollups(days=2):
+    """Recompute the most recent days to pick up writes that bypass signals."""
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    rows = sum(rebuild_rollups(metric, start, today) for metric in ROLLUPS)
+    return f"Refreshed {rows} rollup rows"
+
+
+@shared_task(ignore_result=True)
+def drain_email_outbox(max_batches=20):
+    sent, failed = drain_outbox(max_batches)
+    return f"Sent {sent} emails, {failed} failed"
+
+
+@shared_task
+def purge_email_outbox(days=30):
+    return f"Purged {purge_sent(days)} sent emails"
@@ -0,0 +1,515 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import time as time_module
+from datetime import time, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+from appointments.models import Appointment
+from chat.models import ChatHistory
+from custom_admin.models import DailyMetric, OutboundEmail
+
+from . import exports, mailer, tasks
+from .metrics import compute_dashboard_snapshot, get_dashboard_snapshot
+from .rollups import get_trends, rebuild_rollups
+
+
+class DashboardSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Account.objects.create_user(
+            "Admin", "User", "admin", "admin@example.com", "pw", "1", role="admin"
+        )
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "2"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "3", role="health_worker"
+        )
+        today = timezone.localdate()
+        statuses = ["pending", "pending", "approved", "completed", "cancelled"]
+        for hour, status in enumerate(statuses, start=10):
+            Appointment.objects.create(
+                villager=cls.villager,
+                healthworker=cls.worker,
+                date=today,
+                time=time(hour, 0),
+                reason="checkup",
+                status=status,
+            )
+        for i in range(3):
+            ChatHistory.objects.create(user=cls.villager, question=f"q{i}", answer="a")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_values(self):
+        snapshot = compute_dashboard_snapshot()
+        self.assertEqual(snapshot["total_users"], 3)
+        self.assertEqual(snapshot["villagers_count"], 1)
+        self.assertEqual(snapshot["health_workers_count"], 1)
+        self.assertEqual(snapshot["total_appointments"], 5)
+        self.assertEqual(snapshot["pending_appointments"], 2)
+        self.assertEqual(snapshot["today_appointments"], 5)
+        self.assertEqual(snapshot["upcoming_appointments"], 3)
+        self.assertEqual(snapshot["total_chats"], 3)
+        self.assertEqual(snapshot["chats_today"], 3)
+        self.assertEqual(snapshot["active_users_week"], 1)
+        self.assertEqual(snapshot["avg_chats_per_user"], 3.0)
+        self.assertEqual(snapshot["top_health_workers"][0]["appointment_count"], 5)
+
+    def test_snapshot_query_count_is_constant(self):
+        # One aggregate per table + HW availability + two top-5 lists
+        with self.assertNumQueries(9):
+            compute_dashboard_snapshot()
+
+        Appointment.objects.bulk_create(
+            Appointment(
+                villager=self.villager,
+                date=timezone.localdate() - timedelta(days=d % 7),
+                time=time(9, 0),
+                reason="bulk",
+            )
+            for d in range(200)
+        )
+        with self.assertNumQueries(9):
+            compute_dashboard_snapshot()
+
+    def test_snapshot_is_cached_and_invalidated_on_write(self):
+        first = get_dashboard_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_snapshot(), first)
+
+        ChatHistory.objects.create(user=self.villager, question="new", answer="a")
+        self.assertEqual(get_dashboard_snapshot()["total_chats"], 4)
+
+    def test_admin_dashboard_render(self):
+        self.client.force_login(self.admin)
+        url = reverse("custom_admin:dashboard")
+        self.client.get(url)  # warm the snapshot cache
+
+        # session + user + trend rollups + four "recent"/"upcoming" lists
+        start = time_module.perf_counter()
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+        elapsed = time_module.perf_counter() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["pending_appointments"], 2)
+        self.assertLess(elapsed, 1.0)
+
+
+class DailyRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "2"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "3", role="health_worker"
+        )
+
+    def _book(self, **kwargs):
+        defaults = {
+            "villager": self.villager,
+            "healthworker": self.worker,
+            "date": timezone.localdate(),
+            "time": time(10, 0),
+            "reason": "checkup",
+        }
+        defaults.update(kwargs)
+        return Appointment.objects.create(**defaults)
+
+    def _snapshot(self):
+        return set(
+            DailyMetric.objects.values_list("metric", "date", "dimension", "value", "count")
+        )
+
+    def _assert_matches_rebuild(self):
+        """Incrementally maintained rows must equal a from-scratch rebuild."""
+        incremental = self._snapshot()
+        call_command("backfill_rollups", stdout=StringIO())
+        self.assertEqual(incremental, self._snapshot())
+
+    def test_creates_increment_counters(self):
+        self._book(priority="critical")
+        self._book(time=time(11, 0))
+        ChatHistory.objects.create(user=self.villager, question="q", answer="a")
+
+        trends = get_trends(["appointments", "chats", "users"], 7)
+        self.assertEqual(trends["appointments"][-1]["count"], 2)
+        self.assertEqual(trends["chats"][-1]["count"], 1)
+        self.assertEqual(trends["users"][-1]["count"], 2)
+        critical = get_trends(["appointments"], 7, "priority", "critical")
+        self.assertEqual(critical["appointments"][-1]["count"], 1)
+        self._assert_matches_rebuild()
+
+    def test_edits_and_deletes_recompute_affected_days(self):
+        appointment = self._book()
+        moved = self._book(time=time(11, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = "approved"
+            appointment.save()
+            moved.date = timezone.localdate() - timedelta(days=3)
+            moved.save()
+        self._assert_matches_rebuild()
+
+        by_worker = get_trends(
+            ["appointments_scheduled"], 7, "healthworker", self.worker.pk
+        )["appointments_scheduled"]
+        self.assertEqual([d["count"] for d in by_worker], [0, 0, 0, 1, 0, 0, 1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.filter(pk=moved.pk).delete()
+        self._assert_matches_rebuild()
+
+    def test_unrelated_saves_do_not_touch_rollups(self):
+        villager = Account.objects.get(pk=self.villager.pk)
+        with self.assertNumQueries(1):
+            villager.save()  # e.g. last_login bump on every login
+
+    def test_long_ranges_read_one_row_per_day(self):
+        for offset in range(0, 365, 5):
+            self._book(date=timezone.localdate() - timedelta(days=offset))
+        rebuild_rollups(
+            "appointments_scheduled",
+            timezone.localdate() - timedelta(days=364),
+            timezone.localdate(),
+        )
+
+        with self.assertNumQueries(1):
+            trend = get_trends(["appointments_scheduled"], 365)["appointments_scheduled"]
+        self.assertEqual(len(trend), 365)
+        self.assertEqual(sum(d["count"] for d in trend), 73)
+
+
+    def test_increments_during_a_rebuild_are_kept(self):
+        from . import rollups
+
+        self._book()
+        real_count_rows = rollups._count_rows
+
+        def count_rows(metric, start, end):
+            # A booking (and its counter rows) lands after the range is cleared
+            if metric == "appointments" and not hasattr(count_rows, "booked"):
+                count_rows.booked = self._book(time=time(11, 0), priority="critical")
+            return real_count_rows(metric, start, end)
+
+        with mock.patch.object(rollups, "_count_rows", count_rows):
+            rebuild_rollups("appointments", timezone.localdate(), timezone.localdate())
+
+        trend = get_trends(["appointments"], 1)["appointments"]
+        self.assertEqual(trend[-1]["count"], 2)
+        self._assert_matches_rebuild()
+
+class _FlakyConnection:
+    """Email backend stand-in that rejects one recipient."""
+
+    def __init__(self, bad_address):
+        self.bad_address = bad_address
+        self.sent = []
+        self.is_open = False
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.bad_address in message.to:
+                raise OSError("mailbox unavailable")
+            self.sent.append(message)
+        return len(messages)
+
+
+@mock.patch("rural_health_assistant.mailer.kick")
+class EmailOutboxTests(TestCase):
+    def test_queue_email_does_not_send(self, kick):
+        with self.captureOnCommitCallbacks(execute=True):
+            mailer.queue_email("Hi", "Body", "a@example.com", html_body="<p>Body</p>")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().status, "pending")
+        kick.assert_called_once()
+
+    def test_drain_reuses_one_connection_per_batch(self, kick):
+        for i in range(5):
+            mailer.queue_email(f"Msg {i}", "Body", f"user{i}@example.com")
+        with mock.patch.object(
+            mailer, "get_connection", wraps=mailer.get_connection
+        ) as get_connection, self.settings(EMAIL_OUTBOX_BATCH_SIZE=10):
+            self.assertEqual(mailer.drain_outbox(), (5, 0))
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboundEmail.objects.exclude(status="sent").exists())
+
+    def test_failures_back_off_then_give_up(self, kick):
+        mailer.queue_email("Good", "Body", "ok@example.com")
+        bad = mailer.queue_email("Bad", "Body", "bad@example.com")
+        connection = _FlakyConnection("bad@example.com")
+        with mock.patch.object(mailer, "get_connection", return_value=connection):
+            self.assertEqual(mailer.drain_outbox(), (1, 1))
+            bad.refresh_from_db()
+            self.assertEqual((bad.status, bad.attempts), ("pending", 1))
+            self.assertGreater(bad.next_attempt_at, timezone.now())
+            self.assertIn("mailbox unavailable", bad.last_error)
+
+            # Not due yet: nothing is retried
+            self.assertEqual(mailer.drain_outbox(), (0, 0))
+
+            with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2):
+                OutboundEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+                mailer.drain_outbox()
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), ("failed", 2))
+        self.assertEqual([m.subject for m in connection.sent], ["Good"])
+
+    def test_emergency_alert_is_queued_ahead_of_routine_mail(self, kick):
+        mailer.queue_email("Routine", "Body", "user@example.com")
+        with self.settings(DEFAULT_FROM_EMAIL="admin@example.com"):
+            response = self.client.post(
+                reverse("emergency_alert"),
+                data=json.dumps({"user_name": "Ram", "user_phone": "98"}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+        with self.settings(EMAIL_OUTBOX_BATCH_SIZE=1):
+            mailer.send_batch()
+        self.assertIn("EMERGENCY ALERT", mail.outbox[0].subject)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Account.objects.create_user(
+            "Admin", "User", "admin", "admin@example.com", "pw", "1", role="admin"
+        )
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "2"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "3", role="health_worker"
+        )
+        Appointment.objects.create(
+            villager=cls.villager,
+            healthworker=cls.worker,
+            date=timezone.localdate(),
+            time=time(10, 0),
+            reason="checkup",
+        )
+        cls.today = timezone.localdate()
+        for days in (0, 1, 2):
+            chat = ChatHistory.objects.create(user=cls.villager, question=f"q{days}", answer="a")
+            ChatHistory.objects.filter(pk=chat.pk).update(
+                timestamp=timezone.now() - timedelta(days=days)
+            )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.export_root = os.path.join(tmp.name, "exports")
+        self.media_root = os.path.join(tmp.name, "media")
+        settings = override_settings(EXPORT_ROOT=self.export_root, MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _rows(self, data_type, date_from=None, date_to=None):
+        body = "".join(exports.iter_csv_rows(data_type, date_from, date_to))
+        return list(csv.reader(io.StringIO(body)))
+
+    def test_every_registered_export_runs(self):
+        for data_type, spec in exports.EXPORTS.items():
+            with self.subTest(data_type):
+                self.assertEqual(len(spec["header"]), len(spec["fields"]))
+                rows = self._rows(data_type)
+                self.assertEqual(rows[0], spec["header"])
+                self.assertTrue(all(len(row) == len(spec["header"]) for row in rows))
+
+        appointment = self._rows("appointments")[1]
+        self.assertEqual(appointment[1:3], ["Ram Thapa", "Sita Rai"])
+
+    def test_date_range_is_inclusive(self):
+        yesterday = self.today - timedelta(days=1)
+        questions = lambda rows: sorted(row[2] for row in rows[1:])  # noqa: E731
+        self.assertEqual(questions(self._rows("chats", date_from=yesterday)), ["q0", "q1"])
+        self.assertEqual(questions(self._rows("chats", date_to=yesterday)), ["q1", "q2"])
+        self.assertEqual(
+            questions(self._rows("chats", date_from=yesterday, date_to=yesterday)), ["q1"]
+        )
+        self.assertIsNone(exports.parse_date("2026-13-01"))
+        self.assertIsNone(exports.parse_date(""))
+
+    def test_background_export_is_private(self):
+        path = exports.write_export_file("users", "users_test.csv")
+        self.assertEqual(os.path.dirname(path), self.export_root)
+        self.assertFalse(os.path.exists(self.media_root))
+
+        url = reverse("custom_admin:export_download", args=["users_test.csv"])
+        self.client.force_login(self.villager)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"admin@example.com", b"".join(response.streaming_content))
+        missing = reverse("custom_admin:export_download", args=["..users.csv"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        self.assertIsNone(exports.export_path("../settings.py"))
+
+    def test_background_export_survives_a_broker_outage(self):
+        self.client.force_login(self.admin)
+        with mock.patch(
+            "rural_health_assistant.admin_views.generate_export_file.delay",
+            side_effect=ConnectionError("broker down"),
+        ), self.assertLogs("rural_health_assistant.admin_views", "ERROR"):
+            response = self.client.get(
+                reverse("custom_admin:export_data"), {"type": "chats", "background": "1"}
+            )
+        self.assertRedirects(
+            response, reverse("custom_admin:dashboard"), fetch_redirect_response=False
+        )
+        messages = [str(m) for m in response.wsgi_request._messages]
+        self.assertIn("Background exports are unavailable", messages[0])
+
+
+@mock.patch("rural_health_assistant.mailer.kick")
+class AdminAppointmentSlotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Account.objects.create_user(
+            "Admin", "User", "admin", "admin@example.com", "pw", "1", role="admin"
+        )
+        cls.villager = Account.objects.create_user(
+            "Ram", "Thapa", "ram", "ram@example.com", "pw", "2"
+        )
+        cls.worker = Account.objects.create_user(
+            "Sita", "Rai", "sita", "sita@example.com", "pw", "3", role="health_worker"
+        )
+        cls.other_worker = Account.objects.create_user(
+            "Hari", "Gurung", "hari", "hari@example.com", "pw", "4", role="health_worker"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def _book(self, healthworker, status="pending"):
+        return Appointment.objects.create(
+            villager=self.villager,
+            healthworker=healthworker,
+            date=self.day,
+            time=time(10, 0),
+            reason="checkup",
+            status=status,
+        )
+
+    def _messages(self, response):
+        return [str(m) for m in response.wsgi_request._messages]
+
+    def test_reopening_into_a_rebooked_slot_is_refused(self, kick):
+        cancelled = self._book(self.worker, status="cancelled")
+        self._book(self.worker)
+
+        response = self.client.post(
+            reverse("custom_admin:appointment_update_status", args=[cancelled.pk]),
+            {"status": "pending"},
+        )
+        self.assertRedirects(
+            response,
+            reverse("custom_admin:appointment_detail", args=[cancelled.pk]),
+            fetch_redirect_response=False,
+        )
+        self.assertIn("booked by another appointment", self._messages(response)[0])
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, "cancelled")
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_assigning_into_a_booked_slot_is_refused(self, kick):
+        appointment = self._book(self.worker)
+        self._book(self.other_worker)
+
+        url = reverse("custom_admin:appointment_assign", args=[appointment.pk])
+        response = self.client.post(url, {"health_worker": self.other_worker.pk})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertIn("already has an appointment", self._messages(response)[0])
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.healthworker, self.worker)
+
+    def test_assigning_into_a_free_slot(self, kick):
+        appointment = self._book(self.worker)
+
+        response = self.client.post(
+            reverse("custom_admin:appointment_assign", args=[appointment.pk]),
+            {"health_worker": self.other_worker.pk},
+        )
+        self.assertIn("Appointment assigned to", self._messages(response)[0])
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.healthworker, self.other_worker)
+
+
+class VectorIndexHealthTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Account.objects.create_user(
+            "Admin", "User", "admin", "admin@example.com", "pw", "1", role="admin"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse("custom_admin:vector_index_health")
+
+    def test_refresh_runs_in_the_background(self):
+        with mock.patch(
+            "rural_health_assistant.admin_views.refresh_vector_index_health.delay"
+        ) as delay:
+            self.client.post(self.url)
+            # A second click while it is queued does not queue another run
+            self.client.post(self.url)
+        delay.assert_called_once_with()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["status"]["state"], "queued")
+        self.assertContains(response, "A new report is queued")
+
+    def test_task_caches_the_report_and_its_status(self):
+        report = {"generated_at": time_module.time(), "documents": [], "disk_bytes": 0}
+        with mock.patch("rag_components.index_health.collect_report", return_value=report):
+            tasks.refresh_vector_index_health()
+        self.assertEqual(cache.get(tasks.INDEX_HEALTH_CACHE_KEY), report)
+        self.assertEqual(cache.get(tasks.INDEX_HEALTH_STATUS_KEY)["state"], "done")
+
+        with mock.patch(
+            "rag_components.index_health.collect_report", side_effect=RuntimeError("boom")
+        ), self.assertRaises(RuntimeError):
+            tasks.refresh_vector_index_health()
+        # The last good report stays on the page
+        self.assertEqual(cache.get(tasks.INDEX_HEALTH_CACHE_KEY), report)
+        response = self.client.get(self.url)
+        self.assertContains(response, "The last refresh failed")
+
+    def test_broker_outage(self):
+        with mock.patch(
+            "rural_health_assistant.admin_views.refresh_vector_index_health.delay",
+            side_effect=ConnectionError("broker down"),
+        ), self.assertLogs("rural_health_assistant.admin_views", "ERROR"):
+            response = self.client.post(self.url)
+        messages = [str(m) for m in response.wsgi_request._messages]
+        self.assertIn("Background jobs are unavailable", messages[0])
+        self.assertIsNone(cache.get(tasks.INDEX_HEALTH_STATUS_KEY))
@@ -3,12 +3,13 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from awareness.models import Awareness
 from contact.forms import ContactEnquiryForm
 from contact.utils import send_enquiry_notification_to_admin, send_confirmation_to_user
+from custom_admin.models import OutboundEmail
+from .mailer import queue_email
 import json
 from datetime import datetime
 
@@ -153,18 +154,15 @@ Emergency Contact Numbers:
 - 9807973936
         """
         
-        # Send email to admin
+        # Queue email to admin, ahead of any routine mail in the outbox
         try:
-            from django.core.mail import EmailMessage
-            
-            email = EmailMessage(
-                subject=subject,
-                body=html_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[settings.DEFAULT_FROM_EMAIL],  # Send to admin email
+            queue_email(
+                subject,
+                plain_message.strip(),
+                [settings.DEFAULT_FROM_EMAIL],  # Send to admin email
+                html_body=html_message,
+                priority=OutboundEmail.PRIORITY_URGENT,
             )
-            email.content_subtype = 'html'  # Set content type to HTML
-            email.send(fail_silently=False)
             
             return JsonResponse({
                 'success': True,
@@ -174,7 +172,7 @@ Emergency Contact Numbers:
         except Exception as e:
             return JsonResponse({
                 'success': False,
-                'message': f'Failed to send email: {str(e)}',
+                'message': f'Failed to queue email: {str(e)}',
                 'phone_number': '9839096052'
             }, status=500)
             